@@ -0,0 +1,84 @@
+"""
+TCP connections opened for the LLM calls of one paper, with one new client per call (as
+the tools used to do) and with the shared clients of `LLMClientPool`, against a local
+keep-alive stub of the chat completions endpoint.
+
+Usage:
+    python benchmarks/client_connections.py [--calls 12]
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_openai import ChatOpenAI
+
+from eunomia import LLMClientPool
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "stub answer"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubOpenAIHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=12)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    for _ in range(args.calls):
+        ChatOpenAI(
+            model_name="gpt-4", openai_api_key="sk-test", openai_api_base=base_url
+        ).invoke("prompt")
+    unpooled, StubOpenAIHandler.connections = StubOpenAIHandler.connections, 0
+
+    pool = LLMClientPool(openai_api_key="sk-test", openai_api_base=base_url)
+    for i in range(args.calls):
+        pool.get("gpt-4", temperature=0 if i % 2 else 0.1).invoke("prompt")
+    pooled = StubOpenAIHandler.connections
+    pool.close()
+    server.shutdown()
+    server.server_close()
+
+    print(f"connections per paper ({args.calls} LLM calls):")
+    print(f"one client per call: {unpooled}")
+    print(f"LLMClientPool:       {pooled}")
+
+
+if __name__ == "__main__":
+    main()
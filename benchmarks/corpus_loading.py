@@ -0,0 +1,54 @@
+"""
+Loading time of a PDF corpus with a sequential `LoadDoc` loop and with `LoadCorpus`.
+
+Usage:
+    python benchmarks/corpus_loading.py [--papers 500] [--workers 8] [--pdf tests/test_files/test_docs.pdf]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from eunomia import LoadCorpus, LoadDoc
+
+PROCESS_KWARGS = dict(chunk_size=1000, chunk_overlap=20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--papers", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--pdf",
+        default=os.path.join(os.path.dirname(__file__), "..", "tests", "test_files", "test_docs.pdf"),
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i in range(args.papers):
+            shutil.copy(args.pdf, os.path.join(tmp_dir, f"paper{i}.pdf"))
+
+        corpus = LoadCorpus(tmp_dir, max_workers=args.workers)
+        start = time.perf_counter()
+        sequential = {
+            paper_id: LoadDoc(file_name=file_name).process(**PROCESS_KWARGS)
+            for paper_id, file_name in corpus.file_names.items()
+        }
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = corpus.process(**PROCESS_KWARGS)
+        parallel_time = time.perf_counter() - start
+
+        assert parallel.keys() == sequential.keys() and not corpus.errors
+        print(f"{args.papers} papers, {args.workers} workers")
+        print(f"sequential: {sequential_time:.1f} s")
+        print(
+            f"LoadCorpus: {parallel_time:.1f} s "
+            f"({sequential_time / parallel_time:.1f}x, including worker start-up)"
+        )
+
+
+if __name__ == "__main__":
+    main()
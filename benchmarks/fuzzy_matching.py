@@ -0,0 +1,90 @@
+"""
+Time of `match_MOF_names` on synthetic 10k x 10k MOF name sets, compared with the previous
+implementation (`fuzz.token_sort_ratio` on every pair of keys). The previous
+implementation is timed on the first `--baseline` predictions and extrapolated, and its
+matches are checked to be identical. The optimal assignment mode, which only matches keys of
+the same "Paper id", is timed on the same names.
+
+Usage:
+    python benchmarks/fuzzy_matching.py [--size 10000] [--baseline 200] [--threshold 80]
+"""
+import argparse
+import random
+import time
+
+from fuzzywuzzy import fuzz
+
+from eunomia import match_MOF_names
+
+PREFIXES = ["", "Zn-", "Cu-", "Co-", "Ni-", "Mg-", "bio-", "Al-", "Fe-", "Zr-"]
+STEMS = ["MOF", "MIL", "ZIF", "HKUST", "PCN", "NU", "IRMOF", "CAU", "UiO", "DUT", "JUC", "SNU"]
+SUFFIXES = ["", "(Cr)", "(Al)", "(Fe)", "-NH2", "-OH", "b", "a", " (activated)", "-CH3"]
+
+
+def random_names(rng, n):
+    names = {}
+    while len(names) < n:
+        name = (
+            rng.choice(PREFIXES)
+            + rng.choice(STEMS)
+            + "-"
+            + str(rng.randint(1, 999))
+            + rng.choice(SUFFIXES)
+        )
+        names[name] = {"Paper id": str(rng.randint(1, 2000))}
+    return names
+
+
+def baseline_match(prediction_dict, ground_truth_dict, threshold):
+    matched_pairs = []
+    matched_ground_truth_keys = set()
+    for key_1 in prediction_dict:
+        matched_key, highest_similarity = None, 0
+        for key_2 in ground_truth_dict:
+            if key_2 in matched_ground_truth_keys:
+                continue
+            similarity = fuzz.token_sort_ratio(key_1, key_2)
+            if similarity > threshold and similarity > highest_similarity:
+                matched_key, highest_similarity = key_2, similarity
+        if matched_key is not None:
+            matched_pairs.append((key_1, matched_key))
+            matched_ground_truth_keys.add(matched_key)
+    return matched_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--baseline", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=80)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prediction_dict = random_names(rng, args.size)
+    ground_truth_dict = random_names(rng, args.size)
+
+    start = time.perf_counter()
+    _, matched_pairs, _ = match_MOF_names(prediction_dict, ground_truth_dict, args.threshold)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, optimal_pairs, _ = match_MOF_names(
+        prediction_dict, ground_truth_dict, args.threshold, method="optimal"
+    )
+    optimal = time.perf_counter() - start
+
+    head = dict(list(prediction_dict.items())[: args.baseline])
+    start = time.perf_counter()
+    expected = baseline_match(head, ground_truth_dict, args.threshold)
+    baseline = (time.perf_counter() - start) * args.size / len(head)
+    assert matched_pairs[: len(expected)] == expected
+
+    print(f"{args.size} x {args.size} names, threshold {args.threshold}")
+    print(f"{len(matched_pairs)} matches, the first {len(head)} checked against the baseline")
+    print(f"baseline: {baseline:.1f} s (extrapolated from {len(head)} predictions)")
+    print(f"indexed: {indexed:.1f} s ({baseline / indexed:.0f}x)")
+    print(f"optimal, per paper: {optimal:.1f} s, {len(optimal_pairs)} matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Peak memory of `LoadDoc` in eager and lazy mode on a synthetic 10k-page text file.
+
+Usage:
+    python benchmarks/lazy_loading.py [--pages 10000] [--chunk-size 1000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from eunomia import LoadDoc
+
+PARAGRAPH = (
+    "The metal-organic framework MOF-{i} retained its crystallinity after immersion "
+    "in water for 7 days, as confirmed by PXRD and N2 sorption measurements.\n\n"
+)
+
+
+def write_corpus(path, n_pages):
+    with open(path, "w") as f:
+        for i in range(n_pages):
+            f.write(PARAGRAPH.format(i=i) * 15)
+
+
+def measure(file_name, lazy, chunk_size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    doc = LoadDoc(file_name=file_name, lazy=lazy)
+    if lazy:
+        n_chunks = sum(1 for _ in doc.lazy_process(chunk_size=chunk_size))
+    else:
+        n_chunks = len(doc.process(chunk_size=chunk_size))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n_chunks, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "corpus.txt")
+        write_corpus(file_name, args.pages)
+        size = os.path.getsize(file_name)
+        print(f"{args.pages} pages, {size / 2**20:.1f} MiB")
+        for lazy in (False, True):
+            n_chunks, elapsed, peak = measure(file_name, lazy, args.chunk_size)
+            print(
+                f"{'lazy' if lazy else 'eager':>5}: {n_chunks} chunks in {elapsed:.1f} s, "
+                f"peak memory {peak / 2**20:.2f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Tiers of `parse_answer` that parse a corpus of recorded LLM answers, and the rate of
+answers that still need the output fixing LLM. The fallback LLM is replaced by a stub, so
+no request is sent.
+
+Usage:
+    python benchmarks/parse_tiers.py [--answers tests/test_files/recorded_answers.json]
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+from langchain_community.llms.fake import FakeListLLM
+
+from eunomia import PARSE_TIERS, parse_answer
+
+
+class StubClientPool:
+    def get(self, *args, **kwargs):
+        return FakeListLLM(responses=['{"MOFs": []}'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--answers",
+        default=os.path.join(
+            os.path.dirname(__file__), "..", "tests", "test_files", "recorded_answers.json"
+        ),
+    )
+    args = parser.parse_args()
+
+    with open(args.answers) as f:
+        recorded = json.load(f)
+    tiers = Counter()
+    start = time.perf_counter()
+    for record in recorded:
+        _, tier = parse_answer(
+            record["answer"],
+            "recorded",
+            client_pool=StubClientPool(),
+            mof_name=record.get("mof_name"),
+        )
+        tiers[tier] += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(recorded)} recorded answers parsed in {elapsed:.2f} s")
+    for tier in PARSE_TIERS:
+        print(f"{tier:>6}: {tiers[tier]} ({tiers[tier] / len(recorded):.0%})")
+    print(f"LLM fallback rate: {tiers['llm'] / len(recorded):.0%}")
+
+
+if __name__ == "__main__":
+    main()
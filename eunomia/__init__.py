@@ -5,8 +5,16 @@ __email__ = "mehrad.ans@gmail.com"
 __version__ = "1.1.0"
 
 from .agents import *
+from .batch import *
+from .cache import *
+from .callbacks import *
+from .clients import *
+from .docs_utils.dedup import *
 from .docs_utils.docs import *
+from .docs_utils.jats import *
 from .eunomia import *
 from .general import *
+from .memory import *
 from .parser import *
+from .retry import *
 from .tools import *
@@ -1,10 +1,19 @@
+import json
+import warnings
+
 import langchain
 from langchain.agents import initialize_agent
 from llama_index.core import ListIndex
-from langchain.memory import ConversationBufferMemory
 from langchain.callbacks import get_openai_callback
 from langchain.agents import AgentType
-from langchain_openai import ChatOpenAI
+
+from .cache import get_llm_cache
+from .callbacks import count_llm_calls
+from .clients import get_default_client_pool
+from .eunomia import get_model_name
+from .memory import build_memory
+from .parser import PARSE_TIERS, IncrementalMOFParser
+from .tools import EunomiaTools
 
 
 class Eunomia:
@@ -15,25 +24,65 @@ class Eunomia:
         temp=0.1,
         get_cost=False,
         agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        cache=None,
+        client_pool=None,
+        memory="window",
+        memory_max_tokens=2000,
         **kwargs,
     ):
         self.get_cost = get_cost
+        # Persistent LLM response cache, see `get_llm_cache`
+        self.llm_cache = get_llm_cache(cache)
+        # Shared LLM clients with keep-alive connections, injected into the tools along
+        # with the cache
+        self.client_pool = client_pool or get_default_client_pool()
+        for tool in tools:
+            owner = getattr(tool.func, "__self__", None)
+            if isinstance(owner, EunomiaTools):
+                if owner.client_pool is None:
+                    owner.client_pool = self.client_pool
+                if owner.llm_cache is None:
+                    owner.llm_cache = self.llm_cache
         if type(model) == str:
             if model.startswith("gpt-3.5-turbo") or model.startswith("gpt-4"):
-                self.llm = ChatOpenAI(
+                self.llm = self.client_pool.get(
+                    model,
                     temperature=temp,
-                    model_name=model,
                     request_timeout=1000,
                     max_tokens=2000,
+                    max_retries=2,
+                    cache=self.llm_cache,
                 )
 
          
         else: 
             self.llm = model
+            if self.llm_cache is not None:
+                self.llm.cache = self.llm_cache
+        # `LLMCache` only caches calls up to its `max_temperature`, 0 by default, so the
+        # agent's own calls at the default temperature of 0.1 are not cached
+        temperature = temp if type(model) == str else getattr(self.llm, "temperature", None)
+        max_temperature = getattr(self.llm_cache, "max_temperature", None)
+        if (
+            max_temperature is not None
+            and temperature is not None
+            and temperature > max_temperature
+        ):
+            warnings.warn(
+                f"The agent's LLM temperature {temperature} is above the max_temperature "
+                f"{max_temperature} of the LLM cache, so only the tools' calls are cached. "
+                "Use temp=0 to cache the agent's calls too."
+            )
+        # Conversation memory bounded to `memory_max_tokens`, see `build_memory`
+        self.memory = build_memory(
+            memory,
+            max_tokens=memory_max_tokens,
+            llm=self.llm,
+            model_name=get_model_name(self.llm),
+        )
         # Initialize agent
-        memory = ConversationBufferMemory(memory_key="chat_history")
         self.agent_chain = initialize_agent(
-                tools, self.llm, agent=agent_type, verbose=True, memory=memory, **kwargs
+                tools, self.llm, agent=agent_type, verbose=True, memory=self.memory, **kwargs
             )
 
     def run(self, prompt):
@@ -42,3 +91,215 @@ class Eunomia:
         if self.get_cost:
             print(cb)
         return result
+
+
+class EunomiaPipeline:
+    """
+    Fixed-graph alternative to the `Eunomia` agent.
+
+    The agent spends LLM calls deciding which tool to use next, although the workflow is
+    always the same. The pipeline runs the stages directly: `read_doc`, parsing of the
+    answer, `eval_justification` for all the MOFs, in batches that fit the context window,
+    `recheck_justification` for the MOFs with a weak prediction, in batches that share
+    their chunks, and `create_dataset`. Only the content calls go to the LLM.
+
+    Attributes:
+    tools : EunomiaTools
+        The tools of the paper.
+    recheck_threshold : float
+        MOFs with a score below this value, or without a stability, are rechecked.
+    dataset_path : str
+        Path of the csv dataset. If None, no dataset is written.
+    call_counts : dict
+        Number of LLM calls of each stage in the last run.
+    parse_tiers : dict
+        Number of answers parsed by each tier of `parse_answer` in the last run.
+    records : dict
+        MOF names and their details after the last run, as returned by `parse_to_dict`.
+    recheck_info : dict
+        Vectorstore queries and LLM calls of the batched recheck of the last run, see
+        `EunomiaTools.recheck_justifications`. Empty if no MOF was rechecked in batch.
+    """
+
+    stages = (
+        "read_doc",
+        "parse",
+        "eval_justification",
+        "recheck_justification",
+        "create_dataset",
+    )
+
+    def __init__(
+        self,
+        tools,
+        recheck_threshold=0.5,
+        dataset_path="dataset.csv",
+        get_cost=False,
+    ):
+        self.tools = tools
+        self.recheck_threshold = recheck_threshold
+        self.dataset_path = dataset_path
+        self.get_cost = get_cost
+        self.call_counts = {}
+        self.parse_tiers = {}
+        self.records = {}
+        self.recheck_info = {}
+
+    def _stage(self, stage, counter, func, *args):
+        before = counter.calls
+        try:
+            return func(*args)
+        finally:
+            self.call_counts[stage] += counter.calls - before
+
+    def _parse(self, answer, mof_name=None):
+        parsed, tier = self.tools.get_parser().parse(
+            answer, self.tools.paper_id, mof_name=mof_name
+        )
+        self.parse_tiers[tier] += 1
+        return parsed
+
+    def _update(self, counter, records, checked, answer):
+        """Update the checked MOF records with the parsed answer of a justification check."""
+        mof_name = checked[0]["name"] if len(checked) == 1 else None
+        parsed = self._stage("parse", counter, self._parse, answer, mof_name)
+        for name, verdict in EunomiaTools.match_verdicts(checked, parsed).items():
+            records[name].update(verdict)
+
+    def _is_weak(self, record):
+        return (
+            str(record["Predicted Stability"]).lower() == "not provided"
+            or record["Score"] < self.recheck_threshold
+        )
+
+    @staticmethod
+    def _justification(name, record):
+        return {
+            "name": name,
+            "stability": record["Predicted Stability"],
+            "score": record["Score"],
+            "justification": record["Justification"],
+        }
+
+    def _eval(self, counter, records, names):
+        """Check the justifications of MOFs in as few `eval_justification` calls as possible."""
+        justifications = [self._justification(name, records[name]) for name in names]
+        for checked in self.tools.batch_justifications(justifications):
+            evaluation = self._stage(
+                "eval_justification",
+                counter,
+                self.tools.eval_justification_batch,
+                checked,
+            )
+            self._update(counter, records, checked, evaluation)
+
+    def _recheck(self, counter, name, record):
+        if self._is_weak(record):
+            recheck = self._stage(
+                "recheck_justification",
+                counter,
+                self.tools.recheck_justification,
+                name,
+            )
+            if recheck is not None:
+                self._update(counter, {name: record}, [{"name": name}], recheck)
+
+    def _recheck_all(self, counter, records):
+        """Recheck the weak MOF records together, stuffing their shared chunks once."""
+        weak = [name for name, record in records.items() if self._is_weak(record)]
+        if not weak:
+            return
+        rechecks, self.recheck_info = self._stage(
+            "recheck_justification",
+            counter,
+            lambda: self.tools.recheck_justifications(weak, return_info=True),
+        )
+        for names, recheck in rechecks:
+            if recheck is not None:
+                self._update(counter, records, [{"name": name} for name in names], recheck)
+
+    def _stream_records(self, counter, prompt):
+        """Yield the MOF records of the streamed `read_doc` answer as soon as they are complete."""
+        chunks = self.tools.read_doc_stream(prompt)
+        answer_parser = IncrementalMOFParser(
+            self.tools.paper_id,
+            parser=self.tools.get_parser(),
+        )
+        while True:
+            chunk = self._stage("read_doc", counter, next, chunks, None)
+            if chunk is None:
+                break
+            yield from answer_parser.feed(chunk)
+        if not answer_parser.text:
+            raise RuntimeError("read_doc did not return an answer.")
+        yield from self._stage("parse", counter, answer_parser.close)
+        tier = answer_parser.tier
+        self.parse_tiers[tier] = self.parse_tiers.get(tier, 0) + 1
+
+    def run(self, prompt, stream=False):
+        """
+        Run the extraction pipeline for a prompt.
+
+        Parameters:
+        - prompt (str): The input given to `read_doc`, as for the agent.
+        - stream (bool): If True, the answer of `read_doc` is streamed, and the justification
+                         of each MOF is checked as soon as its record is complete, while the
+                         LLM is still generating the rest of the answer. The streamed answer
+                         is not cached, unlike the other stages. Defaults to False.
+
+        Returns:
+        - str: The final answer, a JSON string of the MOFs in the format parsed by `parse_to_dict`.
+        """
+        self.call_counts = {stage: 0 for stage in self.stages}
+        self.parse_tiers = {tier: 0 for tier in PARSE_TIERS}
+        self.recheck_info = {}
+        with count_llm_calls() as counter, get_openai_callback() as cb:
+            if stream:
+                records = {}
+                for name, record in self._stream_records(counter, prompt):
+                    records[name] = record
+                    self._eval(counter, records, [name])
+                    self._recheck(counter, name, record)
+            else:
+                answer = self._stage("read_doc", counter, self.tools.read_doc, prompt)
+                if answer is None:
+                    raise RuntimeError("read_doc did not return an answer.")
+                records = self._stage("parse", counter, self._parse, answer)
+
+                self._eval(counter, records, list(records))
+
+                self._recheck_all(counter, records)
+
+            if self.dataset_path is not None:
+                self._stage(
+                    "create_dataset",
+                    counter,
+                    EunomiaTools.write_dataset,
+                    records,
+                    self.dataset_path,
+                )
+        if self.get_cost:
+            print(cb)
+            print(f"LLM calls per stage: {self.call_counts}")
+            print(f"Answers parsed per tier: {self.parse_tiers}")
+            if self.recheck_info:
+                print(
+                    f"Recheck: {self.recheck_info['vectorstore_queries']} vectorstore queries, "
+                    f"{self.recheck_info['llm_calls']} LLM calls in "
+                    f"{len(self.recheck_info['batches'])} batches"
+                )
+        self.records = records
+        return json.dumps(
+            {
+                "MOFs": [
+                    {
+                        "name": name,
+                        "stability": record["Predicted Stability"],
+                        "score": record["Score"],
+                        "justification": record["Justification"],
+                        "DOI": record["DOI"],
+                    }
+                    for name, record in records.items()
+                ]
+            }
+        )
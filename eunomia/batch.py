@@ -0,0 +1,188 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .clients import get_default_client_pool
+from .docs_utils.docs import _get_process_pool, _process_file, build_vectorstore
+from .eunomia import RetrievalQABypassTokenLimit
+from .parser import parse_to_dict
+from .prompts import WATER_STABILITY_PROMPT
+from .retry import TokenBucket
+
+
+def extract_paper(
+    paper_id,
+    vectorstore,
+    llm=None,
+    prompt=WATER_STABILITY_PROMPT,
+    k=9,
+    min_k=2,
+    rate_limiter=None,
+    cache=None,
+):
+    """
+    Extract the water stability of the MOFs in one paper, as `read_doc` followed by `parse_to_dict`.
+
+    Parameters:
+    - paper_id (str/int): The ID of the paper.
+    - vectorstore (FAISS): The vectorstore of the paper.
+    - llm (object): The language model object. Defaults to GPT-4 at temperature 0 from the
+                    process-wide client pool.
+    - prompt (str): The extraction prompt. Defaults to `WATER_STABILITY_PROMPT`.
+    - k (int): The initial number of documents to retrieve. Defaults to 9.
+    - min_k (int): The minimum number of documents to retrieve. Defaults to 2.
+    - rate_limiter (TokenBucket): Rate limiter shared with the other papers. Defaults to None.
+    - cache (BaseCache): LLM response cache. Defaults to None.
+
+    Returns:
+    - dict: The output of `parse_to_dict` for the answer.
+    """
+    if llm is None:
+        llm = get_default_client_pool().get("gpt-4", temperature=0, cache=cache)
+    answer = RetrievalQABypassTokenLimit(
+        prompt,
+        vectorstore,
+        k=k,
+        min_k=min_k,
+        llm=llm,
+        search_type="mmr",
+        fetch_k=50,
+        chain_type="stuff",
+        rate_limiter=rate_limiter,
+    )
+    if answer is None:
+        raise RuntimeError(f"No answer could be obtained for paper {paper_id}.")
+    return parse_to_dict(answer, paper_id, cache=cache)
+
+
+def _paper_ids(items):
+    """
+    Identify papers by their file name without extension, or by their path without extension
+    when several files have the same name, as `LoadCorpus` does, and other items by their
+    position in the list.
+    """
+    stems = [
+        os.path.splitext(os.path.basename(item))[0]
+        if isinstance(item, (str, os.PathLike))
+        else None
+        for item in items
+    ]
+    paper_ids = []
+    for index, (stem, item) in enumerate(zip(stems, items)):
+        if stem is None:
+            paper_ids.append(index)
+        elif stems.count(stem) == 1:
+            paper_ids.append(stem)
+        else:
+            paper_ids.append(os.path.splitext(os.fspath(item))[0])
+    duplicates = sorted({str(p) for p in paper_ids if paper_ids.count(p) > 1})
+    if duplicates:
+        raise ValueError(f"Papers given more than once: {', '.join(duplicates)}.")
+    return paper_ids
+
+
+async def arun_batch(
+    papers,
+    pipeline=None,
+    max_concurrency=4,
+    load_workers=None,
+    load_kwargs=None,
+    process_kwargs=None,
+    index_kwargs=None,
+    max_pending=None,
+):
+    """
+    Run an extraction pipeline over many papers with bounded parallelism.
+
+    Files are loaded and chunked with `LoadDoc` in a process pool, chunks are indexed with
+    `build_vectorstore` in a thread pool, and at most `max_concurrency` papers are in the
+    pipeline (i.e. waiting on the LLM) at the same time. Loading of the next papers overlaps
+    with the LLM calls of the current ones, but at most `max_pending` papers are loaded ahead,
+    so memory does not grow with the number of papers. A failing paper is recorded and does
+    not stop the batch.
+
+    Parameters:
+    - papers (dict or list): Papers to process, either as a dictionary of paper IDs to items or as a
+                             list of items. An item is a vectorstore, a list of document chunks, or a
+                             path to a file supported by `LoadDoc`. Papers in a list are identified by
+                             their file name without extension (their path without extension if
+                             several files have the same name), or by their position in the list.
+                             A ValueError is raised if a file is given twice.
+    - pipeline (callable): A function or coroutine function called as `pipeline(paper_id, vectorstore)`.
+                           Synchronous functions run in a thread pool. Defaults to `extract_paper` with a
+                           rate limiter shared by all papers.
+    - max_concurrency (int): The maximum number of papers in the pipeline at the same time. Defaults to 4.
+    - load_workers (int): The number of processes used to load files. Defaults to the number of CPUs.
+    - load_kwargs (dict): Keyword arguments passed to `LoadDoc`.
+    - process_kwargs (dict): Keyword arguments passed to `LoadDoc.process`.
+    - index_kwargs (dict): Keyword arguments passed to `build_vectorstore`.
+    - max_pending (int): The maximum number of papers being loaded, indexed or in the pipeline at the
+                         same time. Defaults to `2 * max_concurrency`.
+
+    Returns:
+    - tuple: A tuple containing two elements:
+        - A dictionary of paper IDs to pipeline results.
+        - A dictionary of paper IDs to the exception raised while processing the paper.
+    """
+    if pipeline is None:
+        pipeline = partial(extract_paper, rate_limiter=TokenBucket())
+    if not isinstance(papers, dict):
+        papers = list(papers)
+        papers = dict(zip(_paper_ids(papers), papers))
+    load_kwargs = load_kwargs or {}
+    process_kwargs = process_kwargs or {}
+    index_kwargs = index_kwargs or {}
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending = asyncio.Semaphore(max_pending or 2 * max_concurrency)
+    results, failures = {}, {}
+    needs_loading = any(isinstance(item, (str, os.PathLike)) for item in papers.values())
+    load_pool = _get_process_pool(load_workers) if needs_loading else None
+    index_pool = ThreadPoolExecutor(max_concurrency)
+    pipeline_pool = ThreadPoolExecutor(max_concurrency)
+
+    async def run_one(paper_id, item):
+        try:
+            async with pending:
+                if isinstance(item, (str, os.PathLike)):
+                    item = await loop.run_in_executor(
+                        load_pool, _process_file, os.fspath(item), load_kwargs, process_kwargs
+                    )
+                if isinstance(item, list):
+                    item = await loop.run_in_executor(
+                        index_pool, partial(build_vectorstore, item, **index_kwargs)
+                    )
+                async with semaphore:
+                    if asyncio.iscoroutinefunction(pipeline):
+                        results[paper_id] = await pipeline(paper_id, item)
+                    else:
+                        results[paper_id] = await loop.run_in_executor(
+                            pipeline_pool, pipeline, paper_id, item
+                        )
+        except Exception as e:
+            print(f"\nPaper {paper_id} failed: {e}\n")
+            failures[paper_id] = e
+
+    try:
+        await asyncio.gather(*(run_one(pid, item) for pid, item in papers.items()))
+    finally:
+        index_pool.shutdown()
+        pipeline_pool.shutdown()
+        if load_pool is not None:
+            load_pool.shutdown()
+    return results, failures
+
+
+def run_batch(papers, pipeline=None, max_concurrency=4, **kwargs):
+    """
+    Synchronous version of `arun_batch`. Use `await arun_batch(...)` instead inside a running
+    event loop, e.g. in a Jupyter notebook.
+
+    Returns:
+    - tuple: A dictionary of paper IDs to results, and a dictionary of paper IDs to exceptions.
+    """
+    return asyncio.run(
+        arun_batch(papers, pipeline=pipeline, max_concurrency=max_concurrency, **kwargs)
+    )
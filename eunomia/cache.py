@@ -0,0 +1,444 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+import zlib
+
+from langchain_core.caches import BaseCache
+
+DEFAULT_CACHE_DIR = ".eunomia_cache"
+
+# Constructor arguments of a chat model that do not change its answer and therefore
+# must not be part of the cache key.
+_VOLATILE_PARAMS = {
+    "cache",
+    "callbacks",
+    "verbose",
+    "openai_api_key",
+    "openai_api_base",
+    "openai_organization",
+    "openai_proxy",
+    "request_timeout",
+    "max_retries",
+    "http_client",
+    "http_async_client",
+    "streaming",
+}
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _parse_llm_string(llm_string):
+    """
+    Extract the model name, the temperature and the remaining answer-relevant
+    parameters from the `llm_string` LangChain passes to caches.
+    """
+    head, _, call_params = llm_string.partition("---")
+    try:
+        params = json.loads(head)["kwargs"]
+    except (ValueError, KeyError, TypeError):
+        # Not a serialized model: strip object addresses, which change between runs
+        return None, None, re.sub(r" at 0x[0-9a-f]+", "", llm_string)
+    params = {k: v for k, v in params.items() if k not in _VOLATILE_PARAMS}
+    model = params.get("model_name") or params.get("model")
+    temperature = params.get("temperature")
+    return model, temperature, json.dumps(params, sort_keys=True) + call_params
+
+
+class LLMCache(BaseCache):
+    """
+    Persistent, content-addressed SQLite cache of LLM responses.
+
+    Entries are keyed by the model name, the temperature, the remaining generation
+    parameters and the hash of the full prompt, which includes the retrieved context
+    stuffed into it. The cache can be shared by every LLM client through their `cache`
+    argument, and by several processes through the same database file.
+
+    Attributes:
+    path : str
+        Path of the SQLite database.
+    max_size_bytes : int
+        Least recently used entries are evicted when the cached responses exceed this
+        size. None disables size-based eviction.
+    max_age : float
+        Entries older than `max_age` seconds are treated as misses and evicted. None
+        disables age-based eviction.
+    max_temperature : float
+        Only calls with a temperature up to this value are cached, since sampling at a
+        higher temperature is expected to give a different answer every time.
+    hits : int
+        Number of lookups served from the cache.
+    misses : int
+        Number of lookups not found in the cache.
+    """
+
+    def __init__(
+        self,
+        path=os.path.join(DEFAULT_CACHE_DIR, "llm_cache.sqlite"),
+        max_size_bytes=None,
+        max_age=None,
+        max_temperature=0.0,
+    ):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.max_age = max_age
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    temperature REAL,
+                    prompt_hash TEXT,
+                    value BLOB,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+            )
+
+    def __repr__(self):
+        # LangChain puts the repr of the cache in the model's `llm_string`; keep it stable
+        return f"LLMCache(path={self.path!r})"
+
+    def _key(self, prompt, llm_string):
+        model, temperature, params = _parse_llm_string(llm_string)
+        cacheable = temperature is None or temperature <= self.max_temperature
+        prompt_hash = _sha256(prompt)
+        key = _sha256(f"{model}\n{temperature}\n{params}\n{prompt_hash}")
+        return key, model, temperature, prompt_hash, cacheable
+
+    def lookup(self, prompt, llm_string):
+        """Look up the cached generations for a prompt, or return None."""
+        from langchain_core.load import loads
+
+        key, _, _, _, cacheable = self._key(prompt, llm_string)
+        if not cacheable:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (
+                self.max_age is not None and now - row[1] > self.max_age
+            ):
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def update(self, prompt, llm_string, return_val):
+        """Store the generations of a prompt and evict entries over the size or age limits."""
+        from langchain_core.load import dumps
+
+        key, model, temperature, prompt_hash, cacheable = self._key(prompt, llm_string)
+        if not cacheable:
+            return
+        value = zlib.compress(dumps(return_val).encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, temperature, prompt_hash, value, len(value), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.max_age is not None:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,)
+            )
+        if self.max_size_bytes is not None:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at"
+            )
+            evicted = []
+            for key, size in rows:
+                if total <= self.max_size_bytes:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def clear(self, **kwargs):
+        """Remove every entry from the cache."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self):
+        """
+        Return the hit/miss statistics of this cache object and the size of the database.
+
+        Returns:
+        dict
+            The number of hits and misses, the hit rate, and the number and total size in
+            bytes of the stored entries.
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+
+class DocumentCache:
+    """
+    Persistent, content-addressed SQLite cache of processed document chunks.
+
+    Entries are keyed by the SHA-256 hash of the file content and the loading and processing
+    parameters, so a renamed or copied file hits the same entry and an edited file misses.
+    Chunks are stored as zlib-compressed JSON. The cache can be shared by several processes
+    through the same database file, and is pickled as its path and limits.
+
+    Attributes:
+    path : str
+        Path of the SQLite database.
+    max_size_bytes : int
+        Least recently used entries are evicted when the cached chunks exceed this size.
+        None disables eviction.
+    hits : int
+        Number of lookups served from the cache.
+    misses : int
+        Number of lookups not found in the cache.
+    """
+
+    # Bump when the processing of documents changes, to invalidate the existing entries
+    version = 1
+
+    def __init__(
+        self,
+        path=os.path.join(DEFAULT_CACHE_DIR, "document_cache.sqlite"),
+        max_size_bytes=None,
+    ):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS document_cache (
+                    key TEXT PRIMARY KEY,
+                    file_hash TEXT,
+                    source TEXT,
+                    value BLOB,
+                    size INTEGER,
+                    created_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS document_cache_accessed "
+                "ON document_cache (accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS document_cache_file ON document_cache (file_hash)"
+            )
+
+    def __repr__(self):
+        return f"DocumentCache(path={self.path!r})"
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self.max_size_bytes))
+
+    @staticmethod
+    def file_hash(file_name):
+        """Return the SHA-256 hash of the content of a file."""
+        digest = hashlib.sha256()
+        with open(file_name, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _key(self, file_hash, params):
+        params = json.dumps(params, sort_keys=True, default=repr)
+        return _sha256(f"{self.version}\n{file_hash}\n{params}")
+
+    def lookup(self, file_name, params, file_hash=None):
+        """
+        Look up the chunks of a file processed with the given parameters, or return None.
+
+        Parameters:
+        file_name : str
+            Path of the file. The "source" metadata of the chunks is set to this path.
+        params : dict
+            Loading and processing parameters of the chunks.
+        file_hash : str
+            Hash of the file content, if already computed.
+
+        Returns:
+        list
+            The cached `Document` chunks, or None.
+        """
+        from langchain_core.documents import Document
+
+        key = self._key(file_hash or self.file_hash(file_name), params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, source FROM document_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE document_cache SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self.hits += 1
+        documents = []
+        for page_content, metadata in json.loads(zlib.decompress(row[0])):
+            if metadata.get("source") == row[1]:
+                metadata["source"] = file_name
+            documents.append(Document(page_content=page_content, metadata=metadata))
+        return documents
+
+    def update(self, file_name, params, documents, file_hash=None):
+        """Store the chunks of a file and evict entries over the size limit."""
+        file_hash = file_hash or self.file_hash(file_name)
+        value = zlib.compress(
+            json.dumps(
+                [[d.page_content, d.metadata] for d in documents],
+                separators=(",", ":"),
+                default=repr,
+            ).encode("utf-8")
+        )
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO document_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(file_hash, params), file_hash, file_name, value, len(value), now, now),
+            )
+            if self.max_size_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM document_cache"
+                ).fetchone()[0]
+                rows = self._conn.execute(
+                    "SELECT key, size FROM document_cache ORDER BY accessed_at"
+                )
+                evicted = []
+                for key, size in rows:
+                    if total <= self.max_size_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM document_cache WHERE key = ?", evicted)
+
+    def invalidate(self, file_name=None):
+        """
+        Remove the entries of a file, whatever their parameters, or every entry if no file
+        is given.
+        """
+        with self._lock, self._conn:
+            if file_name is None:
+                self._conn.execute("DELETE FROM document_cache")
+            else:
+                self._conn.execute(
+                    "DELETE FROM document_cache WHERE file_hash = ? OR source = ?",
+                    (self.file_hash(file_name) if os.path.exists(file_name) else None, file_name),
+                )
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        self.invalidate()
+
+    def stats(self):
+        """
+        Return the hit/miss statistics of this cache object and the size of the database.
+
+        Returns:
+        dict
+            The number of hits and misses, the hit rate, and the number and total size in
+            bytes of the stored entries.
+        """
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM document_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+
+def get_document_cache(cache):
+    """
+    Resolve the `cache` switch of `LoadDoc` into a `DocumentCache`.
+
+    Parameters:
+    - cache (bool, str or DocumentCache): True for a cache in the default location, a path for a
+                                          cache at that path, or a cache object. None or False
+                                          disable the cache.
+
+    Returns:
+    - DocumentCache: The cache object, or None.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return DocumentCache()
+    if isinstance(cache, (str, os.PathLike)):
+        return DocumentCache(path=os.fspath(cache))
+    return cache
+
+
+def get_llm_cache(cache):
+    """
+    Resolve the `cache` switch of `Eunomia` and `EunomiaTools` into a cache object.
+
+    Parameters:
+    - cache (bool, str or BaseCache): True for an `LLMCache` in the default location, a path
+                                      for an `LLMCache` at that path, or a LangChain cache object.
+                                      None or False disable the Eunomia cache.
+
+    Returns:
+    - BaseCache: The cache object, or None.
+    """
+    if cache is None or cache is False:
+        return None
+    if cache is True:
+        return LLMCache()
+    if isinstance(cache, (str, os.PathLike)):
+        return LLMCache(path=os.fspath(cache))
+    return cache
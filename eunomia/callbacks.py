@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Callback handler that counts the LLM and chat model calls made in its context."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+
+_llm_call_counter_var = ContextVar("eunomia_llm_call_counter", default=None)
+register_configure_hook(_llm_call_counter_var, True)
+
+
+@contextmanager
+def count_llm_calls():
+    """
+    Count the LLM calls made inside the context, like LangChain's `get_openai_callback`.
+
+    Example:
+        >>> with count_llm_calls() as counter:
+        ...     tools.read_doc(prompt)
+        >>> counter.calls
+    """
+    counter = LLMCallCounter()
+    token = _llm_call_counter_var.set(counter)
+    try:
+        yield counter
+    finally:
+        _llm_call_counter_var.reset(token)
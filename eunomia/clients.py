@@ -0,0 +1,137 @@
+import threading
+import weakref
+
+
+class LLMClientPool:
+    """
+    Registry of shared chat model clients keyed by their configuration.
+
+    Every model name gets one keep-alive HTTP connection pool, shared by all the clients
+    of that model whatever their temperature or cache, so the connections are reused by
+    every LLM call of an agent run instead of being set up again for each tool call. The
+    size of the connection pool bounds the number of concurrent requests per model.
+
+    Clients configured with objects, e.g. an `LLMCache`, are keyed by the identity of the
+    objects and are only kept while they are in use, so the pool does not keep the objects
+    alive.
+
+    Attributes:
+    max_concurrency : int or dict
+        Maximum number of concurrent requests (connections) per model, or a dictionary of
+        model names to limits. Models missing from the dictionary use `default_concurrency`.
+    default_concurrency : int
+        Concurrency limit of models without an explicit limit.
+    keepalive_expiry : float
+        Seconds an idle connection is kept open.
+    client_kwargs : dict
+        Keyword arguments passed to every `ChatOpenAI` client, e.g. `openai_api_base`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=None,
+        default_concurrency=10,
+        keepalive_expiry=60.0,
+        **client_kwargs,
+    ):
+        self.max_concurrency = max_concurrency
+        self.default_concurrency = default_concurrency
+        self.keepalive_expiry = keepalive_expiry
+        self.client_kwargs = client_kwargs
+        self._http_clients = {}
+        self._llms = {}
+        self._object_llms = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def get_concurrency(self, model_name):
+        """Return the maximum number of concurrent requests for a model."""
+        if isinstance(self.max_concurrency, dict):
+            return self.max_concurrency.get(model_name, self.default_concurrency)
+        return self.max_concurrency or self.default_concurrency
+
+    def _get_http_client(self, model_name, request_timeout):
+        import httpx
+
+        if model_name not in self._http_clients:
+            concurrency = self.get_concurrency(model_name)
+            self._http_clients[model_name] = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=concurrency,
+                    max_keepalive_connections=concurrency,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                # Requests wait for a free connection instead of failing
+                timeout=httpx.Timeout(request_timeout, pool=None),
+            )
+        return self._http_clients[model_name]
+
+    def get(self, model_name="gpt-4", temperature=0, request_timeout=1000, **kwargs):
+        """
+        Return the shared client for a model configuration, creating it on first use.
+
+        Parameters:
+        - model_name (str): Name of the OpenAI chat model. Defaults to "gpt-4".
+        - temperature (float): Sampling temperature. Defaults to 0.
+        - request_timeout (float): Timeout of a request in seconds. Defaults to 1000.
+        - kwargs: Other keyword arguments of `ChatOpenAI`, e.g. `max_tokens` or `cache`.
+
+        Returns:
+        - ChatOpenAI: The chat model client.
+        """
+        from langchain_openai import ChatOpenAI
+
+        values = {name: value for name, value in kwargs.items() if _is_value(value)}
+        # A registered client holds references to its objects, so their ids are not reused
+        # while it is registered
+        objects = {name: id(value) for name, value in kwargs.items() if name not in values}
+        key = (
+            model_name,
+            temperature,
+            request_timeout,
+            repr(sorted(values.items())),
+            tuple(sorted(objects.items())),
+        )
+        llms = self._object_llms if objects else self._llms
+        with self._lock:
+            llm = llms.get(key)
+            if llm is None:
+                params = {"max_retries": 0, **self.client_kwargs, **kwargs}
+                llm = llms[key] = ChatOpenAI(
+                    model_name=model_name,
+                    temperature=temperature,
+                    request_timeout=request_timeout,
+                    http_client=self._get_http_client(model_name, request_timeout),
+                    **params,
+                )
+            return llm
+
+    def close(self):
+        """Close all the HTTP connections of the pool."""
+        with self._lock:
+            for http_client in self._http_clients.values():
+                http_client.close()
+            self._http_clients.clear()
+            self._llms.clear()
+            self._object_llms.clear()
+
+
+def _is_value(value):
+    """Return whether a client keyword argument is compared by value rather than identity."""
+    if isinstance(value, (list, tuple)):
+        return all(_is_value(item) for item in value)
+    if isinstance(value, dict):
+        return all(_is_value(item) for item in value.values())
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+_default_client_pool = None
+_default_client_pool_lock = threading.Lock()
+
+
+def get_default_client_pool():
+    """Return the process-wide `LLMClientPool` used when no pool is provided."""
+    global _default_client_pool
+    with _default_client_pool_lock:
+        if _default_client_pool is None:
+            _default_client_pool = LLMClientPool()
+        return _default_client_pool
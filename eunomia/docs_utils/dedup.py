@@ -0,0 +1,150 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from ..eunomia import count_document_tokens
+
+# Mersenne-like prime above 2**32, so that (a * x + b) mod p with a, b < 2**31 and 32-bit
+# shingle hashes x fits in 64-bit integers
+_PRIME = np.uint64(4294967311)
+
+
+def _shingles(text: str, shingle_size: int) -> set:
+    """Returns the CRC32 hashes of the word `shingle_size`-grams of a normalized text."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= shingle_size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {
+        zlib.crc32(" ".join(words[i : i + shingle_size]).encode("utf-8"))
+        for i in range(len(words) - shingle_size + 1)
+    }
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Chooses the number of bands and rows per band of the LSH index so that the similarity
+    at which two documents become candidates, (1 / bands) ** (1 / rows), is closest to
+    and below the threshold.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        candidate_threshold = (1 / bands) ** (1 / rows)
+        # Prefer false positives, which are checked, over missed duplicates
+        error = threshold - candidate_threshold
+        if error >= 0 and (best is None or error < best[0]):
+            best = (error, bands, rows)
+    return (best[1], best[2]) if best else (num_perm, 1)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        # The earliest document is the root of its cluster
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def deduplicate_documents(
+    documents: List[Document],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    model_name: str = "gpt-4",
+    seed: int = 1,
+) -> Tuple[List[Document], Dict]:
+    """
+    Removes near-duplicate chunks, e.g. an abstract repeated in the conclusions or a figure
+    caption repeated in the text, before they are embedded.
+
+    Chunks are shingled into word n-grams and indexed with MinHash signatures in a
+    locality-sensitive hashing index, so only chunks sharing a band of their signature are
+    compared. Candidate pairs with a Jaccard similarity of their shingles of at least
+    `threshold` are merged into clusters, and the first chunk of each cluster is kept. The
+    metadata of the removed chunks are stored in the "duplicates" metadata of the kept one.
+
+    Parameters:
+    documents : List[Document]
+        Document chunks, e.g. the output of `LoadDoc.process`.
+    threshold : float
+        Jaccard similarity above which two chunks are duplicates. Defaults to 0.8.
+    num_perm : int
+        Number of MinHash permutations. Defaults to 128.
+    shingle_size : int
+        Number of words of a shingle. Defaults to 5.
+    model_name : str
+        Name of the model whose encoding counts the removed tokens.
+    seed : int
+        Seed of the MinHash permutations.
+
+    Returns:
+    Tuple[List[Document], Dict]
+        The deduplicated chunks, in their original order, and a report with the number of
+        chunks, of removed chunks and of removed tokens.
+    """
+    n = len(documents)
+    shingles = [_shingles(d.page_content, shingle_size) for d in documents]
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2**31, size=(num_perm, 1)).astype(np.uint64)
+    b = rng.randint(0, 2**31, size=(num_perm, 1)).astype(np.uint64)
+    bands, rows = _lsh_params(threshold, num_perm)
+
+    buckets = defaultdict(list)
+    for i, doc_shingles in enumerate(shingles):
+        x = np.fromiter(doc_shingles, dtype=np.uint64, count=len(doc_shingles))
+        signature = ((a * x + b) % _PRIME).min(axis=1)
+        for band in range(bands):
+            key = (band, signature[band * rows : (band + 1) * rows].tobytes())
+            buckets[key].append(i)
+
+    clusters = _UnionFind(n)
+    checked = set()
+    for members in buckets.values():
+        for k, j in enumerate(members):
+            for i in members[:k]:
+                if (i, j) in checked or clusters.find(i) == clusters.find(j):
+                    continue
+                checked.add((i, j))
+                union = len(shingles[i] | shingles[j])
+                if union and len(shingles[i] & shingles[j]) / union >= threshold:
+                    clusters.union(i, j)
+
+    duplicates = defaultdict(list)
+    for i in range(n):
+        root = clusters.find(i)
+        if root != i:
+            duplicates[root].append(i)
+    kept, removed_tokens = [], 0
+    for i, document in enumerate(documents):
+        if clusters.find(i) != i:
+            removed_tokens += count_document_tokens(document, model_name)
+            continue
+        if i in duplicates:
+            metadata = dict(document.metadata)
+            metadata["duplicates"] = metadata.get("duplicates", []) + [
+                documents[j].metadata for j in duplicates[i]
+            ]
+            document = Document(page_content=document.page_content, metadata=metadata)
+        kept.append(document)
+    report = {
+        "chunks": n,
+        "kept_chunks": len(kept),
+        "removed_chunks": n - len(kept),
+        "removed_tokens": removed_tokens,
+    }
+    return kept, report
@@ -1,6 +1,369 @@
+import glob
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from langchain.schema import Document
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from copy import deepcopy
+from itertools import islice
+
+from functools import lru_cache
+
+from langchain.text_splitter import TextSplitter
+
+from ..cache import DEFAULT_CACHE_DIR, get_document_cache
+from ..eunomia import _get_encoding
+from .dedup import deduplicate_documents
+
+SUPPORTED_EXTENSIONS = ("pdf", "txt", "md", "csv", "xml")
+
+
+class TiktokenTextSplitter(TextSplitter):
+    """
+    Splits text into chunks of `chunk_size` tiktoken tokens of a model, and records the
+    number of tokens of every chunk and the name of the encoding in the chunk metadata
+    ("tokens" and "tokenizer"), so the context of a prompt can be budgeted without counting
+    the tokens again.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int = 0, model_name: str = "gpt-4"):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.model_name = model_name
+        self._encoding = _get_encoding(model_name)
+
+    def _encode(self, text: str) -> List[int]:
+        return self._encoding.encode(text, disallowed_special=())
+
+    def _starts_character(self, token_id: int) -> bool:
+        # UTF-8 continuation bytes are 0b10xxxxxx
+        return self._encoding.decode_single_token_bytes(token_id)[0] & 0xC0 != 0x80
+
+    def _boundary(self, token_ids: List[int], i: int, lowest: int) -> int:
+        """
+        Moves a window edge back to the first token of a character, so that multi-byte
+        characters such as subscripts or Greek letters are not split between windows.
+        """
+        while lowest < i < len(token_ids) and not self._starts_character(token_ids[i]):
+            i -= 1
+        return i
+
+    def _create_chunks(self, token_ids: List[int], metadata: dict) -> Iterator[Document]:
+        start = 0
+        while start < len(token_ids):
+            end = self._boundary(token_ids, start + self._chunk_size, start + 1)
+            window = token_ids[start:end]
+            # Encoding the chunk again can merge a token at its edges, so the window length
+            # is an upper bound of its token count, exact in practice
+            yield Document(
+                page_content=self._encoding.decode(window),
+                metadata={**metadata, "tokens": len(window), "tokenizer": self._encoding.name},
+            )
+            if end >= len(token_ids):
+                break
+            next_start = max(end - self._chunk_overlap, start + 1)
+            start = self._boundary(token_ids, next_start, start + 1)
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk.page_content for chunk in self._create_chunks(self._encode(text), {})]
+
+    def create_documents(
+        self, texts: List[str], metadatas: Optional[List[dict]] = None
+    ) -> List[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        return [
+            chunk
+            for text, metadata in zip(texts, metadatas)
+            for chunk in self._create_chunks(self._encode(text), metadata)
+        ]
+
+
+def _create_text_splitter(
+    chunking_type: str, chunk_size: int, chunk_overlap: Optional[int], **kwargs
+):
+    if chunking_type == "fixed-size":
+        from langchain.text_splitter import (
+            CharacterTextSplitter,
+        )
+
+        return CharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs
+        )
+    if chunking_type == "latex":
+        from langchain.text_splitter import LatexTextSplitter
+
+        return LatexTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs
+        )
+    if chunking_type == "NLTK":
+        from langchain.text_splitter import NLTKTextSplitter
+
+        return NLTKTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs
+        )
+    if chunking_type == "spacy":
+        from langchain.text_splitter import SpacyTextSplitter
+
+        return SpacyTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs
+        )
+    if chunking_type == "tokens":
+        return TiktokenTextSplitter(chunk_size, chunk_overlap or 0, **kwargs)
+    raise ValueError(f"Unknown chunking type {chunking_type!r}.")
+
+
+_text_splitters = {}
+_text_splitters_lock = threading.Lock()
+
+
+def get_text_splitter(
+    chunking_type: str = "fixed-size",
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = 0,
+    **kwargs,
+):
+    """
+    Returns the text splitter of a chunking type from a process-wide registry, creating it
+    on first use. The spaCy and NLTK models are therefore loaded once per process instead
+    of at every `LoadDoc.process` call.
+
+    Parameters:
+    chunking_type : str
+        One of "fixed-size", "latex", "NLTK", "spacy" and "tokens".
+    chunk_size : Optional[int]
+        The size of the chunks, in characters or, for "tokens", in tokens. If None, no
+        splitter is returned.
+    chunk_overlap : Optional[int]
+        The size of the overlap between chunks.
+    **kwargs are passed to the text splitter class, e.g. `pipeline="sentencizer"` for spaCy
+    or `model_name="gpt-4"` for tokens.
+
+    Returns:
+    TextSplitter
+        The shared text splitter, or None.
+    """
+    if chunk_size is None:
+        return None
+    key = (chunking_type, chunk_size, chunk_overlap, tuple(sorted(kwargs.items())))
+    with _text_splitters_lock:
+        if key not in _text_splitters:
+            _text_splitters[key] = _create_text_splitter(
+                chunking_type, chunk_size, chunk_overlap, **kwargs
+            )
+        return _text_splitters[key]
+
+
+def split_documents(
+    text_splitter, documents: Iterable[Document], batch_size: int = 32
+) -> Iterator[Document]:
+    """
+    Splits documents into chunks as they are consumed. With a spaCy splitter, the sentences
+    of `batch_size` documents at a time are segmented in one `nlp.pipe` call, and with a
+    `TiktokenTextSplitter` they are encoded in one multithreaded `encode_batch` call.
+
+    Parameters:
+    text_splitter : TextSplitter
+        The text splitter, e.g. from `get_text_splitter`.
+    documents : Iterable[Document]
+        The documents to split.
+    batch_size : int
+        Number of documents in a spaCy batch.
+
+    Returns:
+    Iterator[Document]
+        The document chunks, with the same content and metadata as
+        `text_splitter.split_documents(documents)`.
+    """
+    from langchain.text_splitter import SpacyTextSplitter
+
+    if isinstance(text_splitter, TiktokenTextSplitter):
+        num_threads = os.cpu_count() or 1
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return
+            texts = [document.page_content for document in batch]
+            if num_threads > 1:
+                token_ids = text_splitter._encoding.encode_batch(
+                    texts, num_threads=num_threads, disallowed_special=()
+                )
+            else:
+                token_ids = map(text_splitter._encode, texts)
+            for document, ids in zip(batch, token_ids):
+                yield from text_splitter._create_chunks(ids, document.metadata)
+    if not isinstance(text_splitter, SpacyTextSplitter) or text_splitter._add_start_index:
+        for document in documents:
+            yield from text_splitter.split_documents([document])
+        return
+    parsed = text_splitter._tokenizer.pipe(
+        ((document.page_content, document) for document in documents),
+        as_tuples=True,
+        batch_size=batch_size,
+    )
+    for doc, document in parsed:
+        splits = (sentence.text for sentence in doc.sents)
+        for chunk in text_splitter._merge_splits(splits, text_splitter._separator):
+            yield Document(page_content=chunk, metadata=deepcopy(document.metadata))
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """
+    Returns a regular expression matching any of the words, factored as a trie so that the
+    regex engine tests the characters shared by several words only once.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(c) + build(child) for c, child in sorted(node.items()) if c]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive matcher of a set of keywords, compiled into a single regular
+    expression so that a text is lowercased and scanned once whatever the number of keywords.
+
+    Attributes:
+    keywords : List[str]
+        The keywords to find.
+    occurrence : str
+        "first" to cut documents at the first keyword found, or "last" to cut them at the
+        last one, e.g. the last "References" heading of an article that cites references
+        in its introduction.
+    heading : bool
+        If True, keywords only match as a heading, i.e. alone on their line, optionally
+        with a section number before and a colon after them.
+    """
+
+    def __init__(self, keywords: Iterable[str], occurrence: str = "first", heading: bool = False):
+        if occurrence not in ("first", "last"):
+            raise ValueError("'occurrence' must be 'first' or 'last'.")
+        self.keywords = list(keywords)
+        self.occurrence = occurrence
+        self.heading = heading
+        self.pattern = None
+        if self.keywords:
+            pattern = _trie_regex(k.lower() for k in self.keywords)
+            if heading:
+                pattern = rf"^[ \t]*(?:\d+(?:\.\d+)*\.?[ \t]+)?(?:{pattern})[ \t]*:?[ \t]*$"
+            self.pattern = re.compile(pattern, re.MULTILINE)
+            # Matched against the original text when lowercasing changes its length, which
+            # is slower but keeps the indices right
+            self._ignorecase_pattern = re.compile(pattern, re.MULTILINE | re.IGNORECASE)
+
+    def __repr__(self):
+        # Part of the `DocumentCache` key, keep it stable
+        return (
+            f"KeywordMatcher(keywords={self.keywords!r}, occurrence={self.occurrence!r}, "
+            f"heading={self.heading!r})"
+        )
+
+    def search(self, text: str) -> Optional[int]:
+        """
+        Returns the index of the first (or last) keyword in a text, or None if there is none.
+        """
+        if self.pattern is None:
+            return None
+        pattern, lower_text = self.pattern, text.lower()
+        if len(lower_text) != len(text):
+            pattern, lower_text = self._ignorecase_pattern, text
+        match = pattern.search(lower_text)
+        if match is None or self.occurrence == "first":
+            return match and match.start()
+        index = match.start()
+        while True:
+            match = pattern.search(lower_text, index + 1)
+            if match is None:
+                return index
+            index = match.start()
+
+
+@lru_cache(maxsize=128)
+def _get_keyword_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def get_keyword_matcher(keywords: Union[Iterable[str], KeywordMatcher]) -> KeywordMatcher:
+    """Returns `keywords` if it is a `KeywordMatcher`, or the compiled matcher of a list of keywords."""
+    if isinstance(keywords, KeywordMatcher):
+        return keywords
+    return _get_keyword_matcher(tuple(keywords))
+
+
+def _filter_pages(pages: Iterable[Document], matcher: KeywordMatcher) -> Iterator[Document]:
+    """
+    Yields the pages up to the one with the first (or last) keyword, cut before the keyword.
+    Only the cut page is copied. Pages are consumed lazily and, for the first occurrence,
+    no page after the match is read.
+    """
+    held, held_index, pending = None, None, []
+    for page in pages:
+        index = matcher.search(page.page_content)
+        if index is None:
+            if held is None:
+                yield page
+            else:
+                pending.append(page)
+            continue
+        if matcher.occurrence == "first":
+            held, held_index = page, index
+            break
+        # A later keyword was found, the previous match and the pages after it are kept
+        if held is not None:
+            yield held
+            yield from pending
+        held, held_index, pending = page, index, []
+    if held is not None:
+        yield Document(
+            page_content=held.page_content[:held_index].strip(),
+            metadata=deepcopy(held.metadata),
+        )
+
+
+def _lazy_load_pdf(file_name: str) -> Iterator[Document]:
+    """
+    Yields the pages of a PDF one at a time, with the same content and metadata as
+    `PyPDFLoader`, which extracts the text of all the pages before returning any.
+    """
+    import pypdf
+
+    with open(file_name, "rb") as pdf_file:
+        pdf_reader = pypdf.PdfReader(pdf_file)
+        for page_number, page in enumerate(pdf_reader.pages):
+            yield Document(
+                page_content=page.extract_text(),
+                metadata={"source": file_name, "page": page_number},
+            )
+
+
+def _lazy_load_text(file_name: str, page_size: int = 4000) -> Iterator[Document]:
+    """
+    Yields a text file in pages of about `page_size` characters, cut at line ends,
+    without reading the whole file in memory like `TextLoader` does.
+    """
+    with open(file_name) as text_file:
+        lines, size = [], 0
+        for line in text_file:
+            lines.append(line)
+            size += len(line)
+            if size >= page_size:
+                yield Document(page_content="".join(lines), metadata={"source": file_name})
+                lines, size = [], 0
+        if lines:
+            yield Document(page_content="".join(lines), metadata={"source": file_name})
 
 
 class LoadDoc:
@@ -13,19 +376,37 @@ class LoadDoc:
     paper_path : str
         Path of the paper to be loaded.
     loader : PyPDFLoader
-        Instance of PyPDFLoader to load the document.
+        Instance of PyPDFLoader to load the document, created on first use.
     pages : list
-        Pages of the loaded document.
+        Pages of the loaded document, or None in lazy mode.
+    lazy : bool
+        Whether the pages are read from the file only when they are processed.
+    cache : DocumentCache
+        Cache of the processed chunks, or None.
     """
 
-    def __init__(self, file_name: str = None, text_input: str = None, **kwargs):
+    def __init__(
+        self,
+        file_name: str = None,
+        text_input: str = None,
+        lazy: bool = False,
+        cache=None,
+        **kwargs,
+    ):
         """
         Parameters:
         file_name : str
             Path to file.
         text_input : str
             Direct text input.
-        **kwargs are passed to the CSVLoader class.
+        lazy : bool
+            If True, the file is not loaded here. Its pages are read one at a time by
+            `iter_pages`, so `lazy_process` streams the chunks with a peak memory that
+            depends on the page and chunk sizes instead of the document size.
+        cache : bool, str or DocumentCache
+            Cache of the processed chunks, see `get_document_cache`. With a cache, the file
+            is only loaded by `process` when its chunks are not in the cache.
+        **kwargs are passed to the CSVLoader or JATSLoader class.
         """
         if file_name is None and text_input is None:
             raise ValueError("Either 'file_name' or 'text_input' must be provided.")
@@ -38,27 +419,51 @@ class LoadDoc:
             extension = file_name.split(".")[-1].lower()
             self._check_extension(extension)
             self.doc_path = file_name
+            self.lazy = lazy
+            self.cache = get_document_cache(cache)
+            self._loader = None
+            self._loader_kwargs = kwargs
+            self.dedup_report = None
+            if lazy or self.cache is not None:
+                self.pages = None
+            else:
+                self.pages = self.loader.load_and_split()
+        else:
+            self.lazy = False
+            self.cache = None
+            self.dedup_report = None
+            self.pages = [
+                Document(page_content=text_input, metadata={"source": "local"})
+            ]
+
+    @property
+    def loader(self):
+        if self._loader is None:
             if self.type == "pdf":
                 from langchain.document_loaders import PyPDFLoader
 
-                self.loader = PyPDFLoader(file_name)
+                self._loader = PyPDFLoader(self.doc_path)
             if self.type == "md":
                 from langchain.document_loaders import UnstructuredMarkdownLoader
 
-                self.loader = UnstructuredMarkdownLoader(file_name)
+                self._loader = UnstructuredMarkdownLoader(self.doc_path)
             if self.type == "csv":
                 from langchain.document_loaders.csv_loader import CSVLoader
 
-                self.loader = CSVLoader(file_name, **kwargs)
+                self._loader = CSVLoader(self.doc_path, **self._loader_kwargs)
             if self.type == "txt":
                 from langchain.document_loaders import TextLoader
 
-                self.loader = TextLoader(file_name)
-            self.pages = self.loader.load_and_split()
-        else:
-            self.pages = [
-                Document(page_content=text_input, metadata={"source": "local"})
-            ]
+                self._loader = TextLoader(self.doc_path)
+            if self.type == "xml":
+                from .jats import JATSLoader
+
+                jats_kwargs = ("page_size", "drop_tags", "drop_sec_types")
+                self._loader = JATSLoader(
+                    self.doc_path,
+                    **{k: v for k, v in self._loader_kwargs.items() if k in jats_kwargs},
+                )
+        return self._loader
 
     def _check_extension(self, extension: str):
         """
@@ -71,63 +476,81 @@ class LoadDoc:
         Raises:
         Exception:
             If the file extension is not supported.
-        NotImplementedError:
-            If the file extension is 'xml', which is not yet implemented.
         """
-        supported_extensions = {"pdf", "txt", "md", "csv"}
+        supported_extensions = set(SUPPORTED_EXTENSIONS)
         if extension in supported_extensions:
             self.type = extension
-        elif extension == "xml":
-            raise NotImplementedError
         else:
             raise Exception(f"Eunomia supports {supported_extensions} doc files.")
 
+    def iter_pages(self) -> Iterator[Document]:
+        """
+        Iterates over the pages of the document. In lazy mode the file is read again at every
+        call, one page at a time, and the pages are split like `load_and_split` does.
+
+        Returns:
+        Iterator[Document]
+            The pages of the document.
+        """
+        if self.pages is None and not self.lazy:
+            self.pages = self.loader.load_and_split()
+        if self.pages is not None:
+            yield from self.pages
+            return
+
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        if self.type == "pdf":
+            pages = _lazy_load_pdf(self.doc_path)
+        elif self.type == "txt":
+            pages = _lazy_load_text(self.doc_path)
+        else:
+            pages = self.loader.lazy_load()
+        text_splitter = RecursiveCharacterTextSplitter()
+        for page in pages:
+            yield from text_splitter.split_documents([page])
+
     @staticmethod
-    def cut_text(text: str, keywords: List[str]) -> str:
+    def cut_text(text: str, keywords: Union[List[str], KeywordMatcher]) -> str:
         """
         Cuts the given text up to the first found keyword.
 
         Parameters:
         text : str
             The text to be cut.
-        keywords : List[str]
-            List of keywords to find in the text.
+        keywords : Union[List[str], KeywordMatcher]
+            List of keywords to find in the text, or a matcher with its own cut rule.
 
         Returns:
         str
             The cut text.
         """
-        lower_text = text.lower()
-        indices = [
-            lower_text.find(keyword)
-            for keyword in keywords
-            if lower_text.find(keyword) != -1
-        ]
-        min_index = min(indices)
-        return text[:min_index].strip()  # remove any trailing spaces
+        index = get_keyword_matcher(keywords).search(text)
+        if index is None:
+            raise ValueError("None of the keywords was found in the text.")
+        return text[:index].strip()  # remove any trailing spaces
 
     @staticmethod
-    def find_in_document(document: Document, search_strings: List[str]) -> bool:
+    def find_in_document(
+        document: Document, search_strings: Union[List[str], KeywordMatcher]
+    ) -> bool:
         """
         Searches for the given strings in the document content.
 
         Parameters:
         document : Document
             Document in which to search.
-        search_strings : List[str]
-            List of strings to search for.
+        search_strings : Union[List[str], KeywordMatcher]
+            List of strings to search for, or a matcher.
 
         Returns:
         bool
             True if any of the search strings are found, False otherwise.
         """
-        return any(
-            search_string.lower() in document.page_content.lower()
-            for search_string in search_strings
-        )
+        return get_keyword_matcher(search_strings).search(document.page_content) is not None
 
     def filter_documents(
-        self, documents: List[Document], search_strings: List[str]
+        self, documents: List[Document], search_strings: Union[List[str], KeywordMatcher]
     ) -> List[Document]:
         """
         Filters documents based on the presence of search strings.
@@ -137,79 +560,371 @@ class LoadDoc:
         Parameters:
         documents : List[Document]
             List of documents to filter.
-        search_strings : List[str]
-            List of strings to search for.
+        search_strings : Union[List[str], KeywordMatcher]
+            List of strings to search for, or a matcher, e.g.
+            `KeywordMatcher(["references"], occurrence="last", heading=True)` to cut at the
+            last "References" heading.
 
         Returns:
         List[Document]
-            List of filtered documents.
-        """
-        filtered_documents = deepcopy(documents)  # Create a deep copy of documents
-        for i, doc in enumerate(filtered_documents):
-            if self.find_in_document(doc, search_strings):
-                filtered_documents[i].page_content = self.cut_text(
-                    filtered_documents[i].page_content,
-                    keywords=search_strings,
-                )
-                filtered_documents = filtered_documents[: i + 1]
-                break
-        return filtered_documents
+            List of filtered documents. The documents before the cut are not copied.
+        """
+        return list(_filter_pages(documents, get_keyword_matcher(search_strings)))
 
     def process(
         self,
-        filter_words: List[str] = [],
+        filter_words: Union[List[str], KeywordMatcher] = [],
         chunk_size: Optional[int] = None,
         chunk_overlap: Optional[int] = 0,
         chunking_type="fixed-size",
+        model_name: str = "gpt-4",
+        dedup_threshold: Optional[float] = None,
     ) -> List[Document]:
         """
         Process the document pages based on the search strings. Additionally, this function
         will split the document into chunks if a chunk size is provided.
 
         Parameters:
-        filter_words : List[str]
-            List of words to search and filter.
+        filter_words : Union[List[str], KeywordMatcher]
+            List of words to search and filter, or a matcher with its own cut rule. The
+            document is cut before the first word found.
         chunk_size : Optional[int]
             The size of the chunks in which the document will be split. If this parameter
             is not provided, the document will not be split into chunks.
         chunk_overlap : Optional[int]
             The size of the overlap between chunks. If chunk_size is not provided, this
             parameter will not be used.
+        chunking_type : str
+            One of "fixed-size", "latex", "NLTK", "spacy" (sizes in characters) and
+            "tokens" (sizes in tokens of `model_name`, with the number of tokens of each
+            chunk in its "tokens" metadata).
+        model_name : str
+            Name of the model whose tiktoken encoding is used by the "tokens" chunking type.
+        dedup_threshold : Optional[float]
+            If provided, near-duplicate chunks with a similarity of at least this threshold
+            are removed with `deduplicate_documents`, and the report of the removed chunks
+            and tokens is stored in `dedup_report`.
 
         Returns:
         List[Document]
             List of processed document chunks.
         """
-        sliced_pages = self.filter_documents(self.pages, filter_words)
-        text_splitter = None
-        if chunk_size is not None:
-            if chunking_type == "fixed-size":
-                from langchain.text_splitter import (
-                    CharacterTextSplitter,
-                )
+        documents = self._cached_process(
+            filter_words, chunk_size, chunk_overlap, chunking_type, model_name
+        )
+        if dedup_threshold is not None:
+            documents, self.dedup_report = deduplicate_documents(
+                documents, threshold=dedup_threshold, model_name=model_name
+            )
+        return documents
 
-                text_splitter = CharacterTextSplitter(
-                    chunk_size=chunk_size, chunk_overlap=chunk_overlap
-                )
-            if chunking_type == "latex":
-                from langchain.text_splitter import LatexTextSplitter
+    def _cached_process(
+        self, filter_words, chunk_size, chunk_overlap, chunking_type, model_name
+    ):
+        process_args = (filter_words, chunk_size, chunk_overlap, chunking_type, model_name)
+        if self.cache is None:
+            return self._process(*process_args)
+        params = {
+            "type": self.type,
+            "lazy": self.lazy,
+            "loader_kwargs": self._loader_kwargs,
+            "filter_words": filter_words,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "chunking_type": chunking_type,
+        }
+        if chunking_type == "tokens":
+            params["model_name"] = model_name
+        file_hash = self.cache.file_hash(self.doc_path)
+        documents = self.cache.lookup(self.doc_path, params, file_hash=file_hash)
+        if documents is None:
+            documents = self._process(*process_args)
+            self.cache.update(self.doc_path, params, documents, file_hash=file_hash)
+        return documents
 
-                text_splitter = LatexTextSplitter(
-                    chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    def _process(self, filter_words, chunk_size, chunk_overlap, chunking_type, model_name):
+        if self.lazy:
+            return list(
+                self.lazy_process(
+                    filter_words, chunk_size, chunk_overlap, chunking_type, model_name
                 )
-            if chunking_type == "NLTK":
-                from langchain.text_splitter import NLTKTextSplitter
+            )
+        if self.pages is None:
+            self.pages = self.loader.load_and_split()
+        sliced_pages = self.filter_documents(self.pages, filter_words)
+        text_splitter = self._get_text_splitter(
+            chunking_type, chunk_size, chunk_overlap, model_name
+        )
+        if text_splitter is not None:
+            sliced_pages = list(split_documents(text_splitter, sliced_pages))
 
-                text_splitter = NLTKTextSplitter(
-                    chunk_size=chunk_size, chunk_overlap=chunk_overlap
-                )
-            if chunking_type == "spacy":
-                from langchain.text_splitter import SpacyTextSplitter
+        return sliced_pages
+
+    def lazy_process(
+        self,
+        filter_words: Union[List[str], KeywordMatcher] = [],
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = 0,
+        chunking_type="fixed-size",
+        model_name: str = "gpt-4",
+    ) -> Iterator[Document]:
+        """
+        Streaming version of `process`: pages are filtered and chunked as they are read, and
+        reading stops at the first page containing one of the filter words. With a "last"
+        occurrence matcher, the pages after a match are held until the next match.
+
+        Returns:
+        Iterator[Document]
+            The processed document chunks.
+        """
+        text_splitter = self._get_text_splitter(
+            chunking_type, chunk_size, chunk_overlap, model_name
+        )
+        pages = _filter_pages(self.iter_pages(), get_keyword_matcher(filter_words))
+        if text_splitter is None:
+            yield from pages
+        else:
+            yield from split_documents(text_splitter, pages)
+
+    @staticmethod
+    def _get_text_splitter(chunking_type, chunk_size, chunk_overlap, model_name):
+        if chunking_type == "tokens":
+            return get_text_splitter(
+                chunking_type, chunk_size, chunk_overlap, model_name=model_name
+            )
+        return get_text_splitter(chunking_type, chunk_size, chunk_overlap)
+
+
+def _process_file(file_name: str, load_kwargs: dict, process_kwargs: dict) -> List[Document]:
+    """Loads and processes a single file with `LoadDoc`. Runs in a worker process."""
+    return LoadDoc(file_name=file_name, **load_kwargs).process(**process_kwargs)
+
+
+def _get_process_pool(max_workers: Optional[int] = None, start_method: str = "spawn"):
+    """
+    Creates the process pool used to load documents. Workers are spawned by default, as
+    forking a process that runs other threads (e.g. HTTP clients or thread pools) can
+    deadlock the child.
+    """
+    import multiprocessing
 
-                text_splitter = SpacyTextSplitter(
-                    chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    return ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context(start_method)
+    )
+
+
+class LoadCorpus:
+    """
+    A class to load and process many documents in parallel with `LoadDoc`.
+
+    PDF text extraction and chunking are CPU-bound, so the files are processed in a pool
+    of worker processes and the chunks of every paper are returned as soon as they are
+    ready. A file that fails to load is recorded in `errors` and does not stop the others.
+
+    Attributes:
+    file_names : dict
+        Paths of the files to load, by paper ID. The paper ID is the file name without
+        extension, or the path without extension when file names collide.
+    errors : dict
+        Exceptions raised while loading the files, by paper ID.
+    max_workers : int
+        Number of worker processes.
+    load_kwargs : dict
+        Keyword arguments passed to `LoadDoc`.
+    """
+
+    def __init__(
+        self,
+        paths: Union[str, List[str]],
+        max_workers: Optional[int] = None,
+        start_method: str = "spawn",
+        **kwargs,
+    ):
+        """
+        Parameters:
+        paths : Union[str, List[str]]
+            A directory, a glob pattern (e.g. "papers/**/*.pdf"), a file, or a list of them.
+            Directories are searched recursively for pdf, txt, md and csv files.
+        max_workers : Optional[int]
+            Number of worker processes. Defaults to the number of CPUs.
+        start_method : str
+            Start method of the worker processes. Defaults to "spawn".
+        **kwargs are passed to the LoadDoc class.
+        """
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        file_names = []
+        for path in map(os.fspath, paths):
+            if os.path.isdir(path):
+                file_names.extend(
+                    file_name
+                    for extension in SUPPORTED_EXTENSIONS
+                    for file_name in glob.glob(
+                        os.path.join(path, "**", f"*.{extension}"), recursive=True
+                    )
                 )
+            elif glob.has_magic(path):
+                file_names.extend(glob.glob(path, recursive=True))
+            else:
+                file_names.append(path)
+        file_names = sorted(set(file_names))
+        stems = [os.path.splitext(os.path.basename(f))[0] for f in file_names]
+        self.file_names = {
+            stem if stems.count(stem) == 1 else os.path.splitext(file_name)[0]: file_name
+            for stem, file_name in zip(stems, file_names)
+        }
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.load_kwargs = kwargs
+        self.errors = {}
 
-            sliced_pages = text_splitter.split_documents(sliced_pages)
+    def iter_process(self, **kwargs) -> Iterator[Tuple[str, List[Document]]]:
+        """
+        Loads and processes the files in parallel, yielding the results in completion order.
 
-        return sliced_pages
+        Parameters:
+        **kwargs are passed to `LoadDoc.process`.
+
+        Returns:
+        Iterator[Tuple[str, List[Document]]]
+            Pairs of paper ID and processed document chunks.
+        """
+        self.errors = {}
+        executor = _get_process_pool(self.max_workers, self.start_method)
+        try:
+            futures = {
+                executor.submit(_process_file, file_name, self.load_kwargs, kwargs): paper_id
+                for paper_id, file_name in self.file_names.items()
+            }
+            for future in as_completed(futures):
+                paper_id = futures[future]
+                try:
+                    chunks = future.result()
+                except Exception as e:
+                    print(f"\nFailed to load {self.file_names[paper_id]}: {e}\n")
+                    self.errors[paper_id] = e
+                    continue
+                yield paper_id, chunks
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def process(self, **kwargs) -> Dict[str, List[Document]]:
+        """
+        Loads and processes all the files in parallel.
+
+        Parameters:
+        **kwargs are passed to `LoadDoc.process`.
+
+        Returns:
+        Dict[str, List[Document]]
+            Processed document chunks by paper ID, in the order of `file_names`. Failed
+            files are missing and their exceptions are in `errors`.
+        """
+        results = dict(self.iter_process(**kwargs))
+        return {
+            paper_id: results[paper_id]
+            for paper_id in self.file_names
+            if paper_id in results
+        }
+
+
+def build_vectorstore(
+    documents: List[Document],
+    embedding=None,
+    model_name: Optional[str] = None,
+    cache_dir: Optional[str] = os.path.join(DEFAULT_CACHE_DIR, "embeddings"),
+    index_path: Optional[str] = None,
+    batch_size: Optional[int] = 1000,
+):
+    """
+    Builds a FAISS vectorstore from document chunks, e.g. the output of `LoadDoc.process`,
+    reusing the embeddings of chunks that were embedded before.
+
+    Embeddings are cached on disk under the hash of the chunk text, namespaced by the
+    embedding class and model name. Only chunks missing from the cache are sent to the embedding
+    model, in batches of `batch_size`, so re-indexing a mostly unchanged corpus costs
+    almost nothing.
+
+    Parameters:
+    documents : List[Document]
+        Document chunks to index.
+    embedding : Embeddings
+        Embedding model. Defaults to `OpenAIEmbeddings(model=model_name)`.
+    model_name : Optional[str]
+        Name of the embedding model, used when `embedding` is not provided (defaults to
+        "text-embedding-ada-002" then) and in the cache namespace when `embedding` has no
+        `model` or `model_name` attribute. A ValueError is raised if the embeddings are
+        cached and the model name is unknown.
+    cache_dir : Optional[str]
+        Directory of the embedding cache. If None, the embeddings are not cached.
+    index_path : Optional[str]
+        If provided, the FAISS index is saved to this directory.
+    batch_size : Optional[int]
+        Number of new chunks embedded between cache updates.
+
+    Returns:
+    FAISS
+        The vectorstore of the documents.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    if embedding is None:
+        from langchain_openai import OpenAIEmbeddings
+
+        embedding = OpenAIEmbeddings(model=model_name or "text-embedding-ada-002")
+    if cache_dir is not None:
+        from langchain.embeddings import CacheBackedEmbeddings
+        from langchain.storage import LocalFileStore
+
+        embedding_model = (
+            getattr(embedding, "model", None)
+            or getattr(embedding, "model_name", None)
+            or model_name
+        )
+        if not embedding_model:
+            raise ValueError(
+                f"Cannot tell the model of {type(embedding).__name__} embeddings to "
+                "namespace their cache, pass its `model_name`."
+            )
+        embedding = CacheBackedEmbeddings.from_bytes_store(
+            embedding,
+            LocalFileStore(cache_dir),
+            # Embeddings of different classes or models are never shared. The key
+            # characters are limited by LocalFileStore
+            namespace=re.sub(
+                r"[^\w.\-/]", "_", f"{type(embedding).__name__}.{embedding_model}"
+            ),
+            batch_size=batch_size,
+        )
+    vectorstore = FAISS.from_documents(documents, embedding)
+    if index_path is not None:
+        vectorstore.save_local(index_path)
+    return vectorstore
+
+
+def load_vectorstore(
+    index_path: str, embedding=None, model_name: str = "text-embedding-ada-002"
+):
+    """
+    Loads a FAISS vectorstore saved by `build_vectorstore`.
+
+    Parameters:
+    index_path : str
+        Directory the FAISS index was saved to.
+    embedding : Embeddings
+        Embedding model used for the queries. Defaults to `OpenAIEmbeddings(model=model_name)`.
+    model_name : str
+        Name of the embedding model, used when `embedding` is not provided.
+
+    Returns:
+    FAISS
+        The loaded vectorstore.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    if embedding is None:
+        from langchain_openai import OpenAIEmbeddings
+
+        embedding = OpenAIEmbeddings(model=model_name)
+    # The index was written by build_vectorstore, so its pickled docstore is trusted
+    return FAISS.load_local(index_path, embedding, allow_dangerous_deserialization=True)
@@ -0,0 +1,197 @@
+from typing import Iterable, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+
+from langchain.schema import Document
+from langchain_core.document_loaders import BaseLoader
+
+# Elements whose content is never loaded
+DROPPED_TAGS = frozenset(
+    {"ref-list", "ack", "table", "fn-group", "journal-meta", "permissions", "funding-group"}
+)
+# `sec-type` attributes of the sections that are never loaded
+DROPPED_SEC_TYPES = frozenset(
+    {
+        "ack",
+        "acknowledgement",
+        "acknowledgements",
+        "acknowledgment",
+        "acknowledgments",
+        "references",
+        "ref-list",
+        "coi-statement",
+        "conflict",
+        "funding-information",
+        "author-contributions",
+    }
+)
+# Elements whose text is read at once, when they end. Their children are kept until then.
+_TEXT_TAGS = frozenset({"p", "title", "label", "article-title"})
+# Elements collecting the paragraphs they contain
+_CONTAINER_TAGS = frozenset({"sec", "abstract", "app", "fig", "table-wrap", "body"})
+# Containers yielded as captions, also when they are nested in a paragraph
+_CAPTION_TAGS = frozenset({"fig", "table-wrap"})
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(element) -> str:
+    return " ".join("".join(element.itertext()).split())
+
+
+class _Section:
+    def __init__(self, tag: str, section_type: str, title: Optional[str] = None):
+        self.tag = tag
+        self.section_type = section_type
+        self.title = title
+        self.label = None
+        self.paragraphs = []
+        self.size = 0
+        # Text depth of the paragraph the container is nested in, if any
+        self.text_depth = 0
+
+
+class JATSLoader(BaseLoader):
+    """
+    Streaming loader of full-text articles in the JATS XML format used by most publishers
+    and PubMed Central.
+
+    The file is parsed with `iterparse` and every element is discarded once its text has
+    been read, so memory does not grow with the size of the file. The loader yields one
+    `Document` for the title, the abstract, every body section and every figure or table
+    caption, with "section" (the path of section titles, e.g. "Results > Water stability")
+    and "section_type" ("title", "abstract", "body", "figure_caption" or "table_caption")
+    metadata. References, acknowledgements and the other `DROPPED_TAGS` and
+    `DROPPED_SEC_TYPES` are dropped from the structure of the article, so they do not
+    need to be cut with `filter_words`, also when they are nested in a paragraph. Figures and
+    tables nested in a paragraph are yielded as captions, and removed from the paragraph.
+
+    Attributes:
+    file_path : str
+        Path of the XML file.
+    page_size : int
+        Long sections are yielded in several documents of about `page_size` characters.
+    drop_tags : Iterable[str]
+        Elements whose content is dropped.
+    drop_sec_types : Iterable[str]
+        `sec-type` attributes of the sections that are dropped.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        page_size: int = 4000,
+        drop_tags: Iterable[str] = DROPPED_TAGS,
+        drop_sec_types: Iterable[str] = DROPPED_SEC_TYPES,
+    ):
+        self.file_path = file_path
+        self.page_size = page_size
+        self.drop_tags = frozenset(drop_tags)
+        self.drop_sec_types = frozenset(t.lower() for t in drop_sec_types)
+
+    def _document(self, sections: List[_Section], text: str, section_type: str, **metadata):
+        titles = [s.title for s in sections if s.title]
+        return Document(
+            page_content=text,
+            metadata={
+                "source": self.file_path,
+                "section": " > ".join(titles),
+                "section_type": section_type,
+                **metadata,
+            },
+        )
+
+    def _flush(self, sections: List[_Section]) -> Iterator[Document]:
+        section = sections[-1]
+        if section.paragraphs:
+            yield self._document(sections, "\n\n".join(section.paragraphs), section.section_type)
+            section.paragraphs, section.size = [], 0
+
+    def lazy_load(self) -> Iterator[Document]:
+        sections = []  # open containers, outermost first
+        elements = []  # open elements, outermost first
+        skip_depth = 0
+        text_depth = 0
+        for event, element in iterparse(self.file_path, events=("start", "end")):
+            tag = _local_name(element.tag)
+            if event == "start":
+                elements.append(element)
+                if skip_depth or tag in self.drop_tags or (
+                    tag == "sec"
+                    and (element.get("sec-type") or "").lower() in self.drop_sec_types
+                ):
+                    skip_depth += 1
+                    continue
+                if tag in _TEXT_TAGS:
+                    text_depth += 1
+                elif tag in _CONTAINER_TAGS and (not text_depth or tag in _CAPTION_TAGS):
+                    if sections:
+                        # The paragraphs before a subsection come first
+                        yield from self._flush(sections)
+                    if tag == "abstract":
+                        section_type = "abstract"
+                    elif tag in _CAPTION_TAGS:
+                        section_type = "figure_caption" if tag == "fig" else "table_caption"
+                    elif sections:
+                        section_type = sections[-1].section_type
+                    else:
+                        section_type = "body"
+                    sections.append(
+                        _Section(tag, section_type, "Abstract" if tag == "abstract" else None)
+                    )
+                    # The caption of a figure or table nested in a paragraph is read on its own
+                    sections[-1].text_depth, text_depth = text_depth, 0
+                continue
+
+            elements.pop()
+            removed = False
+            if skip_depth:
+                skip_depth -= 1
+                removed = not skip_depth
+            elif tag in _TEXT_TAGS:
+                text_depth -= 1
+                if text_depth:
+                    continue
+                parent = _local_name(elements[-1].tag) if elements else None
+                text = _text(element)
+                if tag == "article-title":
+                    if parent == "title-group":
+                        yield self._document([], text, "title")
+                elif not sections or not text:
+                    pass
+                elif tag == "label":
+                    if parent in ("fig", "table-wrap"):
+                        sections[-1].label = text
+                elif tag == "title" and parent == sections[-1].tag:
+                    sections[-1].title = text
+                else:
+                    section = sections[-1]
+                    section.paragraphs.append(text)
+                    section.size += len(text)
+                    if section.size >= self.page_size:
+                        yield from self._flush(sections)
+            elif sections and tag == sections[-1].tag and not text_depth:
+                section = sections[-1]
+                if section.section_type.endswith("_caption"):
+                    caption = " ".join(
+                        filter(None, [section.label, section.title] + section.paragraphs)
+                    )
+                    if caption:
+                        yield self._document(
+                            sections[:-1], caption, section.section_type, label=section.label
+                        )
+                else:
+                    yield from self._flush(sections)
+                text_depth = sections.pop().text_depth
+                removed = True
+            if text_depth:
+                # Inline elements are read with their paragraph. Dropped elements and captions
+                # are emptied, keeping the tail that the paragraph continues with.
+                if removed:
+                    del element[:]
+                    element.text = None
+                continue
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
@@ -1,4 +1,281 @@
 """Main module."""
+from functools import lru_cache
+from typing import List
+
+from langchain.schema import BaseRetriever, Document, format_document
+
+from .retry import CONTEXT_LENGTH, UNKNOWN, call_with_retry, classify_error
+
+# Context window (in tokens) of the supported OpenAI chat models. Model names are
+# matched by their longest known prefix, so dated snapshots such as "gpt-4-0613"
+# resolve to their family.
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo-0301": 4096,
+    "gpt-3.5-turbo-0613": 4096,
+    "gpt-3.5-turbo-instruct": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo": 16385,
+}
+
+# Tokens kept free for the completion when the LLM does not set `max_tokens`.
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model_name="gpt-4"):
+    """
+    Count the number of tokens in a text using the tiktoken encoding of a model.
+
+    Parameters:
+    - text (str): The text to be tokenized.
+    - model_name (str): Name of the model whose encoding is used. Unknown models fall back
+                        to the "cl100k_base" encoding. Defaults to "gpt-4".
+
+    Returns:
+    - int: The number of tokens in the text.
+    """
+    return len(_get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+def count_document_tokens(document, model_name="gpt-4"):
+    """
+    Count the tokens of a document, reusing the count recorded in its metadata by the
+    "tokens" chunking type of `LoadDoc.process` when it was made with the same encoding.
+
+    Parameters:
+    - document (Document): The document.
+    - model_name (str): Name of the model whose encoding is used. Defaults to "gpt-4".
+
+    Returns:
+    - int: The number of tokens in the document content.
+    """
+    metadata = document.metadata or {}
+    if "tokens" in metadata and metadata.get("tokenizer") == _get_encoding(model_name).name:
+        return metadata["tokens"]
+    return count_tokens(document.page_content, model_name)
+
+
+def get_context_window(model_name, default=4096):
+    """
+    Get the context window size of a model in tokens.
+
+    Parameters:
+    - model_name (str): Name of the model.
+    - default (int): Value returned for unknown models. Defaults to 4096.
+
+    Returns:
+    - int: The context window of the model in tokens.
+    """
+    if model_name:
+        for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+            if model_name.startswith(prefix):
+                return MODEL_CONTEXT_WINDOWS[prefix]
+    return default
+
+
+def get_model_name(llm, default="gpt-4"):
+    """Return the model name of a LangChain LLM object, or `default` if it has none."""
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or default
+
+
+class _DocumentListRetriever(BaseRetriever):
+    """Retriever that always returns a fixed, already retrieved list of documents."""
+
+    documents: List[Document]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.documents
+
+
+def pack_documents(documents, token_budget, model_name="gpt-4", separator="\n\n"):
+    """
+    Select the largest prefix of ranked documents that fits in a token budget.
+
+    Parameters:
+    - documents (List[Document]): Documents in ranking order, e.g. the output of an MMR search.
+    - token_budget (int): The number of tokens available for the documents.
+    - model_name (str): Name of the model whose encoding is used to count tokens.
+    - separator (str): The string placed between documents when they are stuffed into the
+                       prompt. Defaults to "\\n\\n".
+
+    Returns:
+    - tuple: A tuple containing two elements:
+        - A list of the documents that fit in the budget.
+        - A list with the number of tokens of each selected document, separator included.
+    """
+    separator_tokens = count_tokens(separator, model_name)
+    packed, chunk_tokens = [], []
+    used = 0
+    for i, doc in enumerate(documents):
+        tokens = count_document_tokens(doc, model_name)
+        if i > 0:
+            tokens += separator_tokens
+        if used + tokens > token_budget:
+            break
+        packed.append(doc)
+        chunk_tokens.append(tokens)
+        used += tokens
+    return packed, chunk_tokens
+
+
+def _retrieve_documents(prompt, faiss_vectorstore, k, search_type, fetch_k, info=None):
+    """
+    Run a single vectorstore search for the `k` best documents in ranking order, counting it
+    in the "vectorstore_queries" of `info`.
+    """
+    documents = faiss_vectorstore.as_retriever(
+        search_type=search_type,
+        search_kwargs={"k": k, "fetch_k": fetch_k},
+    ).get_relevant_documents(prompt)
+    if info is not None:
+        info["vectorstore_queries"] = info.get("vectorstore_queries", 0) + 1
+    return documents
+
+
+def _retrieve_many(queries, faiss_vectorstore, k, search_type, fetch_k, info):
+    """
+    Search the `k` best documents of several queries in ranking order, as `_retrieve_documents`
+    does for each query, with shared query embedding requests counted in the
+    "vectorstore_queries" of `info`.
+
+    The queries are embedded in one `embed_documents` request, and the vectorstore is searched
+    with the vector of every query. The vectors are only used if the first one is the vector
+    of `embed_query`, which is checked with one more request, so that the rankings are the ones
+    of the retriever. Otherwise, and for other search types, the vectorstore is searched once
+    per query.
+    """
+    import numpy as np
+
+    embeddings = getattr(faiss_vectorstore, "embeddings", None)
+    if embeddings is None or search_type not in ("mmr", "similarity") or len(queries) < 3:
+        return [
+            _retrieve_documents(query, faiss_vectorstore, k, search_type, fetch_k, info=info)
+            for query in queries
+        ]
+
+    def search(vector):
+        if search_type == "mmr":
+            return faiss_vectorstore.max_marginal_relevance_search_by_vector(
+                vector, k=k, fetch_k=fetch_k
+            )
+        return faiss_vectorstore.similarity_search_by_vector(vector, k=k, fetch_k=fetch_k)
+
+    vectors = embeddings.embed_documents(list(queries))
+    first = embeddings.embed_query(queries[0])
+    info["vectorstore_queries"] += 2
+    if not np.allclose(vectors[0], first):
+        # The model embeds queries and documents differently
+        return [search(first)] + [
+            _retrieve_documents(query, faiss_vectorstore, k, search_type, fetch_k, info=info)
+            for query in queries[1:]
+        ]
+    return [search(vector) for vector in vectors]
+
+
+def _run_token_budget(
+    prompt,
+    faiss_vectorstore,
+    k,
+    min_k,
+    llm,
+    search_type,
+    fetch_k,
+    chain_type,
+    memory,
+    max_context_tokens,
+    completion_tokens,
+    rate_limiter,
+    retry_policy,
+):
+    from langchain.chains import RetrievalQA
+
+    if chain_type != "stuff":
+        raise ValueError("Token budget packing is only supported for chain_type='stuff'.")
+
+    model_name = get_model_name(llm)
+    if max_context_tokens is None:
+        max_context_tokens = get_context_window(model_name)
+    if completion_tokens is None:
+        completion_tokens = getattr(llm, "max_tokens", None) or DEFAULT_COMPLETION_TOKENS
+
+    searches = {"vectorstore_queries": 0}
+    candidates = _retrieve_documents(
+        prompt, faiss_vectorstore, k, search_type, fetch_k, info=searches
+    )
+
+    retriever = _DocumentListRetriever(documents=[])
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type=chain_type,
+        retriever=retriever,
+        memory=memory,
+    )
+    combine_chain = qa_chain.combine_documents_chain
+    template_tokens = count_tokens(
+        combine_chain.llm_chain.prompt.format(
+            **{combine_chain.document_variable_name: "", "question": ""}
+        ),
+        model_name,
+    )
+    prompt_tokens = count_tokens(prompt, model_name)
+    token_budget = (
+        max_context_tokens - completion_tokens - template_tokens - prompt_tokens
+    )
+    packed, chunk_tokens = pack_documents(
+        candidates, token_budget, model_name, combine_chain.document_separator
+    )
+    info = {
+        "k": len(packed),
+        "max_context_tokens": max_context_tokens,
+        "completion_tokens": completion_tokens,
+        "prompt_tokens": prompt_tokens,
+        "template_tokens": template_tokens,
+        "chunk_tokens": chunk_tokens,
+        "context_tokens": sum(chunk_tokens),
+        "total_tokens": prompt_tokens + template_tokens + sum(chunk_tokens),
+        "vectorstore_queries": searches["vectorstore_queries"],
+    }
+    if len(packed) < min_k:
+        print(
+            f"\nOnly {len(packed)} documents fit in the {max_context_tokens} token context window "
+            f"of {model_name}. Minimum k limit not reached. Try reducing minimum k value."
+        )
+        return None, info
+
+    # The local count can still be off, e.g. for models with an unknown context window,
+    # so a context-length error drops the last packed document and tries again.
+    while len(packed) >= min_k:
+        retriever.documents = packed
+        try:
+            result = call_with_retry(
+                qa_chain.run, prompt, rate_limiter=rate_limiter, retry_policy=retry_policy
+            )
+            return result, info
+        except Exception as e:
+            if classify_error(e) not in (CONTEXT_LENGTH, UNKNOWN):
+                raise
+            print(e)
+            packed = packed[:-1]
+            info["k"] = len(packed)
+            info["chunk_tokens"] = info["chunk_tokens"][:-1]
+            info["context_tokens"] = sum(info["chunk_tokens"])
+            info["total_tokens"] = prompt_tokens + template_tokens + info["context_tokens"]
+    return None, info
 
 
 def RetrievalQABypassTokenLimit(
@@ -11,6 +288,12 @@ def RetrievalQABypassTokenLimit(
     fetch_k=50,
     chain_type="stuff",
     memory=None,
+    token_budget=False,
+    max_context_tokens=None,
+    completion_tokens=None,
+    return_info=False,
+    rate_limiter=None,
+    retry_policy=None,
 ):
     """
     Run LangChain's RetrievalQA with reducing 'k' until a successful output is obtained without hitting the LLM's token limit.
@@ -25,32 +308,86 @@ def RetrievalQABypassTokenLimit(
     - fetch_k (int): determines the amount of documents to pass to the search_type algorithm; . Defaults to 50.
     - chain_type (str): The type of chain used in RetrievalQA. Defaults to "stuff".
     - memory (object): Adds meomry to the RetrievalQA
+    - token_budget (bool): If True, count the tokens of the prompt, the chain template and each retrieved
+                           document locally with tiktoken, and stuff the largest prefix of the ranked documents
+                           that fits in the model's context window. The LLM is then called exactly once instead
+                           of retrying with smaller 'k'. Only supported for chain_type="stuff". Defaults to False.
+    - max_context_tokens (int): Context window used in token budget mode. Defaults to the known context
+                                window of the LLM's model.
+    - completion_tokens (int): Tokens reserved for the answer in token budget mode. Defaults to the LLM's
+                               `max_tokens`, or 1000 if it is not set.
+    - return_info (bool): If True, also return a dictionary with the chosen 'k', the number of vectorstore
+                          queries and, in token budget mode, the token counts of the prompt, the template and
+                          each packed document.
+    - rate_limiter (TokenBucket): Rate limiter shared with other LLM calls. Defaults to None.
+    - retry_policy (RetryPolicy): Backoff policy for rate-limit and transient errors, which are retried
+                                  with the same 'k'. Only context-length (and unclassified) errors reduce
+                                  'k'. Defaults to `RetryPolicy()`.
 
     Returns:
     - result (object): The result obtained from the QA chain, or None if the process fails after multiple attempts
                        to avoid the token limit error.
+    - info (dict): Only returned if `return_info` is True.
+
+    Raises:
+    - Exception: Rate-limit or transient errors that persist after all retries, and fatal errors such as
+                 authentication errors.
     """
     from langchain.chains import RetrievalQA
 
+    if token_budget:
+        result, info = _run_token_budget(
+            prompt,
+            faiss_vectorstore,
+            k,
+            min_k,
+            llm,
+            search_type,
+            fetch_k,
+            chain_type,
+            memory,
+            max_context_tokens,
+            completion_tokens,
+            rate_limiter,
+            retry_policy,
+        )
+        return (result, info) if return_info else result
+
+    # MMR is greedy, so the first k' documents of an MMR ranking of size k are the
+    # MMR ranking of size k'. The vectorstore is therefore searched once and the
+    # candidates are sliced locally for every smaller k.
+    info = {"k": None, "attempts": 0, "vectorstore_queries": 0}
+    candidates = _retrieve_documents(
+        prompt, faiss_vectorstore, k, search_type, fetch_k, info=info
+    )
+    retriever = _DocumentListRetriever(documents=[])
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type=chain_type,
+        retriever=retriever,
+        memory=memory,
+    )
+    k = min(k, len(candidates))
+
     while k >= min_k:
+        info["attempts"] += 1
         try:
-            retriever = faiss_vectorstore.as_retriever(
-                search_type=search_type,
-                search_kwargs={"k": k, "fetch_k": fetch_k},
-            )
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=llm,
-                chain_type=chain_type,
-                retriever=retriever,
-                memory=memory,
-            )
+            retriever.documents = candidates[:k]
 
-            # Check to see if we hit the token limit
-            result = qa_chain.run(prompt)
-            return result  # If successful, return the result and exit the function
+            # Check to see if we hit the token limit. Rate-limit and transient errors
+            # are retried with backoff inside `call_with_retry`.
+            result = call_with_retry(
+                qa_chain.run, prompt, rate_limiter=rate_limiter, retry_policy=retry_policy
+            )
+            # If successful, return the result and exit the function
+            info["k"] = k
+            return (result, info) if return_info else result
 
         except Exception as e:
-            # If an error is caught, reduce the value of k and retry
+            # Errors that cannot be fixed by shrinking the context are raised
+            if classify_error(e) not in (CONTEXT_LENGTH, UNKNOWN):
+                raise
+            # If a token limit error is caught, reduce the value of k and retry
             print(e)
             print(
                 f"\nk={k} results hitting the token limit for the chosen LLM. Reducing k and retrying...\n"
@@ -62,4 +399,223 @@ def RetrievalQABypassTokenLimit(
         print(
             "\nFailed to retrieve result after multiple attempts. Minimum k limit reached. Try reducing minimum k value."
         )
-        return None  # Return None to indicate that the process failed
+        # Return None to indicate that the process failed
+        return (None, info) if return_info else None
+
+
+def stream_retrieval_qa(
+    prompt,
+    faiss_vectorstore,
+    k,
+    min_k,
+    llm,
+    search_type="mmr",
+    fetch_k=50,
+    rate_limiter=None,
+    retry_policy=None,
+):
+    """
+    Streaming version of `RetrievalQABypassTokenLimit` with the "stuff" chain: yield the text of
+    the answer chunk by chunk while the LLM generates it.
+
+    The vectorstore is searched once. If the LLM rejects the prompt with a context-length error
+    before the first chunk, 'k' is reduced and the stream is opened again.
+
+    Streamed answers are not cached: the LLM cache (e.g. `LLMCache`) is neither read nor updated,
+    so every call is sent to the LLM. Use `RetrievalQABypassTokenLimit` for cached answers.
+
+    Parameters:
+    - prompt (str): The input text for the QA chain.
+    - faiss_vectorstore (object): The FAISS vector store object used to retrieve relevant documents.
+    - k (int): The initial value of 'k', representing the number of documents to initially retrieve.
+    - min_k (int): The minimum allowable value for 'k'.
+    - llm (object): The language model object used to generate answers.
+    - search_type (str): The type of search to perform. Defaults to "mmr": Maximum Marginal Relevance.
+    - fetch_k (int): determines the amount of documents to pass to the search_type algorithm. Defaults to 50.
+    - rate_limiter (TokenBucket): Rate limiter shared with other LLM calls. Defaults to None.
+    - retry_policy (RetryPolicy): Backoff policy for rate-limit and transient errors raised before
+                                  the first chunk. Defaults to `RetryPolicy()`.
+
+    Yields:
+    - str: The chunks of the answer. Nothing is yielded if the process fails after multiple attempts
+           to avoid the token limit error.
+    """
+    from langchain.chains import RetrievalQA
+
+    candidates = _retrieve_documents(prompt, faiss_vectorstore, k, search_type, fetch_k)
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm, chain_type="stuff", retriever=_DocumentListRetriever(documents=[])
+    )
+    combine_chain = qa_chain.combine_documents_chain
+    k = min(k, len(candidates))
+
+    def open_stream(prompt_value):
+        # Errors of the request are raised by the first chunk
+        stream = iter(llm.stream(prompt_value))
+        return stream, next(stream, None)
+
+    while k >= min_k:
+        context = combine_chain.document_separator.join(
+            format_document(doc, combine_chain.document_prompt) for doc in candidates[:k]
+        )
+        prompt_value = combine_chain.llm_chain.prompt.format_prompt(
+            **{combine_chain.document_variable_name: context, "question": prompt}
+        )
+        try:
+            stream, first = call_with_retry(
+                open_stream, prompt_value, rate_limiter=rate_limiter, retry_policy=retry_policy
+            )
+        except Exception as e:
+            if classify_error(e) not in (CONTEXT_LENGTH, UNKNOWN):
+                raise
+            print(e)
+            print(
+                f"\nk={k} results hitting the token limit for the chosen LLM. Reducing k and retrying...\n"
+            )
+            k -= 1
+            continue
+        if first is not None:
+            # Chat models stream message chunks, LLMs stream strings
+            yield getattr(first, "content", first)
+            for chunk in stream:
+                yield getattr(chunk, "content", chunk)
+        return
+    print(
+        "\nFailed to retrieve result after multiple attempts. Minimum k limit reached. Try reducing minimum k value."
+    )
+
+
+def batch_retrieval_qa(
+    queries,
+    make_prompt,
+    faiss_vectorstore,
+    k,
+    min_k,
+    llm,
+    search_type="mmr",
+    fetch_k=50,
+    max_context_tokens=None,
+    completion_tokens=None,
+    rate_limiter=None,
+    retry_policy=None,
+):
+    """
+    Answer several related questions about a document, e.g. one per MOF, in as few LLM calls
+    as the context window allows.
+
+    The vectorstore is searched for the `k` best documents of every query, with the rankings of
+    `RetrievalQABypassTokenLimit` and shared query embedding requests (see `_retrieve_many`).
+    The questions are then grouped in order: a question
+    joins the current group if its documents that are not already in the group fit in the
+    token budget, so the documents shared by several questions are stuffed only once, and the
+    documents of a group are stuffed in a single prompt asking about all its questions.
+
+    Parameters:
+    - queries (List[str]): The retrieval queries, one per question.
+    - make_prompt (callable): Function that returns the question asked to the LLM for a list of
+                              indices of `queries`.
+    - faiss_vectorstore (object): The FAISS vector store object used to retrieve relevant documents.
+    - k (int): The number of documents retrieved for each query.
+    - min_k (int): The minimum number of documents of a question. A question whose documents do not
+                   fit on their own is not asked.
+    - llm (object): The language model object used to generate answers.
+    - search_type (str): The type of search to perform. Defaults to "mmr": Maximum Marginal Relevance.
+    - fetch_k (int): determines the amount of documents to pass to the search_type algorithm. Defaults to 50.
+    - max_context_tokens (int): Context window of the LLM. Defaults to the known context window of the
+                                LLM's model.
+    - completion_tokens (int): Tokens reserved for the answer. Defaults to the LLM's `max_tokens`, or
+                               1000 if it is not set.
+    - rate_limiter (TokenBucket): Rate limiter shared with other LLM calls. Defaults to None.
+    - retry_policy (RetryPolicy): Backoff policy for rate-limit and transient errors. Defaults to
+                                  `RetryPolicy()`.
+
+    Returns:
+    - tuple: A tuple containing two elements:
+        - A list of (indices, answer) pairs, one per group of questions, in the order of `queries`.
+          The answer is None if the group could not be asked.
+        - A dictionary with the number of vectorstore queries (query embedding requests), of LLM
+          calls, of retrieved and of duplicate documents, and for every batch its questions, LLM
+          calls, number of documents and context tokens.
+    """
+    from langchain.chains import RetrievalQA
+
+    model_name = get_model_name(llm)
+    if max_context_tokens is None:
+        max_context_tokens = get_context_window(model_name)
+    if completion_tokens is None:
+        completion_tokens = getattr(llm, "max_tokens", None) or DEFAULT_COMPLETION_TOKENS
+
+    info = {
+        "vectorstore_queries": 0,
+        "llm_calls": 0,
+        "retrieved_documents": 0,
+        "duplicate_documents": 0,
+        "batches": [],
+    }
+    rankings = _retrieve_many(queries, faiss_vectorstore, k, search_type, fetch_k, info)
+    info["retrieved_documents"] = sum(len(ranking) for ranking in rankings)
+
+    retriever = _DocumentListRetriever(documents=[])
+    qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever)
+    combine_chain = qa_chain.combine_documents_chain
+    separator = combine_chain.document_separator
+    template_tokens = count_tokens(
+        combine_chain.llm_chain.prompt.format(
+            **{combine_chain.document_variable_name: "", "question": ""}
+        ),
+        model_name,
+    )
+    token_budget = max_context_tokens - completion_tokens - template_tokens
+
+    def context_budget(indices):
+        return token_budget - count_tokens(make_prompt(indices), model_name)
+
+    # Group the questions in order, packing their deduplicated documents in the budget
+    groups = []
+    for i, ranking in enumerate(rankings):
+        if groups:
+            indices, documents, chunk_tokens, contents = groups[-1]
+            new = [d for d in ranking if d.page_content not in contents]
+            tokens = [count_document_tokens(d, model_name) for d in new]
+            tokens = [t + count_tokens(separator, model_name) for t in tokens]
+            if sum(chunk_tokens) + sum(tokens) <= context_budget(indices + [i]):
+                indices.append(i)
+                documents.extend(new)
+                chunk_tokens.extend(tokens)
+                contents.update(d.page_content for d in new)
+                continue
+        packed, chunk_tokens = pack_documents(ranking, context_budget([i]), model_name, separator)
+        groups.append(([i], packed, chunk_tokens, {d.page_content for d in packed}))
+
+    results = []
+    for indices, documents, chunk_tokens, _ in groups:
+        info["duplicate_documents"] += sum(len(rankings[i]) for i in indices) - len(documents)
+        batch = {"questions": indices, "llm_calls": 0}
+        question = make_prompt(indices)
+        result = None
+        # The local count can still be off, so a context-length error drops the last
+        # packed document and tries again
+        while len(documents) >= min_k:
+            retriever.documents = documents
+            batch["llm_calls"] += 1
+            try:
+                result = call_with_retry(
+                    qa_chain.run, question, rate_limiter=rate_limiter, retry_policy=retry_policy
+                )
+                break
+            except Exception as e:
+                if classify_error(e) not in (CONTEXT_LENGTH, UNKNOWN):
+                    raise
+                print(e)
+                documents, chunk_tokens = documents[:-1], chunk_tokens[:-1]
+        else:
+            print(
+                f"\nOnly {len(documents)} documents fit in the {max_context_tokens} token context "
+                f"window of {model_name}. Minimum k limit not reached. Try reducing minimum k value."
+            )
+        batch["k"] = len(documents)
+        batch["context_tokens"] = sum(chunk_tokens)
+        info["batches"].append(batch)
+        info["llm_calls"] += batch["llm_calls"]
+        results.append((indices, result))
+    return results, info
@@ -1,7 +1,202 @@
-from fuzzywuzzy import fuzz
+import re
+from collections import defaultdict
 
+import numpy as np
+from rapidfuzz.distance import Indel
+from rapidfuzz.process import cdist
 
-def match_MOF_names(prediction_dict, ground_truth_dict, threshold=80):
+# Same normalization as `fuzzywuzzy.utils.full_process(s, force_ascii=True)`
+_NON_ALPHANUMERIC = re.compile(r"(?ui)\W")
+_NON_ASCII = {i: None for i in range(128, 256)}
+
+
+def process_MOF_name(name):
+    """
+    Normalize a MOF name as `fuzz.token_sort_ratio` does before comparing names: drop the
+    characters 128-255, replace non-alphanumeric characters with spaces, lowercase, and
+    sort the tokens.
+
+    Parameters:
+        name (str): A MOF name.
+
+    Returns:
+        str: The normalized name.
+    """
+    name = str(name).translate(_NON_ASCII)
+    tokens = _NON_ALPHANUMERIC.sub(" ", name).lower().split()
+    return " ".join(sorted(tokens))
+
+
+def _qgrams(name, q):
+    """Yield the q-grams of a name, numbered by occurrence so that sets count repeats."""
+    occurrences = defaultdict(int)
+    for i in range(len(name) - q + 1):
+        gram = name[i : i + q]
+        occurrences[gram] += 1
+        yield gram, occurrences[gram]
+
+
+class MOFNameIndex:
+    """
+    Character q-gram inverted index of normalized MOF names, which scores a name against
+    the indexed names with the similarity of `fuzz.token_sort_ratio`.
+
+    Only the names that can reach a minimum similarity are scored. The similarity is
+    100 * (1 - d / (l1 + l2)), with d the insertion/deletion distance of two normalized
+    names of lengths l1 and l2, so a minimum similarity bounds d. This bounds the
+    difference of lengths, and the number of q-grams the names must share, since each
+    insertion or deletion destroys at most q of their shared q-grams. The remaining
+    candidates are scored in one batch with rapidfuzz.
+
+    Parameters:
+        names (list): The names to index.
+        q (int, optional): Size of the q-grams. The default is 2.
+    """
+
+    def __init__(self, names, q=2):
+        self.q = q
+        self.names = [process_MOF_name(name) for name in names]
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int64)
+        postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for gram in _qgrams(name, q):
+                postings[gram].append(i)
+        self.postings = {gram: np.array(ids) for gram, ids in postings.items()}
+
+    def candidates(self, name, min_ratio, mask=None):
+        """
+        Return the indices of the indexed names that may have a similarity ratio (between 0
+        and 1) of at least `min_ratio` with a normalized name, optionally among a boolean
+        `mask` of the indexed names.
+        """
+        length = len(name)
+        # Maximum distance, with a margin for rounding errors
+        max_distance = (1 - min_ratio) * (length + self.lengths) + 1e-9
+        keep = np.abs(length - self.lengths) <= max_distance
+        if mask is not None:
+            keep &= mask
+        grams = [self.postings[g] for g in _qgrams(name, self.q) if g in self.postings]
+        shared = np.bincount(
+            np.concatenate(grams) if grams else np.array([], dtype=np.int64),
+            minlength=len(self.names),
+        )
+        # Each insertion or deletion destroys at most q of the q-grams shared by the names
+        min_shared = np.maximum(length, self.lengths) - self.q + 1 - self.q * max_distance
+        return np.flatnonzero(keep & (shared >= min_shared))
+
+    def scores(self, name, threshold, mask=None):
+        """
+        Return the indices of the indexed names with a `fuzz.token_sort_ratio` similarity
+        above `threshold` with a name, and their similarities.
+        """
+        name = process_MOF_name(name)
+        min_ratio = (np.floor(threshold) + 0.5) / 100
+        indices = self.candidates(name, min_ratio, mask)
+        if not len(indices):
+            return indices, np.array([], dtype=np.int64)
+        ratios = cdist(
+            [name],
+            [self.names[i] for i in indices],
+            scorer=Indel.normalized_similarity,
+            dtype=np.float64,
+        )[0]
+        similarities = np.rint(100 * ratios).astype(np.int64)
+        above = similarities > threshold
+        return indices[above], similarities[above]
+
+
+def _paper_groups(mof_dict):
+    """Group the keys of a MOF dictionary by their "Paper id"."""
+    groups = defaultdict(list)
+    for key, value in mof_dict.items():
+        groups[value.get("Paper id")].append(key)
+    return groups
+
+
+def _greedy_assignment(prediction_dict, ground_truth_dict, threshold):
+    """
+    Assign each prediction key, in order, to the still unmatched ground truth key of
+    highest similarity (the first one in case of ties). Returns the assignment and, for
+    every prediction key, its best ground truth key regardless of the assignment.
+    """
+    assignment, best_keys = {}, {}
+    ground_truth_keys = list(ground_truth_dict.keys())
+    index = MOFNameIndex(ground_truth_keys)
+    unmatched = np.ones(len(ground_truth_keys), dtype=bool)
+
+    for key_1 in prediction_dict:
+        indices, similarities = index.scores(key_1, threshold, mask=unmatched)
+        if len(indices):
+            # argmax returns the first of the best candidates, in ground truth order
+            matched_index = indices[np.argmax(similarities)]
+            assignment[key_1] = ground_truth_keys[matched_index]
+            unmatched[matched_index] = False
+        else:
+            indices, similarities = index.scores(key_1, threshold)
+            if len(indices):
+                best_keys[key_1] = ground_truth_keys[indices[np.argmax(similarities)]]
+    return assignment, best_keys
+
+
+def _optimal_assignment(prediction_dict, ground_truth_dict, threshold):
+    """
+    Assign prediction keys to ground truth keys of the same "Paper id" so that the sum of
+    the similarities of the matched pairs is maximal. Returns the assignment and, for every
+    prediction key, its best ground truth key regardless of the assignment.
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    assignment, best_keys = {}, {}
+    ground_truth_groups = _paper_groups(ground_truth_dict)
+    for paper_id, prediction_keys in _paper_groups(prediction_dict).items():
+        ground_truth_keys = ground_truth_groups.get(paper_id)
+        if not ground_truth_keys:
+            continue
+
+        # Sparse similarity matrix of the pairs above the threshold, blocked by the index
+        index = MOFNameIndex(ground_truth_keys)
+        rows, columns, weights = [], [], []
+        for i, key_1 in enumerate(prediction_keys):
+            indices, similarities = index.scores(key_1, threshold)
+            if len(indices):
+                best_keys[key_1] = ground_truth_keys[indices[np.argmax(similarities)]]
+                rows.extend([i] * len(indices))
+                columns.extend(indices.tolist())
+                weights.extend(similarities.tolist())
+        if not rows:
+            continue
+        rows, columns = np.array(rows), np.array(columns)
+        shape = (len(prediction_keys), len(ground_truth_keys))
+        similarity = coo_matrix((weights, (rows, columns)), shape=shape).tocsr()
+        is_pair = coo_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=shape)
+        is_pair = is_pair.tocsr()
+
+        # Connected components of the bipartite graph of candidate pairs are solved
+        # separately, so each dense assignment problem stays small
+        n = len(prediction_keys)
+        graph = coo_matrix(
+            (np.ones(len(rows)), (rows, columns + n)),
+            shape=(n + len(ground_truth_keys),) * 2,
+        )
+        _, labels = connected_components(graph, directed=False)
+        edge_labels = labels[rows]
+        for label in np.unique(edge_labels):
+            component_rows = np.unique(rows[edge_labels == label])
+            component_columns = np.unique(columns[edge_labels == label])
+            weights = similarity[component_rows][:, component_columns].toarray()
+            is_edge = is_pair[component_rows][:, component_columns].toarray()
+            row_indices, column_indices = linear_sum_assignment(weights, maximize=True)
+            for i, j in zip(row_indices, column_indices):
+                # Pairs outside the sparse matrix fill the rows with no candidate left
+                if is_edge[i, j]:
+                    key_1 = prediction_keys[component_rows[i]]
+                    assignment[key_1] = ground_truth_keys[component_columns[j]]
+    return assignment, best_keys
+
+
+def match_MOF_names(prediction_dict, ground_truth_dict, threshold=80, method="greedy"):
     """
     Match MOF names between prediction and ground truth dictionaries based on similarity.
 
@@ -10,11 +205,19 @@ def match_MOF_names(prediction_dict, ground_truth_dict, threshold=80):
     information related to the MOFs. It uses fuzzy matching to find matching pairs
     of MOF names between the two dictionaries based on similarity.
 
+    The similarity is `fuzz.token_sort_ratio`, and the ground truth keys are indexed with
+    `MOFNameIndex`, so only plausible pairs are scored.
+
     Parameters:
         prediction_dict (dict): A dictionary containing predicted MOF data.
         ground_truth_dict (dict): A dictionary containing ground truth MOF data.
         threshold (int, optional): The minimum similarity score required to consider
             two keys as a match. The default threshold is 80.
+        method (str, optional): "greedy" matches each prediction key, in order, with the
+            still unmatched ground truth key of highest similarity (the first one in case
+            of ties). "optimal" matches the keys of each "Paper id" so that the total
+            similarity of the matched pairs is maximal, with
+            `scipy.optimize.linear_sum_assignment`. The default is "greedy".
 
     Returns:
         tuple: A tuple containing two elements:
@@ -23,34 +226,29 @@ def match_MOF_names(prediction_dict, ground_truth_dict, threshold=80):
             - A list (matched_pairs) that contains tuples of matched key pairs from
               prediction_dict and ground_truth_dict.
             - A list (unmatched_pairs) that contains tuples of key that could not be matched between
-              prediction_dict and ground_truth_dict.
+              prediction_dict and ground_truth_dict, with the most similar ground truth
+              key above the threshold that was matched with another key, or None.
     """
+    if method == "greedy":
+        assignment, best_keys = _greedy_assignment(
+            prediction_dict, ground_truth_dict, threshold
+        )
+    elif method == "optimal":
+        assignment, best_keys = _optimal_assignment(
+            prediction_dict, ground_truth_dict, threshold
+        )
+    else:
+        raise ValueError(f"Unknown matching method '{method}', use 'greedy' or 'optimal'.")
 
     combined_dict = {}
     matched_pairs = []
     unmatched_pairs = []
-    matched_ground_truth_keys = set()  # Set to store matched ground_truth_dict keys
-
     for key_1, value_1 in prediction_dict.items():
-        matched_key = None
-        highest_similarity = 0
-
-        for key_2 in ground_truth_dict.keys():
-            # Check if the key_2 is already matched, if so, skip it
-            if key_2 in matched_ground_truth_keys:
-                continue
-
-            similarity = fuzz.token_sort_ratio(key_1, key_2)
-            if similarity > threshold and similarity > highest_similarity:
-                matched_key = key_2
-                highest_similarity = similarity
-
-        if matched_key is not None:
+        if key_1 in assignment:
+            matched_key = assignment[key_1]
             combined_dict[key_1] = {**value_1, **ground_truth_dict[matched_key]}
             matched_pairs.append((key_1, matched_key))
-            # Add the matched ground_truth_dict key to the set
-            matched_ground_truth_keys.add(matched_key)
         else:
-            unmatched_pairs.append((key_1, key_2))
+            unmatched_pairs.append((key_1, best_keys.get(key_1)))
 
     return combined_dict, matched_pairs, unmatched_pairs
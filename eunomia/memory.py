@@ -0,0 +1,170 @@
+from typing import Optional
+
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+
+from .eunomia import _get_encoding, count_tokens
+
+MEMORY_STRATEGIES = ("none", "buffer", "window", "summary")
+
+
+def _truncate_tokens(text, max_tokens, model_name="gpt-4", keep_end=False):
+    """Truncate a text to its first (or last, if `keep_end`) `max_tokens` tokens."""
+    encoding = _get_encoding(model_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+    return encoding.decode(tokens)
+
+
+class TokenWindowMemory(ConversationBufferMemory):
+    """
+    Conversation memory keeping only the most recent messages that fit in a token budget.
+
+    The oldest messages are dropped once the rendered history exceeds `max_token_limit`
+    tokens, counted with the tiktoken encoding of `model_name`. A single message longer
+    than the budget is truncated, keeping its end, so the cap always holds.
+    """
+
+    max_token_limit: int = 2000
+    model_name: str = "gpt-4"
+
+    def get_num_tokens(self):
+        """Return the number of tokens of the history as it is inserted in the prompt."""
+        return count_tokens(self.buffer_as_str, self.model_name)
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self.prune()
+
+    def prune(self):
+        """Drop the oldest messages until the history fits in `max_token_limit` tokens."""
+        buffer = self.chat_memory.messages
+        while len(buffer) > 1 and self.get_num_tokens() > self.max_token_limit:
+            buffer.pop(0)
+        overflow = self.get_num_tokens() - self.max_token_limit
+        while buffer and overflow > 0:
+            content = buffer[0].content
+            max_tokens = count_tokens(content, self.model_name) - overflow
+            buffer[0] = buffer[0].copy(
+                update={
+                    "content": _truncate_tokens(
+                        content, max_tokens, self.model_name, keep_end=True
+                    )
+                }
+            )
+            if max_tokens <= 0:
+                break
+            overflow = self.get_num_tokens() - self.max_token_limit
+
+
+class TokenSummaryMemory(ConversationSummaryBufferMemory):
+    """
+    Conversation memory keeping the recent messages verbatim and a rolling summary of the
+    older ones, within a hard budget of `max_token_limit` tokens.
+
+    At most `max_summary_tokens` tokens (half of the budget by default) are reserved for the
+    summary. Messages that do not fit in the rest of the budget are summarized by `llm`, and
+    the summary is truncated if it runs over. Tokens are counted with the tiktoken encoding
+    of `model_name`.
+    """
+
+    model_name: str = "gpt-4"
+    max_summary_tokens: Optional[int] = None
+
+    def _count(self, messages):
+        return count_tokens(
+            get_buffer_string(
+                messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+            ),
+            self.model_name,
+        )
+
+    def _messages(self):
+        messages = list(self.chat_memory.messages)
+        if self.moving_summary_buffer:
+            messages.insert(0, SystemMessage(content=self.moving_summary_buffer))
+        return messages
+
+    def get_num_tokens(self):
+        """Return the number of tokens of the summary and history inserted in the prompt."""
+        return self._count(self._messages())
+
+    def prune(self):
+        """Summarize the oldest messages until the memory fits in `max_token_limit` tokens."""
+        summary_tokens = self.max_summary_tokens
+        if summary_tokens is None:
+            summary_tokens = self.max_token_limit // 2
+        buffer = self.chat_memory.messages
+        pruned_memory = []
+        while buffer and self._count(buffer) > self.max_token_limit - summary_tokens:
+            pruned_memory.append(buffer.pop(0))
+        if pruned_memory:
+            self.moving_summary_buffer = _truncate_tokens(
+                self.predict_new_summary(pruned_memory, self.moving_summary_buffer),
+                summary_tokens,
+                self.model_name,
+            )
+        # The "System: " prefix of the summary can still run over the budget
+        overflow = self.get_num_tokens() - self.max_token_limit
+        while self.moving_summary_buffer and overflow > 0:
+            self.moving_summary_buffer = _truncate_tokens(
+                self.moving_summary_buffer,
+                count_tokens(self.moving_summary_buffer, self.model_name) - overflow,
+                self.model_name,
+            )
+            overflow = self.get_num_tokens() - self.max_token_limit
+
+
+def build_memory(
+    strategy="window",
+    max_tokens=2000,
+    llm=None,
+    model_name="gpt-4",
+    memory_key="chat_history",
+):
+    """
+    Create the conversation memory of an agent.
+
+    Parameters:
+    - strategy (str or BaseMemory): One of "none" (no memory), "buffer" (the whole history,
+                                    unbounded), "window" (the most recent messages within
+                                    `max_tokens` tokens) or "summary" (a rolling summary of the
+                                    older messages and the recent ones within `max_tokens`
+                                    tokens). A memory object is returned unchanged.
+                                    Defaults to "window".
+    - max_tokens (int): Hard cap on the tokens of the memory. Defaults to 2000.
+    - llm (object): The language model writing the summaries. Required by "summary".
+    - model_name (str): Name of the model whose tiktoken encoding counts the tokens.
+                        Defaults to "gpt-4".
+    - memory_key (str): Prompt variable of the memory. Defaults to "chat_history".
+
+    Returns:
+    - BaseMemory: The memory object, or None for "none".
+    """
+    if strategy is None or isinstance(strategy, BaseMemory):
+        return strategy
+    if strategy == "none":
+        return None
+    if strategy == "buffer":
+        return ConversationBufferMemory(memory_key=memory_key)
+    if strategy == "window":
+        return TokenWindowMemory(
+            memory_key=memory_key, max_token_limit=max_tokens, model_name=model_name
+        )
+    if strategy == "summary":
+        if llm is None:
+            raise ValueError("The summary memory requires an LLM.")
+        return TokenSummaryMemory(
+            llm=llm,
+            memory_key=memory_key,
+            max_token_limit=max_tokens,
+            model_name=model_name,
+        )
+    raise ValueError(
+        f"Unknown memory strategy {strategy!r}, expected one of {MEMORY_STRATEGIES}."
+    )
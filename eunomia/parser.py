@@ -1,23 +1,660 @@
+import ast
 import json
+import re
+import threading
+import weakref
+from functools import lru_cache
 from typing import List
 
-from langchain.chat_models import ChatOpenAI
 from langchain.output_parsers import OutputFixingParser, PydanticOutputParser
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 
+from .clients import get_default_client_pool
+from .retry import call_with_retry
 
-def parse_to_dict(result, paper_id):
+# Tiers of `parse_answer`, from the cheapest to the most expensive
+PARSE_TIERS = ("strict", "repair", "llm")
+
+
+class MOF(BaseModel):
+    """Pydantic data model for a Metal-Organic Framework (MOF)."""
+
+    name: str = Field(description="name of a MOF")
+    stability: str = Field(
+        description="choose only one: stable or unstable or not provided"
+    )
+    score: float = Field(description="probability score of prediction")
+    justification: str = Field(description="justification for prediction")
+    DOI: str = Field(description="DOI of the paper")
+
+
+class MOFList(BaseModel):
+    """Pydantic data model for a list of MOFs."""
+
+    MOFs: List[MOF]
+
+
+# Validator of many answers at once
+_MOF_LISTS = TypeAdapter(List[MOFList])
+
+_FENCED_BLOCK = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'"})
+_DOI = re.compile(r"\b10\.\d{4,9}/[^\s\"'<>]+")
+_NUMBER = re.compile(r"(\d+(?:\.\d+)?|\.\d+)\s*(%)?")
+_NUMBERED_ITEM = re.compile(r"^\(?([1-4])[.)]\s*(.*)$")
+_BULLET = re.compile(r"^[-*\u2022]\s*(.*?)\s*:\s*(.*)$")
+_NAME_HEADER = re.compile(r"^(?:#+\s*)?(?:(?:MOF\s*)?name|MOF|material)\s*:\s*(.+)$", re.I)
+# Words of sentences, which do not appear in MOF names, e.g. in "Here is my answer:"
+_SENTENCE_WORDS = frozenset(
+    "a an and are as based below context document following for found from here in is my "
+    "of on our provided result results summary the these this to answer answers "
+    "with".split()
+)
+
+# Keys of the MOF fields in JSON answers, lowercased without non-alphanumeric characters
+_FIELD_ALIASES = {
+    "name": ("name", "mof", "mofname", "material", "materialname"),
+    "stability": ("stability", "waterstability", "predictedstability"),
+    "score": ("score", "probabilityscore", "probability", "confidence"),
+    "justification": (
+        "justification",
+        "justifications",
+        "sentences",
+        "exactsentences",
+        "evidence",
+    ),
+    "DOI": ("doi", "paperdoi"),
+}
+_FIELDS = {alias: field for field, aliases in _FIELD_ALIASES.items() for alias in aliases}
+# Keywords of the headers of the numbered layout, checked in this order
+_HEADER_KEYWORDS = (
+    ("DOI", ("doi",)),
+    ("score", ("score", "probab", "confidence", "certain")),
+    ("justification", ("sentence", "justif", "evidence")),
+    ("stability", ("stabil",)),
+)
+_FIELDS_BY_NUMBER = {"1": "stability", "2": "score", "3": "justification", "4": "DOI"}
+
+
+def _json_candidates(text):
+    """Yield the substrings of an answer that may be a JSON document."""
+    yield from _FENCED_BLOCK.findall(text)
+    for opening, closing in ("{}", "[]"):
+        start, end = text.find(opening), text.rfind(closing)
+        if start != -1 and end > start:
+            yield text[start : end + 1]
+
+
+def _load_json(candidate):
+    """Load a JSON document, repairing smart quotes, trailing commas and Python literals."""
+    try:
+        return json.loads(candidate, strict=False)
+    except json.JSONDecodeError:
+        pass
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate.translate(_SMART_QUOTES))
+    try:
+        return json.loads(repaired, strict=False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(repaired)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _normalize_stability(value):
+    value = str(value).lower()
+    if "not provided" in value or "unknown" in value or "not mentioned" in value:
+        return "Not provided"
+    if "unstable" in value or "not stable" in value or "instab" in value:
+        return "Unstable"
+    if "stable" in value:
+        return "Stable"
+    return None
+
+
+def _parse_score(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        score, percent = float(value), False
+    else:
+        match = _NUMBER.search(str(value))
+        if match is None:
+            return None
+        score, percent = float(match.group(1)), bool(match.group(2))
+    if percent or 1 < score <= 100:
+        score /= 100
+    return score if 0 <= score <= 1 else None
+
+
+def _mof_items(data):
+    """Return the list of MOF dictionaries of a JSON answer, whatever its layout."""
+    if isinstance(data, dict):
+        lists = [v for v in data.values() if isinstance(v, list)]
+        if len(data) == 1 and len(lists) == 1:
+            # {"MOFs": [...]}, whatever the key
+            data = lists[0]
+        elif any(_FIELDS.get(re.sub(r"\W|_", "", str(k).lower())) == "name" for k in data):
+            data = [data]
+        elif data and all(isinstance(v, dict) for v in data.values()):
+            # MOF names as keys
+            data = [{"name": name, **value} for name, value in data.items()]
+    if not isinstance(data, list):
+        return None
+    return [item for item in data if isinstance(item, dict)]
+
+
+def _normalize_mof(item, doi, mof_name):
+    """Map the keys of a MOF dictionary to the `MOF` fields, or return None."""
+    mof = {}
+    for key, value in item.items():
+        field = _FIELDS.get(re.sub(r"\W|_", "", str(key).lower()))
+        if field is not None and field not in mof:
+            mof[field] = value
+    mof.setdefault("name", mof_name)
+    if mof["name"] is None or "stability" not in mof or "score" not in mof:
+        return None
+    mof["score"] = _parse_score(mof["score"])
+    if mof["score"] is None:
+        return None
+    justification = mof.get("justification", "Not provided")
+    if isinstance(justification, list):
+        justification = " ".join(str(sentence) for sentence in justification)
+    mof["justification"] = str(justification)
+    mof["DOI"] = str(mof.get("DOI") or doi)
+    mof["name"] = str(mof["name"])
+    mof["stability"] = str(mof["stability"])
+    return mof
+
+
+def _field_from_header(header):
+    header = header.lower()
+    for field, keywords in _HEADER_KEYWORDS:
+        if any(keyword in header for keyword in keywords):
+            return field
+    return None
+
+
+def _is_name_like(line):
+    """
+    Whether a line can be the name of a MOF: a few words, none of them a sentence word, with
+    a digit or an uppercase letter after the first character, e.g. "MOF-5" or "HKUST-1".
+    """
+    words = line.split()
+    if not words or len(words) > 4 or len(line) > 40:
+        return False
+    if any(re.sub(r"\W", "", word).lower() in _SENTENCE_WORDS for word in words):
+        return False
+    return any(c.isdigit() for c in line) or any(c.isupper() for c in line[1:])
+
+
+def _parse_numbered_layout(text, doi, mof_name):
+    """
+    Parse the "1. stability / 2. score / 3. sentences / 4. DOI" layout of the prompts, either
+    in one block per MOF (after a "MOF-5:" or "Name: MOF-5" line), or with one "- MOF-5:
+    value" bullet per MOF under each numbered item. Returns the list of MOF dictionaries.
+
+    Only "Name: MOF-5" lines and name-like lines (see `_is_name_like`) start a block, other
+    header lines such as "Here is my answer:" are skipped. Name-like lines do not replace an
+    explicit `mof_name`. Items outside of any block are dropped, so an answer whose MOF is
+    unknown gives no MOF.
+    """
+    records = {}
+    current = mof_name  # MOF of the current block
+    pending = None  # name header waiting for the first item of its block
+    field = None
+
+    def add(name, field, value):
+        value = value.strip().strip('"').strip()
+        if name is None or not value:
+            return
+        record = records.setdefault(name, {"name": name})
+        if field == "justification" and field in record:
+            record[field] += " " + value
+        else:
+            record.setdefault(field, value)
+
+    for line in text.splitlines():
+        bold = line.strip().startswith("**")
+        line = line.replace("**", "").strip()
+        if not line:
+            continue
+        item = _NUMBERED_ITEM.match(line)
+        bullet = _BULLET.match(line)
+        name_header = _NAME_HEADER.match(line)
+        if item:
+            number, content = item.groups()
+            header, colon, value = content.partition(":")
+            field = (colon and _field_from_header(header)) or _FIELDS_BY_NUMBER[number]
+            if not (colon and _field_from_header(header)):
+                value = content
+            if field == "stability" and pending is not None:
+                current, pending = pending, None
+        elif bullet and _field_from_header(bullet.group(1)):
+            field = _field_from_header(bullet.group(1))
+            value = bullet.group(2)
+            if field == "stability" and pending is not None:
+                current, pending = pending, None
+        elif bullet and field is not None and field != "DOI" and bullet.group(2):
+            add(bullet.group(1), field, bullet.group(2))
+            continue
+        elif name_header:
+            pending, field = name_header.group(1).strip(), None
+            continue
+        elif (bold or line.endswith(":") or bullet) and len(line) < 80:
+            candidate = line.lstrip("-*#\u2022 ").rstrip(":").strip()
+            if mof_name is None and _is_name_like(candidate):
+                pending, field = candidate, None
+            continue
+        elif field is not None:
+            value = line
+        else:
+            continue
+        if field == "DOI":
+            match = _DOI.search(value)
+            doi = match.group(0).rstrip(".,;)") if match else doi
+        else:
+            add(current, field, value)
+
+    mofs = []
+    for record in records.values():
+        stability = _normalize_stability(record.get("stability", ""))
+        if stability is None:
+            return None
+        record["stability"] = stability
+        record.setdefault("DOI", doi)
+        mofs.append(record)
+    return mofs
+
+
+def repair_answer(result, mof_name=None):
+    """
+    Parse an answer that is not a valid MOF list locally, without calling an LLM.
+
+    JSON documents are searched in fenced code blocks and in the text, and repaired (smart
+    quotes, trailing commas, single-quoted Python literals). Their keys are matched with the
+    MOF fields by name ("water stability", "probability score", "sentences", ...). Answers
+    in the numbered layout of the prompts are parsed line by line.
+
+    Parameters:
+    - result (str): The answer to parse.
+    - mof_name (str): Name of the MOF the answer is about, used when the answer does not
+                      name it, e.g. for the answers of `recheck_justification`. Defaults to None.
+
+    Returns:
+    - list: The MOF dictionaries, with the fields of the `MOF` model, or None if the answer
+            could not be parsed.
+    """
+    doi_match = _DOI.search(result)
+    doi = doi_match.group(0).rstrip(".,;)") if doi_match else "Not provided"
+    for candidate in _json_candidates(result):
+        items = _mof_items(_load_json(candidate))
+        if items:
+            mofs = [_normalize_mof(item, doi, mof_name) for item in items]
+            if all(mofs):
+                return mofs
+    records = _parse_numbered_layout(result, doi, mof_name)
+    if records:
+        mofs = [_normalize_mof(record, doi, mof_name) for record in records]
+        if all(mofs):
+            return mofs
+    return None
+
+
+@lru_cache(maxsize=None)
+def _format_instructions():
+    return PydanticOutputParser(pydantic_object=MOFList).get_format_instructions()
+
+
+class _MOFListOutputParser(PydanticOutputParser):
+    """`PydanticOutputParser` of `MOFList` with format instructions built once."""
+
+    def get_format_instructions(self):
+        return _format_instructions()
+
+
+class MOFParser:
+    """
+    Parser of LLM answers into MOF dictionaries, reusable across answers and papers.
+
+    The MOF schema is compiled once for the module, and the output fixing parser and its
+    LLM client are created on first use and shared by every answer. Each answer is parsed
+    by the cheapest of three tiers that succeeds:
+    - "strict": the answer is a JSON document valid for the MOF list model.
+    - "repair": the answer is parsed locally by `repair_answer`.
+    - "llm": the answer is reshaped by the output fixing LLM.
+
+    Attributes:
+    cache : BaseCache
+        LLM response cache used by the output fixing LLM.
+    client_pool : LLMClientPool
+        Pool the output fixing LLM is taken from. Defaults to the process-wide pool.
+    model_name : str
+        Model of the output fixing LLM. Defaults to "gpt-4".
+    rate_limiter : TokenBucket
+        Rate limiter of the output fixing LLM calls, which are retried like the other LLM
+        calls, see `call_with_retry`. Defaults to None.
+    """
+
+    def __init__(self, cache=None, client_pool=None, model_name="gpt-4", rate_limiter=None):
+        self.cache = cache
+        self.client_pool = client_pool
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+        self._llm_parser = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm_parser(self):
+        """The output fixing parser, created on first use."""
+        with self._lock:
+            if self._llm_parser is None:
+                client_pool = self.client_pool or get_default_client_pool()
+                self._llm_parser = OutputFixingParser.from_llm(
+                    parser=_MOFListOutputParser(pydantic_object=MOFList),
+                    llm=client_pool.get(self.model_name, temperature=0, cache=self.cache),
+                )
+            return self._llm_parser
+
+    @staticmethod
+    def _validate_strict(results):
+        """Validate the answers that are JSON documents in one call, or return None."""
+        parsed = [None] * len(results)
+        loaded, indices = [], []
+        for i, result in enumerate(results):
+            try:
+                loaded.append(json.loads(result, strict=False))
+                indices.append(i)
+            except (json.JSONDecodeError, TypeError):
+                pass
+        while loaded:
+            try:
+                mof_lists = _MOF_LISTS.validate_python(loaded)
+            except ValidationError as e:
+                # Drop the invalid answers and validate the others again
+                invalid = {error["loc"][0] for error in e.errors()}
+                loaded = [data for j, data in enumerate(loaded) if j not in invalid]
+                indices = [i for j, i in enumerate(indices) if j not in invalid]
+                continue
+            for i, mof_list in zip(indices, mof_lists):
+                parsed[i] = mof_list
+            break
+        return parsed
+
+    def _fix(self, result):
+        # Check if result is a valid JSON string
+        try:
+            json.loads(result, strict=False)
+        except json.JSONDecodeError:
+            # If not, convert it to a valid JSON string
+            result = json.dumps({"dummy_key": result})
+        # Try parsing the result using the enhanced parser
+        try:
+            return call_with_retry(
+                self.llm_parser.parse, result, rate_limiter=self.rate_limiter
+            )
+        except ValueError as e:
+            raise ValueError(f"Failed to parse MOF: {e}")
+
+    @staticmethod
+    def _to_dict(mof_list, paper_id):
+        # Construct a dictionary with MOFs' details using comprehension
+        return {
+            mof.name: {
+                "Predicted Stability": mof.stability,
+                "Score": mof.score,
+                "Justification": mof.justification,
+                "DOI": mof.DOI,
+                "Paper id": paper_id,
+            }
+            for mof in mof_list.MOFs
+        }
+
+    def parse_many(self, results, paper_ids, mof_names=None):
+        """
+        Parse many answers. The answers that are valid JSON are validated in one call, and
+        the others are repaired locally or reshaped by the same output fixing LLM.
+
+        Parameters:
+        - results (list): The answers to parse.
+        - paper_ids (list or str/int): The paper ID of each answer, or one paper ID for all.
+        - mof_names (list): Name of the MOF each answer is about, used by the repair tier
+                            when the answer does not name it. Defaults to None.
+
+        Returns:
+        - list: For each answer, a tuple of the dictionary returned by `parse_to_dict` and the
+                tier that parsed the answer.
+
+        Raises:
+        - ValueError: If there's an issue while parsing an answer.
+        """
+        results = list(results)
+        if isinstance(paper_ids, (str, int)):
+            paper_ids = [paper_ids] * len(results)
+        mof_names = mof_names or [None] * len(results)
+        parsed = []
+        for result, paper_id, mof_name, mof_list in zip(
+            results, paper_ids, mof_names, self._validate_strict(results)
+        ):
+            tier = "strict"
+            if mof_list is None:
+                tier = "repair"
+                mofs = repair_answer(result, mof_name=mof_name)
+                try:
+                    mof_list = MOFList(MOFs=mofs) if mofs is not None else None
+                except ValidationError:
+                    mof_list = None
+            if mof_list is None:
+                tier = "llm"
+                mof_list = self._fix(result)
+            parsed.append((self._to_dict(mof_list, paper_id), tier))
+        return parsed
+
+    def parse(self, result, paper_id, mof_name=None):
+        """
+        Parse one answer, see `parse_many`.
+
+        Returns:
+        - tuple: The dictionary returned by `parse_to_dict`, and the tier that parsed the answer.
+        """
+        return self.parse_many([result], [paper_id], [mof_name])[0]
+
+
+# Parsers are only registered while they are in use, e.g. by an `EunomiaTools` instance,
+# so the registry does not keep their caches and pools alive
+_mof_parsers = weakref.WeakValueDictionary()
+_default_mof_parser = None
+_mof_parsers_lock = threading.Lock()
+
+
+def get_mof_parser(cache=None, client_pool=None, rate_limiter=None):
+    """
+    Return the shared `MOFParser` of an LLM cache, client pool and rate limiter, creating it
+    if it is not in use.
+
+    The parser of the process-wide pool without a cache or rate limiter is kept for the life
+    of the process. The other parsers are shared while they are referenced, and are released
+    with them.
+
+    Parameters:
+    - cache (BaseCache): LLM response cache used by the output fixing LLM. Defaults to None.
+    - client_pool (LLMClientPool): Pool the output fixing LLM is taken from. Defaults to the
+                                   process-wide pool.
+    - rate_limiter (TokenBucket): Rate limiter of the output fixing LLM. Defaults to None.
+
+    Returns:
+    - MOFParser: The parser.
+    """
+    global _default_mof_parser
+    with _mof_parsers_lock:
+        if cache is None and client_pool is None and rate_limiter is None:
+            if _default_mof_parser is None:
+                _default_mof_parser = MOFParser()
+            return _default_mof_parser
+        # A registered parser holds references to its cache, pool and limiter, so their ids
+        # are not reused while it is registered
+        key = (id(cache), id(client_pool), id(rate_limiter))
+        parser = _mof_parsers.get(key)
+        if parser is None:
+            parser = _mof_parsers[key] = MOFParser(
+                cache=cache, client_pool=client_pool, rate_limiter=rate_limiter
+            )
+        return parser
+
+
+class IncrementalMOFParser:
+    """
+    Parser of an answer that is still being generated, e.g. streamed by `stream_retrieval_qa`.
+
+    `feed` scans the new text for JSON objects inside an array, and returns every MOF record
+    as soon as its object is complete, so downstream steps can start before the end of the
+    answer. `close` parses the whole answer with a `MOFParser` and returns the records that
+    were not found while streaming, e.g. for answers in the numbered layout.
+
+    Attributes:
+    paper_id : str/int
+        The ID of the paper, added to the records.
+    parser : MOFParser
+        Parser of the complete answer. Defaults to the shared parser of `get_mof_parser`.
+    mof_name : str
+        Name of the MOF the answer is about, if the answer may not name it.
+    text : str
+        The text fed so far.
+    records : dict
+        The records found so far, in the format of `parse_to_dict`.
+    tier : str
+        Tier of the complete answer once closed (see `PARSE_TIERS`), or "stream" if only the
+        records found while streaming could be parsed.
+    """
+
+    def __init__(self, paper_id, parser=None, mof_name=None):
+        self.paper_id = paper_id
+        self.parser = parser if parser is not None else get_mof_parser()
+        self.mof_name = mof_name
+        self.text = ""
+        self.records = {}
+        self.tier = None
+        self._position = 0
+        self._stack = []  # open brackets and their positions
+        self._in_string = False
+        self._escape = False
+
+    def _record(self, candidate):
+        data = _load_json(candidate)
+        mof = _normalize_mof(data, "Not provided", self.mof_name) if isinstance(data, dict) else None
+        if mof is None:
+            return None
+        try:
+            record = MOFParser._to_dict(MOFList(MOFs=[mof]), self.paper_id)
+        except ValidationError:
+            return None
+        name = mof["name"]
+        if name in self.records:
+            return None
+        self.records[name] = record[name]
+        return name, record[name]
+
+    def feed(self, chunk):
+        """
+        Add a chunk of the answer.
+
+        Returns:
+        - list: The (name, record) tuples of the MOFs completed by the chunk.
+        """
+        self.text += chunk
+        text, new = self.text, []
+        for i in range(self._position, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char in "{[":
+                self._stack.append((char, i))
+            elif char in "}]" and self._stack:
+                opening, start = self._stack.pop()
+                # Objects in an array, e.g. the items of "MOFs"
+                if opening == "{" and self._stack and self._stack[-1][0] == "[":
+                    record = self._record(text[start : i + 1])
+                    if record is not None:
+                        new.append(record)
+            elif char == '"' and self._stack:
+                # Quotes only delimit strings inside JSON, not in the text around it
+                self._in_string = True
+        self._position = len(text)
+        return new
+
+    def close(self):
+        """
+        Parse the complete answer.
+
+        Returns:
+        - list: The (name, record) tuples of the MOFs that were not returned by `feed`.
+
+        Raises:
+        - ValueError: If there's an issue while parsing the answer and no record was found
+                      while streaming.
+        """
+        try:
+            parsed, self.tier = self.parser.parse(
+                self.text, self.paper_id, mof_name=self.mof_name
+            )
+        except ValueError:
+            if not self.records:
+                raise
+            parsed, self.tier = {}, "stream"
+        new = [(name, record) for name, record in parsed.items() if name not in self.records]
+        self.records.update(new)
+        return new
+
+
+def parse_answer(result, paper_id, cache=None, client_pool=None, mof_name=None):
+    """
+    Parses the given result into a structured dictionary format, and reports how.
+
+    The result is parsed by the shared `MOFParser` of the cache and client pool, with the
+    cheapest of its "strict", "repair" and "llm" tiers that succeeds.
+
+    Parameters:
+    - result (str): The result string to be parsed.
+    - paper_id (str/int): The ID associated with a particular research paper or source.
+    - cache (BaseCache): LLM response cache used by the output fixing LLM. Defaults to None.
+    - client_pool (LLMClientPool): Pool the output fixing LLM is taken from. Defaults to the
+                                   process-wide pool.
+    - mof_name (str): Name of the MOF the answer is about, used by the repair tier when the
+                      answer does not name it. Defaults to None.
+
+    Returns:
+    - tuple: The dictionary returned by `parse_to_dict`, and the tier that parsed the result.
+
+    Raises:
+    - ValueError: If there's an issue while parsing the result.
+    """
+    return get_mof_parser(cache, client_pool).parse(result, paper_id, mof_name=mof_name)
+
+
+def parse_to_dict(result, paper_id, cache=None, client_pool=None, mof_name=None):
     """
     Parses the given result into a structured dictionary format.
 
-    This function first defines the data model for MOF (Metal-Organic Framework)
-    using the Pydantic library. It then parses the result using a parser
-    tailored for the MOF model, and finally, it constructs a dictionary with
-    MOF names as keys and other MOF details as values.
+    The result is validated against the `MOFList` Pydantic model by the shared
+    `MOFParser`, and a dictionary is constructed with MOF names as keys and other MOF
+    details as values. Answers that are not valid JSON are repaired locally when
+    possible, and by an LLM otherwise, see `parse_answer`.
 
     Parameters:
     - result (str): The result string to be parsed.
     - paper_id (str/int): The ID associated with a particular research paper or source.
+    - cache (BaseCache): LLM response cache used by the output fixing LLM. Defaults to None.
+    - client_pool (LLMClientPool): Pool the output fixing LLM is taken from. Defaults to the
+                                   process-wide pool.
+    - mof_name (str): Name of the MOF the answer is about, if the answer may not name it.
+                      Defaults to None.
 
     Returns:
     - dict: A dictionary containing MOFs' names as keys and their details (predicted
@@ -31,57 +668,6 @@ def parse_to_dict(result, paper_id):
     >>> paper_id = "12345"
     >>> parsed_dict = parse_to_dict(result, paper_id)
     """
-
-    class MOF(BaseModel):
-        """Pydantic data model for a Metal-Organic Framework (MOF)."""
-
-        name: str = Field(description="name of a MOF")
-        stability: str = Field(
-            description="choose only one: stable or unstable or not provided"
-        )
-        score: float = Field(description="probability score of prediction")
-        justification: str = Field(description="justification for prediction")
-        DOI: str = Field(description="DOI of the paper")
-
-    class MOFList(BaseModel):
-        """Pydantic data model for a list of MOFs."""
-
-        MOFs: List[MOF]
-
-    # Initialize a Pydantic output parser for the MOF list model
-    parser = PydanticOutputParser(pydantic_object=MOFList)
-
-    # Enhance the parser with capabilities to handle specific LLM outputs
-    llm_parser = OutputFixingParser.from_llm(
-        parser=parser, llm=ChatOpenAI(temperature=0, model="gpt-4")
-    )
-
-    # Check if result is a valid JSON string
-    try:
-        json.loads(result, strict=False)
-    except json.JSONDecodeError:
-        # If not, convert it to a valid JSON string
-        result = json.dumps({"dummy_key": result})
-    # Try parsing the result using the enhanced parser
-    try:
-        parsed_result = llm_parser.parse(result)
-    except ValueError as e:
-        raise ValueError(f"Failed to parse MOF: {e}")
-
-    # Construct a dictionary with MOFs' details using comprehension
-    dict_response = {
-        mof.name: {
-            "Predicted Stability": mof.stability,
-            "Score": mof.score,
-            "Justification": mof.justification,
-            "DOI": mof.DOI,
-        }
-        for mof in parsed_result.MOFs
-    }
-
-    # Update the dictionary to include the paper id for each MOF
-    new_dict = {
-        key: {**value, "Paper id": paper_id} for key, value in dict_response.items()
-    }
-
-    return new_dict
+    return parse_answer(
+        result, paper_id, cache=cache, client_pool=client_pool, mof_name=mof_name
+    )[0]
@@ -44,3 +44,47 @@ WATER_STABILITY_PROMPT = f"""
       than once sentence. This should be "Not provided" if you cannot find water stability.
     4. Paper's DOI. This should be "Not provided" if you cannot find.
     """
+
+# Answer format of the prompts that ask about several MOFs at once
+MOF_LIST_ANSWER_FORMAT = """
+                Answer with one entry for every MOF above, keeping its name unchanged, in the format
+                {"MOFs": [{"name": ..., "stability": ..., "score": ..., "justification": ...}]}
+                """
+
+# Prompt of `EunomiaTools.eval_justification`, for one MOF (mofs="MOF", each_mof="that MOF",
+# answer_format="") or several MOFs (mofs="MOFs", each_mof="each MOF",
+# answer_format=MOF_LIST_ANSWER_FORMAT)
+EVAL_JUSTIFICATION_PROMPT = """
+                Do the below sentences actually talk about water stability of the found {mofs}?
+                If not, try to find a better justification for {each_mof} in the document.
+
+                {justifications}
+
+                To do this, you should check on steep uptakes, solubility in water,
+                change in properties after
+                  being exposed to water/steam, change in crystallinity, or mention of
+                  water stability in the sentence.
+                If the justification can somehow imply water stability/instability, update
+                "Water stability" to Stable/Unstable
+                  but lower your "Probability score".
+                Do not make up answers.
+                Do not consider chemical or thermal stability or stability in air as a valid reason.
+                {answer_format}"""
+
+# Prompt of `EunomiaTools.recheck_justification`, for one MOF (mofs=name, its="its",
+# for_each="", answer_format="") or several MOFs (mofs="the following MOFs: ...",
+# its="their", for_each=" for each MOF", answer_format=MOF_LIST_ANSWER_FORMAT)
+RECHECK_JUSTIFICATION_PROMPT = """
+            You are an expert chemist. The document describes the water stability properties of {mofs}.
+
+            Use the following rules to determine {its} water stability:
+            {rules}
+
+            Your final answer should contain the following{for_each}:
+            1. The water stability of the MOF.
+            2. The probability score ranging between [0, 1]. This probability score shows
+            how certain you are in your answer.
+            3. The exact sentences without any changes from the document that justifies your decision.
+              Try to find more than once sentence.
+            This should be "Not provided" if you cannot find water stability.
+            {answer_format}"""
@@ -0,0 +1,209 @@
+import random
+import re
+import threading
+import time
+
+# Error classes returned by `classify_error`.
+CONTEXT_LENGTH = "context_length"
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+FATAL = "fatal"
+UNKNOWN = "unknown"
+
+_CONTEXT_LENGTH_MESSAGES = (
+    "context_length_exceeded",
+    "maximum context length",
+    "context length",
+    "too many tokens",
+    "reduce the length",
+)
+_RATE_LIMIT_MESSAGES = ("rate limit", "rate_limit", "too many requests")
+_TRANSIENT_MESSAGES = (
+    "timed out",
+    "timeout",
+    "connection error",
+    "connection reset",
+    "server error",
+    "overloaded",
+)
+# HTTP status codes are only matched as whole numbers, e.g. not in "document 15030"
+_RATE_LIMIT_STATUS = re.compile(r"\b429\b")
+_TRANSIENT_STATUS = re.compile(r"\b50[234]\b")
+
+
+def classify_error(error):
+    """
+    Classify an exception raised by an LLM call.
+
+    OpenAI errors are classified by their type and error code. Any other exception is
+    classified by its type, its HTTP `status_code` if it has one, and by searching its
+    message for known phrases and status codes.
+
+    Parameters:
+    - error (Exception): The exception raised by the LLM call.
+
+    Returns:
+    - str: One of `CONTEXT_LENGTH` (the prompt does not fit, shrink the context),
+           `RATE_LIMIT` (429, back off and retry), `TRANSIENT` (timeouts, connection and
+           server errors, back off and retry), `FATAL` (authentication, permission, quota
+           or unknown model, retrying cannot help) or `UNKNOWN`.
+    """
+    try:
+        import openai
+    except ImportError:
+        openai = None
+
+    code = getattr(error, "code", None)
+    if openai is not None:
+        if isinstance(error, openai.RateLimitError):
+            return FATAL if code == "insufficient_quota" else RATE_LIMIT
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            return TRANSIENT
+        if isinstance(error, openai.InternalServerError):
+            return TRANSIENT
+        if isinstance(
+            error,
+            (
+                openai.AuthenticationError,
+                openai.PermissionDeniedError,
+                openai.NotFoundError,
+            ),
+        ):
+            return FATAL
+        if isinstance(error, openai.BadRequestError) and code == "context_length_exceeded":
+            return CONTEXT_LENGTH
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if status_code in (502, 503, 504):
+        return TRANSIENT
+
+    message = str(error).lower()
+    if any(m in message for m in _CONTEXT_LENGTH_MESSAGES):
+        return CONTEXT_LENGTH
+    if any(m in message for m in _RATE_LIMIT_MESSAGES) or _RATE_LIMIT_STATUS.search(message):
+        return RATE_LIMIT
+    if any(m in message for m in _TRANSIENT_MESSAGES) or _TRANSIENT_STATUS.search(message):
+        return TRANSIENT
+    return UNKNOWN
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    The bucket holds up to `capacity` tokens and is refilled at `rate` tokens per
+    second. Every request takes one token and waits until one is available, so bursts
+    of up to `capacity` requests go through immediately and the long-run request rate
+    is bounded by `rate`.
+
+    Attributes:
+    rate : float
+        Tokens added to the bucket per second.
+    capacity : float
+        Maximum number of tokens in the bucket.
+    """
+
+    def __init__(self, rate=3.0, capacity=10):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("Both 'rate' and 'capacity' must be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """
+        Take `tokens` tokens from the bucket, blocking until they are available.
+
+        Returns:
+        float
+            The time spent waiting, in seconds.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff for rate-limit and transient errors.
+
+    The n-th retry waits a random time between 0 and `min(max_delay, base_delay * 2**n)`
+    seconds ("full jitter"), or the server's `Retry-After` header if it asks for longer.
+
+    Attributes:
+    max_retries : int
+        Maximum number of retries of a single call.
+    base_delay : float
+        Upper bound of the first backoff, in seconds.
+    max_delay : float
+        Upper bound of any backoff, in seconds.
+    """
+
+    def __init__(self, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt, error=None):
+        """Return the number of seconds to wait before retry number `attempt` (from 0)."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after")
+        try:
+            delay = max(delay, min(self.max_delay, float(retry_after)))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+
+def call_with_retry(func, *args, rate_limiter=None, retry_policy=None, **kwargs):
+    """
+    Call `func(*args, **kwargs)` behind a rate limiter, retrying rate-limit and transient errors.
+
+    Rate-limit and transient errors (see `classify_error`) are retried with the jittered
+    exponential backoff of `retry_policy`. Every other error, including context-length
+    errors, is raised immediately so that the caller can decide how to react.
+
+    Parameters:
+    - func (callable): The function that calls the LLM.
+    - rate_limiter (TokenBucket): Limiter to take a token from before every attempt. Defaults to None.
+    - retry_policy (RetryPolicy): Backoff policy. Defaults to `RetryPolicy()`.
+
+    Returns:
+    - object: The return value of `func`.
+    """
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            error_class = classify_error(e)
+            if error_class not in (RATE_LIMIT, TRANSIENT) or attempt >= retry_policy.max_retries:
+                raise
+            delay = retry_policy.get_delay(attempt, e)
+            print(f"\n{error_class} error: {e}. Retrying in {delay:.1f} seconds...\n")
+            time.sleep(delay)
+            attempt += 1
@@ -1,10 +1,21 @@
+import json
 import os
+import threading
 
 import langchain
 
 import eunomia
 
-from .prompts import RULES, WATER_STABILITY_PROMPT
+from .cache import get_llm_cache
+from .clients import get_default_client_pool
+from .prompts import (
+    EVAL_JUSTIFICATION_PROMPT,
+    MOF_LIST_ANSWER_FORMAT,
+    RECHECK_JUSTIFICATION_PROMPT,
+    RULES,
+    WATER_STABILITY_PROMPT,
+)
+from .retry import TokenBucket, call_with_retry
 
 
 class EunomiaTools:
@@ -12,23 +23,116 @@ class EunomiaTools:
         self,
         vectorstore=None,
         tool_names=[],
+        rate_limiter=None,
+        cache=None,
+        llm=None,
+        k=9,
+        recheck_k=6,
+        min_k=2,
+        search_type="mmr",
+        fetch_k=50,
+        client_pool=None,
+        paper_id=None,
     ):
+        """
+        Parameters:
+        vectorstore : FAISS
+            Vector store of the document the tools read.
+        tool_names : List[str]
+            Names of the tools to create, see `EunomiaTools.all_tools_dict`.
+        rate_limiter : TokenBucket
+            Rate limiter shared by every LLM call of the tools. Rate-limit and transient
+            errors are retried with jittered exponential backoff behind it. Defaults to
+            a new `TokenBucket()`.
+        cache : bool, str or BaseCache
+            Persistent LLM response cache shared by every LLM call of the tools, see
+            `get_llm_cache`. Use True for an `LLMCache` in the default location.
+            Defaults to None (LangChain's global cache, if one is set).
+        llm : object
+            Language model used by the tools. Defaults to GPT-4 at temperature 0, taken
+            from `client_pool` on first use.
+        k : int
+            Initial number of documents retrieved by `read_doc`.
+        recheck_k : int
+            Initial number of documents retrieved by `recheck_justification`.
+        min_k : int
+            Minimum number of documents retrieved by the tools.
+        search_type : str
+            The type of search used to retrieve documents.
+        fetch_k : int
+            The number of documents passed to the search_type algorithm.
+        client_pool : LLMClientPool
+            Pool of shared LLM clients with keep-alive connections. Defaults to the pool
+            of the `Eunomia` agent the tools are given to, or to the process-wide pool.
+        paper_id : str
+            ID of the paper, written to the dataset by `create_dataset`.
+
+        The tools are bound to this instance, so several instances with different
+        vectorstores can be used at the same time from different threads or asyncio
+        tasks.
+        """
         self.vectorstore = vectorstore
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket()
+        self.llm_cache = get_llm_cache(cache)
+        self.llm = llm
+        self.k = k
+        self.recheck_k = recheck_k
+        self.min_k = min_k
+        self.search_type = search_type
+        self.fetch_k = fetch_k
+        self.client_pool = client_pool
+        self.paper_id = paper_id
+        self.parser = None
+        self._llm_lock = threading.Lock()
         self.all_tools = []
         for name in tool_names:
             tool_info = EunomiaTools.all_tools_dict.get(name, {})
             self.all_tools.append(
                 langchain.agents.Tool(
                     name=name,
-                    func=tool_info.get("function"),
+                    func=getattr(self, name, tool_info.get("function")),
                     description=(tool_info.get("description")),
                 )
             )
 
     def get_tools(self):
-        EunomiaTools.vectorstore = self.vectorstore
         return self.all_tools
 
+    def get_llm(self):
+        """Return the language model of the tools, creating the default one on first use."""
+        with self._llm_lock:
+            if self.llm is None:
+                client_pool = self.client_pool or get_default_client_pool()
+                # Retries are handled by call_with_retry
+                self.llm = client_pool.get(
+                    "gpt-4", temperature=0, request_timeout=1000, cache=self.llm_cache
+                )
+            return self.llm
+
+    def get_parser(self):
+        """Return the `MOFParser` of the LLM cache, client pool and rate limiter of the tools."""
+        with self._llm_lock:
+            if self.parser is None:
+                self.parser = eunomia.get_mof_parser(
+                    self.llm_cache, self.client_pool, self.rate_limiter
+                )
+            return self.parser
+
+    def _retrieval_qa(self, prompt, k):
+        return eunomia.RetrievalQABypassTokenLimit(
+            prompt,
+            self.vectorstore,
+            k=k,
+            min_k=self.min_k,
+            llm=self.get_llm(),
+            search_type=self.search_type,
+            fetch_k=self.fetch_k,
+            chain_type="stuff",
+            memory=None,
+            rate_limiter=self.rate_limiter,
+        )
+
+    @staticmethod
     def get_cif_from_COD(doi):
         """This tool downloads all the CIF files from Crystallography
           Open Database (COD) for a given input
@@ -105,6 +209,7 @@ class EunomiaTools:
             os.remove(zip_file_name)
         return str(os.listdir(unzip_dir))
 
+    @staticmethod
     def rename_cif(file_path):
         """
         Extract the MOF-Name associated with a target key from a CIF file and renames it.
@@ -133,6 +238,7 @@ class EunomiaTools:
                 if FileExistsError:
                     print("\nCIF file already exists.")
 
+    @staticmethod
     def get_cif_from_CCDC(doi):
         import os
 
@@ -214,89 +320,225 @@ class EunomiaTools:
         time.sleep(30)
         driver.quit()
 
-    def eval_justification(justification):
-        from langchain_openai import ChatOpenAI
+    def eval_justification(self, justification):
         from langchain.schema import HumanMessage
-        
-        model = "gpt-4"
-        prompt = f"""
-                Do the below sentences actually talk about water stability of the found MOF?
-                If not, try to find a better justification for that MOF in the document.
-
-                "{justification}"
-
-                To do this, you should check on steep uptakes, solubility in water,
-                change in properties after
-                  being exposed to water/steam, change in crystallinity, or mention of
-                  water stability in the sentence.
-                If the justification can somehow imply water stability/instability, update
-                "Water stability" to Stable/Unstable
-                  but lower your "Probability score".
-                Do not make up answers.
-                Do not consider chemical or thermal stability or stability in air as a valid reason.
-                """
+
+        prompt = EVAL_JUSTIFICATION_PROMPT.format(
+            mofs="MOF",
+            each_mof="that MOF",
+            justifications=f'"{justification}"',
+            answer_format="",
+        )
         messages = [HumanMessage(content=prompt)]
-        model = ChatOpenAI(
-            model_name=model,  # 'gpt-3.5-turbo' or 'gpt-4'
-            temperature=0,  # Control the randomness of the model's responses
-            request_timeout=1000,  # Timeout setting (if needed)
+        response = call_with_retry(
+            self.get_llm().invoke, messages, rate_limiter=self.rate_limiter
+        )
+        return getattr(response, "content", response)
+
+    def _justification_batch_prompt(self, records):
+        return EVAL_JUSTIFICATION_PROMPT.format(
+            mofs="MOFs",
+            each_mof="each MOF",
+            justifications="\n".join(json.dumps(record) for record in records),
+            answer_format=MOF_LIST_ANSWER_FORMAT,
+        )
+
+    def batch_justifications(self, records, token_budget=None):
+        """
+        Split MOF records into batches that fit in one `eval_justification_batch` call.
+
+        Parameters:
+        - records (list): MOF records, as dictionaries with the "name", "stability", "score"
+                          and "justification" keys of the answer of `read_doc`.
+        - token_budget (int): Maximum number of tokens of the records of a batch. Defaults to
+                              half of the context window left by the instructions, since the
+                              answer repeats every record.
+
+        Returns:
+        - list: The batches of records, in their original order. A record larger than the
+                budget is put in its own batch.
+        """
+        model_name = eunomia.get_model_name(self.get_llm())
+        if token_budget is None:
+            instructions = eunomia.count_tokens(
+                self._justification_batch_prompt([]), model_name
+            )
+            token_budget = (eunomia.get_context_window(model_name) - instructions) // 2
+        batches, batch, batch_tokens = [], [], 0
+        for record in records:
+            tokens = eunomia.count_tokens(json.dumps(record), model_name) + 1
+            if batch and batch_tokens + tokens > token_budget:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(record)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def eval_justification_batch(self, records):
+        """
+        Check the justifications of several MOFs in one LLM call, see `eval_justification`.
+
+        Parameters:
+        - records (list): MOF records, as dictionaries with the "name", "stability", "score"
+                          and "justification" keys of the answer of `read_doc`.
+
+        Returns:
+        - str: The answer of the LLM. A single record is checked with the prompt of
+               `eval_justification`, so both give the same answer.
+        """
+        if len(records) == 1:
+            return self.eval_justification(json.dumps(records[0]))
+        from langchain.schema import HumanMessage
+
+        messages = [HumanMessage(content=self._justification_batch_prompt(records))]
+        response = call_with_retry(
+            self.get_llm().invoke, messages, rate_limiter=self.rate_limiter
         )
-        response = model(messages)
-        return response.content
-
-    def read_doc(input):
-        from langchain_openai import ChatOpenAI
-        k = 9
-        min_k = 2  # Minimum limit for k
-        llm = ChatOpenAI(temperature=0, model_name="gpt-4")
-        result = eunomia.RetrievalQABypassTokenLimit(
+        return getattr(response, "content", response)
+
+    @staticmethod
+    def match_verdicts(records, parsed):
+        """
+        Match the MOFs of a parsed justification check with the checked records.
+
+        Parameters:
+        - records (list): The checked MOF records, with their "name".
+        - parsed (dict): The parsed answer of the check, as returned by `parse_to_dict`.
+
+        Returns:
+        - dict: MOF names and their updated "Predicted Stability", "Score" and
+                "Justification". The MOFs missing from the answer are left out, unless a
+                single MOF was checked and the answer has a single MOF.
+        """
+        verdicts = {}
+        for record in records:
+            name = record["name"]
+            if name in parsed:
+                new = parsed[name]
+            elif len(records) == 1 and len(parsed) == 1:
+                new = next(iter(parsed.values()))
+            else:
+                continue
+            verdicts[name] = {
+                key: new[key] for key in ("Predicted Stability", "Score", "Justification")
+            }
+        return verdicts
+
+    def eval_justifications(self, records, token_budget=None):
+        """
+        Check the justifications of all the MOFs of a paper, in as few LLM calls as the
+        token budget allows.
+
+        Parameters:
+        - records (list): MOF records, as dictionaries with the "name", "stability", "score"
+                          and "justification" keys of the answer of `read_doc`.
+        - token_budget (int): Maximum number of tokens of the records of a call, see
+                              `batch_justifications`.
+
+        Returns:
+        - dict: MOF names and their updated "Predicted Stability", "Score" and
+                "Justification", see `match_verdicts`.
+        """
+        verdicts = {}
+        for batch in self.batch_justifications(records, token_budget):
+            answer = self.eval_justification_batch(batch)
+            parsed, _ = self.get_parser().parse(
+                answer,
+                self.paper_id,
+                mof_name=batch[0]["name"] if len(batch) == 1 else None,
+            )
+            verdicts.update(EunomiaTools.match_verdicts(batch, parsed))
+        return verdicts
+
+    def read_doc(self, input):
+        return self._retrieval_qa(WATER_STABILITY_PROMPT, self.k)
+
+    def read_doc_stream(self, input):
+        """Streaming version of `read_doc`, which yields the answer chunk by chunk. The answer is not cached."""
+        return eunomia.stream_retrieval_qa(
             WATER_STABILITY_PROMPT,
-            EunomiaTools.vectorstore,
-            k=k,
-            min_k=min_k,
-            llm=llm,
-            search_type="mmr",
-            fetch_k=50,
-            chain_type="stuff",
-            memory=None,
+            self.vectorstore,
+            k=self.k,
+            min_k=self.min_k,
+            llm=self.get_llm(),
+            search_type=self.search_type,
+            fetch_k=self.fetch_k,
+            rate_limiter=self.rate_limiter,
         )
-        return result
-
-    def recheck_justification(MOF_name):
-        input_prompt = f"""
-            You are an expert chemist. The document describes the water stability properties of {MOF_name}.
-
-            Use the following rules to determine its water stability:
-            {RULES}
-
-            Your final answer should contain the following:
-            1. The water stability of the MOF.
-            2. The probability score ranging between [0, 1]. This probability score shows
-            how certain you are in your answer.
-            3. The exact sentences without any changes from the document that justifies your decision.
-              Try to find more than once sentence.
-            This should be "Not provided" if you cannot find water stability.
-            """
-        k = 6
-        min_k = 2  # Minimum limit for k
-        from langchain_openai import ChatOpenAI
-        llm = ChatOpenAI(temperature=0, model_name="gpt-4")
-        result = eunomia.RetrievalQABypassTokenLimit(
-            input_prompt,
-            EunomiaTools.vectorstore,
-            k=k,
-            min_k=min_k,
-            llm=llm,
-            search_type="mmr",
-            fetch_k=50,
-            chain_type="stuff",
-            memory=None,
+
+    @staticmethod
+    def _recheck_prompt(MOF_name):
+        return RECHECK_JUSTIFICATION_PROMPT.format(
+            mofs=MOF_name, its="its", rules=RULES, for_each="", answer_format=""
         )
-        return result
 
-    def create_dataset(answer):
-        parsed_result = eunomia.parse_to_dict(answer)
-        results_index_path = "dataset.csv"
+    @staticmethod
+    def _recheck_batch_prompt(MOF_names):
+        if len(MOF_names) == 1:
+            return EunomiaTools._recheck_prompt(MOF_names[0])
+        return RECHECK_JUSTIFICATION_PROMPT.format(
+            mofs=f"the following MOFs: {', '.join(MOF_names)}",
+            its="their",
+            rules=RULES,
+            for_each=" for each MOF",
+            answer_format=MOF_LIST_ANSWER_FORMAT,
+        )
+
+    def recheck_justification(self, MOF_name):
+        return self._retrieval_qa(self._recheck_prompt(MOF_name), self.recheck_k)
+
+    def recheck_justifications(self, MOF_names, max_context_tokens=None, return_info=False):
+        """
+        Read the document again for several MOFs, see `recheck_justification`.
+
+        The chunks of the MOFs are retrieved with shared query embedding requests, the chunks
+        shared by several MOFs are stuffed only once, and the MOFs are asked about together in
+        as few LLM calls as the context window allows, see `batch_retrieval_qa`.
+
+        Parameters:
+        - MOF_names (list): The names of the MOFs.
+        - max_context_tokens (int): Context window of the LLM. Defaults to the known context
+                                    window of its model.
+        - return_info (bool): If True, also return the number of vectorstore queries and of
+                              LLM calls, in total and per batch.
+
+        Returns:
+        - list: (MOF names, answer) pairs, one per batch of MOFs. A batch with a single MOF is
+                asked with the prompt of `recheck_justification`. The answer is None if the
+                chunks of the MOFs do not fit in the context window.
+        - dict: Only returned if `return_info` is True, see `batch_retrieval_qa`.
+        """
+        MOF_names = list(MOF_names)
+        results, info = eunomia.batch_retrieval_qa(
+            [self._recheck_prompt(name) for name in MOF_names],
+            lambda indices: self._recheck_batch_prompt([MOF_names[i] for i in indices]),
+            self.vectorstore,
+            k=self.recheck_k,
+            min_k=self.min_k,
+            llm=self.get_llm(),
+            search_type=self.search_type,
+            fetch_k=self.fetch_k,
+            max_context_tokens=max_context_tokens,
+            rate_limiter=self.rate_limiter,
+        )
+        results = [([MOF_names[i] for i in indices], answer) for indices, answer in results]
+        return (results, info) if return_info else results
+
+    def create_dataset(self, answer):
+        parsed_result, _ = self.get_parser().parse(answer, self.paper_id)
+        EunomiaTools.write_dataset(parsed_result)
+
+    @staticmethod
+    def write_dataset(parsed_result, results_index_path="dataset.csv"):
+        """
+        Write the MOFs of a paper to a csv dataset.
+
+        Parameters:
+        - parsed_result (dict): MOF names and their details, as returned by `parse_to_dict`.
+        - results_index_path (str): Path of the csv file. Defaults to "dataset.csv".
+        """
         import pandas as pd
 
         list_of_dicts = []
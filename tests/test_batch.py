@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""Tests for `eunomia` package."""
+
+import asyncio
+import time
+import unittest
+
+from langchain_community.embeddings import FakeEmbeddings
+
+import eunomia
+
+
+def slow_pipeline(paper_id, vectorstore):
+    """Fake pipeline standing in for an LLM call with a fixed latency."""
+    time.sleep(0.2)
+    if paper_id == "bad":
+        raise ValueError("unparsable answer")
+    return {"paper": paper_id, "chunks": vectorstore.index.ntotal}
+
+
+async def async_pipeline(paper_id, vectorstore):
+    await asyncio.sleep(0.2)
+    return paper_id
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """Fake embeddings recording the number of papers indexed."""
+
+    indexed: list = []
+
+    def embed_documents(self, texts):
+        self.indexed.append(texts)
+        return super().embed_documents(texts)
+
+
+def make_papers(n):
+    return {
+        f"paper{i}": [eunomia.Document(page_content=f"MOF-{i} is stable in water.")]
+        for i in range(n)
+    }
+
+
+class TestBatch(unittest.TestCase):
+    index_kwargs = {"embedding": FakeEmbeddings(size=8), "cache_dir": None}
+
+    def _timed_run(self, papers, pipeline, max_concurrency):
+        start = time.perf_counter()
+        results, failures = eunomia.run_batch(
+            papers,
+            pipeline=pipeline,
+            max_concurrency=max_concurrency,
+            index_kwargs=self.index_kwargs,
+        )
+        return results, failures, time.perf_counter() - start
+
+    def test_throughput_scales_with_concurrency(self):
+        papers = make_papers(8)
+        results, failures, sequential = self._timed_run(papers, slow_pipeline, 1)
+        self.assertEqual(len(results), 8)
+        self.assertEqual(failures, {})
+        results, failures, concurrent = self._timed_run(papers, slow_pipeline, 4)
+        self.assertEqual(len(results), 8)
+        self.assertGreater(sequential / concurrent, 2.5)
+
+        _, _, concurrent = self._timed_run(papers, async_pipeline, 8)
+        self.assertLess(concurrent, 0.2 * 8 / 3)
+
+    def test_failures_do_not_stop_the_batch(self):
+        papers = make_papers(3)
+        papers["bad"] = papers["paper0"]
+        papers["broken"] = "test_files/missing.xyz"
+        results, failures, _ = self._timed_run(papers, slow_pipeline, 2)
+        self.assertEqual(sorted(results), ["paper0", "paper1", "paper2"])
+        self.assertEqual(results["paper1"], {"paper": "paper1", "chunks": 1})
+        self.assertEqual(sorted(failures), ["bad", "broken"])
+        self.assertIsInstance(failures["bad"], ValueError)
+
+    def test_papers_loaded_ahead_are_bounded(self):
+        embedding = CountingEmbeddings(size=8)
+        finished = []
+        loaded_ahead = []
+
+        def pipeline(paper_id, vectorstore):
+            loaded_ahead.append(len(embedding.indexed) - len(finished))
+            time.sleep(0.05)
+            finished.append(paper_id)
+
+        results, failures = eunomia.run_batch(
+            make_papers(12),
+            pipeline=pipeline,
+            max_concurrency=1,
+            index_kwargs={"embedding": embedding, "cache_dir": None},
+        )
+        self.assertEqual(failures, {})
+        self.assertEqual(len(embedding.indexed), 12)
+        # at most 2 * max_concurrency papers are indexed before their pipeline ends
+        self.assertLessEqual(max(loaded_ahead), 2)
+
+    def test_load_files(self):
+        results, failures = eunomia.run_batch(
+            {"txt": "test_files/test_docs.txt", "pdf": "test_files/test_docs.pdf"},
+            pipeline=slow_pipeline,
+            process_kwargs={"chunk_size": 1000, "chunk_overlap": 20},
+            index_kwargs=self.index_kwargs,
+            load_workers=2,
+        )
+        self.assertEqual(failures, {})
+        self.assertEqual(sorted(results), ["pdf", "txt"])
+        self.assertGreater(results["txt"]["chunks"], 1)
+
+    def test_paper_ids_of_a_list(self):
+        chunks = make_papers(1)["paper0"]
+        self.assertEqual(
+            eunomia.batch._paper_ids(["a/paper.pdf", "b/paper.pdf", "c/other.txt", chunks]),
+            ["a/paper", "b/paper", "other", 3],
+        )
+        with self.assertRaises(ValueError):
+            eunomia.batch._paper_ids(["a/paper.pdf", "a/paper.pdf"])
+
+        # files with the same name in different directories are all processed
+        results, failures = eunomia.run_batch(
+            ["test_files/test_docs.txt", "test_files/../test_files/test_docs.txt"],
+            pipeline=slow_pipeline,
+            process_kwargs={"chunk_size": 1000, "chunk_overlap": 20},
+            index_kwargs=self.index_kwargs,
+            load_workers=1,
+        )
+        self.assertEqual(failures, {})
+        self.assertEqual(
+            sorted(results), ["test_files/../test_files/test_docs", "test_files/test_docs"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
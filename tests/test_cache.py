@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""Tests for `eunomia` package."""
+
+import os
+import tempfile
+import unittest
+
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+from langchain_openai import ChatOpenAI
+
+import eunomia
+
+
+def generations(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "llm_cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_cached_chat_model(self):
+        cache = eunomia.LLMCache(self.path)
+        llm = FakeListChatModel(responses=["first", "second"], cache=cache)
+        self.assertEqual(llm.invoke("prompt").content, "first")
+        self.assertEqual(llm.invoke("prompt").content, "first")
+        self.assertEqual(llm.invoke("other prompt").content, "second")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertEqual(stats["entries"], 2)
+
+    def test_persistent_across_runs(self):
+        llm_string = ChatOpenAI(
+            model_name="gpt-4",
+            temperature=0,
+            openai_api_key="sk-test",
+            cache=eunomia.LLMCache(self.path),
+        )._get_llm_string()
+        eunomia.LLMCache(self.path).update("prompt", llm_string, generations("answer"))
+
+        # a new client with another cache object and retry setting hits the same entry
+        rerun_cache = eunomia.LLMCache(self.path)
+        llm_string = ChatOpenAI(
+            model_name="gpt-4",
+            temperature=0,
+            openai_api_key="sk-test",
+            max_retries=0,
+            cache=rerun_cache,
+        )._get_llm_string()
+        self.assertEqual(
+            rerun_cache.lookup("prompt", llm_string)[0].message.content, "answer"
+        )
+        self.assertIsNone(rerun_cache.lookup("other prompt", llm_string))
+
+    def test_nonzero_temperature_is_not_cached(self):
+        cache = eunomia.LLMCache(self.path)
+        llm_string = ChatOpenAI(
+            model_name="gpt-4", temperature=0.7, openai_api_key="sk-test"
+        )._get_llm_string()
+        cache.update("prompt", llm_string, generations("answer"))
+        self.assertIsNone(cache.lookup("prompt", llm_string))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_eviction(self):
+        cache = eunomia.LLMCache(self.path)
+        cache.update("a", "fake", generations("answer a"))
+        cache.max_size_bytes = cache.stats()["size_bytes"]
+        cache.update("b", "fake", generations("answer b"))
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertIsNone(cache.lookup("a", "fake"))
+        self.assertIsNotNone(cache.lookup("b", "fake"))
+
+        cache = eunomia.LLMCache(self.path, max_age=-1)
+        self.assertIsNone(cache.lookup("b", "fake"))
+
+
+if __name__ == "__main__":
+    unittest.main()
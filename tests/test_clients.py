@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""Tests for `eunomia` package."""
+
+import gc
+import json
+import tempfile
+import threading
+import unittest
+import warnings
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_openai import ChatOpenAI
+
+import eunomia
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "stub answer"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Keep-alive stub of the chat completions endpoint that counts connections."""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    requests = 0
+
+    def setup(self):
+        super().setup()
+        StubOpenAIHandler.connections += 1
+
+    def do_POST(self):
+        StubOpenAIHandler.requests += 1
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLLMClientPool(unittest.TestCase):
+    calls_per_paper = 12
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        StubOpenAIHandler.connections = 0
+        StubOpenAIHandler.requests = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fewer_connections_per_paper(self):
+        # one client per tool call, as the tools used to do
+        for _ in range(self.calls_per_paper):
+            llm = ChatOpenAI(
+                model_name="gpt-4", openai_api_key="sk-test", openai_api_base=self.base_url
+            )
+            self.assertEqual(llm.invoke("prompt").content, "stub answer")
+        unpooled = StubOpenAIHandler.connections
+
+        StubOpenAIHandler.connections = 0
+        pool = eunomia.LLMClientPool(
+            openai_api_key="sk-test", openai_api_base=self.base_url
+        )
+        for i in range(self.calls_per_paper):
+            llm = pool.get("gpt-4", temperature=0 if i % 2 else 0.1)
+            self.assertEqual(llm.invoke("prompt").content, "stub answer")
+        pooled = StubOpenAIHandler.connections
+        pool.close()
+
+        self.assertEqual(StubOpenAIHandler.requests, 2 * self.calls_per_paper)
+        self.assertEqual(unpooled, self.calls_per_paper)
+        self.assertEqual(pooled, 1)
+
+    def test_registry_and_concurrency(self):
+        pool = eunomia.LLMClientPool(
+            max_concurrency={"gpt-4": 2},
+            openai_api_key="sk-test",
+            openai_api_base=self.base_url,
+        )
+        self.assertIs(pool.get("gpt-4"), pool.get("gpt-4"))
+        self.assertIsNot(pool.get("gpt-4"), pool.get("gpt-4", temperature=0.5))
+        self.assertEqual(pool.get_concurrency("gpt-4"), 2)
+        self.assertEqual(pool.get_concurrency("gpt-3.5-turbo"), 10)
+
+        llm = pool.get("gpt-4")
+        threads = [threading.Thread(target=llm.invoke, args=("prompt",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(StubOpenAIHandler.requests, 8)
+        self.assertLessEqual(StubOpenAIHandler.connections, 2)
+        pool.close()
+
+    def test_clients_of_cache_objects(self):
+        pool = eunomia.LLMClientPool(
+            openai_api_key="sk-test", openai_api_base=self.base_url
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/llm_cache.sqlite"
+            cache = eunomia.LLMCache(path)
+            other_cache = eunomia.LLMCache(path, max_age=1)
+            llm = pool.get("gpt-4", cache=cache)
+            self.assertIs(pool.get("gpt-4", cache=cache), llm)
+            # caches on the same file are different configurations
+            self.assertIs(pool.get("gpt-4", cache=other_cache).cache, other_cache)
+
+            # the pool does not keep the caches alive
+            cache_ref = weakref.ref(cache)
+            del cache, other_cache, llm
+            gc.collect()
+            self.assertIsNone(cache_ref())
+        pool.close()
+
+    def test_tools_use_agent_pool(self):
+        pool = eunomia.LLMClientPool(
+            openai_api_key="sk-test", openai_api_base=self.base_url
+        )
+        eunomia_tools = eunomia.EunomiaTools(tool_names=["eval_justification"])
+        agent = eunomia.Eunomia(tools=eunomia_tools.get_tools(), client_pool=pool)
+        self.assertIs(eunomia_tools.client_pool, pool)
+        self.assertEqual(
+            eunomia_tools.eval_justification("MOF-5 is stable"), "stub answer"
+        )
+        self.assertEqual(StubOpenAIHandler.requests, 1)
+        # the agent and the tools share the HTTP connection pool of the model
+        self.assertIs(
+            agent.llm.http_client, eunomia_tools.get_llm().http_client
+        )
+        pool.close()
+
+    def test_tools_use_agent_cache(self):
+        pool = eunomia.LLMClientPool(
+            openai_api_key="sk-test", openai_api_base=self.base_url
+        )
+        eunomia_tools = eunomia.EunomiaTools(tool_names=["eval_justification"])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # the agent's calls at temperature 0.1 are not cached, which is reported
+            with self.assertWarns(UserWarning):
+                agent = eunomia.Eunomia(
+                    tools=eunomia_tools.get_tools(),
+                    client_pool=pool,
+                    cache=f"{tmp_dir}/llm_cache.sqlite",
+                )
+            self.assertIs(eunomia_tools.llm_cache, agent.llm_cache)
+            for _ in range(2):
+                self.assertEqual(
+                    eunomia_tools.eval_justification("MOF-5 is stable"), "stub answer"
+                )
+            self.assertEqual(StubOpenAIHandler.requests, 1)
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                eunomia.Eunomia(
+                    tools=eunomia_tools.get_tools(),
+                    client_pool=pool,
+                    cache=agent.llm_cache,
+                    temp=0,
+                )
+        pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
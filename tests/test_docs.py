@@ -2,11 +2,33 @@
 
 """Tests for `eunomia` package."""
 
+import os
+import pickle
+import shutil
+import tempfile
+import tracemalloc
 import unittest
+from unittest import mock
+
+from langchain_community.embeddings import FakeEmbeddings
 
 import eunomia
 
 
+class CountingEmbeddings(FakeEmbeddings):
+    """Fake embeddings that record the texts sent to the embedding model."""
+
+    embedded: list = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+class OtherEmbeddings(CountingEmbeddings):
+    """Another embedding class, with the same model name."""
+
+
 class TestDocs(unittest.TestCase):
     def test_loadDocs(self):
         import nltk
@@ -57,6 +79,287 @@ class TestDocs(unittest.TestCase):
             doc_pages[-1].page_content.split()[-2:] == test_results[1]
         ), "Test fails for text_input."
 
+    def test_keyword_filtering(self):
+        pages = [
+            eunomia.Document(page_content="Introduction. As shown in the references [1].", metadata={"page": 0}),
+            eunomia.Document(page_content="MOF-5 is stable.\nReferences\n[1] Yaghi", metadata={"page": 1}),
+            eunomia.Document(page_content="[2] Kitagawa\n5. References:\n[3] Férey", metadata={"page": 2}),
+            eunomia.Document(page_content="Acknowledgments", metadata={"page": 3}),
+        ]
+        doc = eunomia.LoadDoc(text_input="unused")
+        filtered = doc.filter_documents(pages, ["ACKNOWLEDGMENTS", "references "])
+        self.assertEqual(len(filtered), 1)
+        self.assertEqual(filtered[0].page_content, "Introduction. As shown in the")
+        self.assertEqual(pages[0].page_content[-4:], "[1].")
+
+        matcher = eunomia.KeywordMatcher(["references"], occurrence="last", heading=True)
+        filtered = doc.filter_documents(pages, matcher)
+        self.assertEqual([d.metadata["page"] for d in filtered], [0, 1, 2])
+        self.assertIs(filtered[0], pages[0])
+        self.assertEqual(filtered[2].page_content, "[2] Kitagawa")
+        self.assertEqual(eunomia.LoadDoc.cut_text("a\nReferences\nb", matcher), "a")
+        # lowercasing "İ" adds a character, the index still refers to the original text
+        self.assertEqual(eunomia.KeywordMatcher(["references"]).search("İ References"), 2)
+
+        doc.pages = pages
+        chunks = list(doc.lazy_process(matcher))
+        self.assertEqual([d.page_content for d in chunks], [d.page_content for d in filtered])
+        self.assertEqual(doc.filter_documents(pages, []), pages)
+
+    def test_text_splitter_registry(self):
+        splitter = eunomia.get_text_splitter("fixed-size", 1000, 20)
+        self.assertIs(eunomia.get_text_splitter("fixed-size", 1000, 20), splitter)
+        self.assertIsNot(eunomia.get_text_splitter("fixed-size", 1000, 0), splitter)
+        self.assertIsNone(eunomia.get_text_splitter("spacy", None))
+
+        spacy_splitter = eunomia.get_text_splitter("spacy", 200, 0, pipeline="sentencizer")
+        self.assertIs(
+            eunomia.get_text_splitter("spacy", 200, 0, pipeline="sentencizer"), spacy_splitter
+        )
+        pages = [
+            eunomia.Document(
+                page_content=" ".join(f"MOF-{i}{j} is stable in water." for j in range(20)),
+                metadata={"page": i},
+            )
+            for i in range(5)
+        ]
+        batched = list(eunomia.split_documents(spacy_splitter, pages, batch_size=2))
+        self.assertGreater(len(batched), len(pages))
+        self.assertEqual(batched, spacy_splitter.split_documents(pages))
+
+    def test_token_chunking(self):
+        doc = eunomia.LoadDoc(file_name="test_files/test_docs.pdf")
+        chunks = doc.process(chunk_size=100, chunk_overlap=10, chunking_type="tokens")
+        self.assertGreater(len(chunks), len(doc.pages))
+        for chunk in chunks:
+            self.assertEqual(chunk.metadata["tokenizer"], "cl100k_base")
+            self.assertLessEqual(chunk.metadata["tokens"], 100)
+            self.assertLessEqual(eunomia.count_tokens(chunk.page_content), chunk.metadata["tokens"])
+        self.assertIn("page", chunks[0].metadata)
+        self.assertEqual(
+            list(eunomia.split_documents(eunomia.get_text_splitter("tokens", 100, 10), doc.pages)),
+            chunks,
+        )
+
+        # multi-byte characters are not split at the edges of the windows
+        text = " ".join(
+            f"Cu\u2083(BTC)\u2082 sample {i} shows the \U0001d6fc-phase at 3.2 \u00c5."
+            for i in range(40)
+        )
+        for chunk_overlap in (0, 5):
+            splitter = eunomia.TiktokenTextSplitter(20, chunk_overlap)
+            split = splitter.split_text(text)
+            self.assertGreater(len(split), 10)
+            self.assertFalse(any("\ufffd" in chunk for chunk in split))
+        self.assertEqual("".join(eunomia.TiktokenTextSplitter(20).split_text(text)), text)
+
+        # packing reuses the recorded counts instead of tokenizing again
+        chunks[1].metadata["tokens"] = 10000
+        packed, chunk_tokens = eunomia.pack_documents(chunks, 250)
+        self.assertEqual(len(packed), 1)
+        self.assertEqual(chunk_tokens, [chunks[0].metadata["tokens"]])
+
+    def test_lazy_loading(self):
+        filter_words = ["references ", "acknowledgement", "acknowledgments", "references\n"]
+        process_kwargs = dict(filter_words=filter_words, chunk_size=1000, chunk_overlap=20)
+        for e in ["csv", "pdf"]:
+            eager = eunomia.LoadDoc(file_name=f"test_files/test_docs.{e}")
+            lazy = eunomia.LoadDoc(file_name=f"test_files/test_docs.{e}", lazy=True)
+            self.assertIsNone(lazy.pages)
+            self.assertEqual(lazy.process(**process_kwargs), eager.process(**process_kwargs))
+
+        # text files are read in pages, with the same content up to the cut
+        eager = eunomia.LoadDoc(file_name="test_files/test_docs.txt")
+        lazy = eunomia.LoadDoc(file_name="test_files/test_docs.txt", lazy=True)
+        eager_text = " ".join(" ".join(d.page_content for d in eager.process(filter_words)).split())
+        chunks = lazy.lazy_process(filter_words, chunk_size=1000, chunk_overlap=0)
+        self.assertNotIsInstance(chunks, list)
+        lazy_text = " ".join(" ".join(d.page_content for d in chunks).split())
+        self.assertEqual(lazy_text, eager_text)
+        self.assertEqual(lazy_text.split()[-2:], ["thermospheric", "models."])
+
+    def test_load_corpus(self):
+        process_kwargs = dict(chunk_size=1000, chunk_overlap=20)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for i in range(3):
+                shutil.copy("test_files/test_docs.pdf", f"{tmp_dir}/paper{i}.pdf")
+            os.mkdir(f"{tmp_dir}/si")
+            shutil.copy("test_files/test_docs.txt", f"{tmp_dir}/si/paper0.txt")
+            with open(f"{tmp_dir}/broken.pdf", "w") as f:
+                f.write("not a pdf")
+
+            corpus = eunomia.LoadCorpus(tmp_dir, max_workers=2)
+            self.assertEqual(len(corpus.file_names), 5)
+            self.assertIn(os.path.join(tmp_dir, "si", "paper0"), corpus.file_names)
+            results = corpus.process(**process_kwargs)
+            self.assertEqual(list(corpus.errors), ["broken"])
+            self.assertEqual(len(results), 4)
+            expected = eunomia.LoadDoc(file_name="test_files/test_docs.pdf").process(
+                **process_kwargs
+            )
+            self.assertEqual(
+                [d.page_content for d in results["paper1"]],
+                [d.page_content for d in expected],
+            )
+
+            corpus = eunomia.LoadCorpus([f"{tmp_dir}/paper*.pdf", f"{tmp_dir}/si"])
+            self.assertEqual(len(corpus.file_names), 4)
+
+    def test_document_cache(self):
+        process_kwargs = dict(chunk_size=1000, chunk_overlap=20)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = shutil.copy("test_files/test_docs.pdf", f"{tmp_dir}/paper.pdf")
+            cache = eunomia.DocumentCache(f"{tmp_dir}/documents.sqlite")
+            cold = eunomia.LoadDoc(file_name=file_name, cache=cache).process(**process_kwargs)
+            self.assertEqual(cache.stats()["entries"], 1)
+
+            # warm loads, also of a renamed copy, do not parse the PDF
+            copy_name = shutil.copy(file_name, f"{tmp_dir}/copy.pdf")
+            with mock.patch("pypdf.PdfReader", side_effect=AssertionError):
+                warm = eunomia.LoadDoc(file_name=file_name, cache=cache).process(
+                    **process_kwargs
+                )
+                copy = eunomia.LoadDoc(file_name=copy_name, cache=cache).process(
+                    **process_kwargs
+                )
+            self.assertEqual(warm, cold)
+            self.assertEqual(copy[0].metadata, {"source": copy_name, "page": 0})
+            self.assertEqual(cache.stats()["hits"], 2)
+
+            eunomia.LoadDoc(file_name=file_name, cache=cache).process(chunk_size=500)
+            self.assertEqual(cache.stats()["entries"], 2)
+            cache.invalidate(file_name)
+            self.assertEqual(cache.stats()["entries"], 0)
+
+            # least recently used entries are evicted over the size limit
+            cache = pickle.loads(pickle.dumps(cache))
+            eunomia.LoadDoc(file_name=file_name, cache=cache).process(**process_kwargs)
+            cache.max_size_bytes = cache.stats()["size_bytes"]
+            eunomia.LoadDoc(file_name=file_name, cache=cache).process(chunk_size=500)
+            self.assertEqual(cache.stats()["entries"], 1)
+            misses = cache.misses
+            eunomia.LoadDoc(file_name=file_name, cache=cache).process(**process_kwargs)
+            self.assertEqual(cache.misses, misses + 1)
+
+    def test_jats_loader(self):
+        doc = eunomia.LoadDoc(file_name="test_files/test_docs.xml")
+        sections = [(d.metadata["section_type"], d.metadata["section"]) for d in doc.pages]
+        self.assertEqual(
+            sections,
+            [
+                ("title", ""),
+                ("abstract", "Abstract"),
+                ("body", "Introduction"),
+                ("body", "Results"),
+                ("body", "Results > Water stability"),
+                ("table_caption", "Results > Water stability"),
+                ("body", "Results > Water stability"),
+                ("figure_caption", "Results > Water stability"),
+                ("table_caption", "Results > Water stability"),
+            ],
+        )
+        text = " ".join(d.page_content for d in doc.pages)
+        self.assertIn("porous materials [1]. Many references", text)
+        dropped_texts = ("beamline", "Yaghi", "conflicts", "Unstable", "Journal of", "SECRETCELL")
+        for dropped in dropped_texts:
+            self.assertNotIn(dropped, text)
+        self.assertEqual(doc.pages[8].metadata["label"], "Table 1")
+        # a table nested in a paragraph is yielded as a caption, and removed from the paragraph
+        self.assertEqual(doc.pages[5].page_content, "Table 2 Uptake data of MOF-5.")
+        self.assertEqual(doc.pages[6].page_content, "MOF-5 lost its porosity after one day.")
+
+        # memory does not grow with the size of the file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = f"{tmp_dir}/large.xml"
+            with open(file_name, "w") as f:
+                f.write("<article><body>")
+                for i in range(4000):
+                    f.write(f"<sec><title>Section {i}</title>")
+                    f.write(f"<p>MOF-{i} is <italic>stable</italic> in water. </p>" * 20)
+                    f.write("</sec>")
+                f.write("</body><back><ref-list>")
+                f.write("<ref><mixed-citation>Yaghi, O. M.</mixed-citation></ref>" * 20000)
+                f.write("</ref-list></back></article>")
+            self.assertGreater(os.path.getsize(file_name), 5 * 2**20)
+            tracemalloc.start()
+            n_sections = sum(1 for _ in eunomia.JATSLoader(file_name).lazy_load())
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(n_sections, 4000)
+            self.assertLess(peak, 2**20)
+
+    def test_deduplicate_documents(self):
+        abstract = (
+            "The water stability of metal-organic frameworks is assessed from PXRD patterns "
+            "and nitrogen sorption isotherms measured before and after immersion in water "
+            "for seven days at room temperature."
+        )
+        chunks = [eunomia.Document(page_content=abstract, metadata={"page": 0})]
+        chunks += [
+            eunomia.Document(
+                page_content=f"MOF-{i} was synthesized from zinc nitrate and linker {i}.",
+                metadata={"page": 1},
+            )
+            for i in range(3)
+        ]
+        chunks += [
+            eunomia.Document(page_content=abstract.upper(), metadata={"page": 5}),
+            eunomia.Document(page_content=abstract + " Conclusions.", metadata={"page": 6}),
+        ]
+        kept, report = eunomia.deduplicate_documents(chunks, threshold=0.8)
+        self.assertEqual([d.page_content for d in kept], [c.page_content for c in chunks[:4]])
+        self.assertEqual(kept[0].metadata["duplicates"], [{"page": 5}, {"page": 6}])
+        self.assertNotIn("duplicates", chunks[0].metadata)
+        self.assertEqual(report["chunks"], 6)
+        self.assertEqual(report["removed_chunks"], 2)
+        self.assertEqual(
+            report["removed_tokens"],
+            sum(eunomia.count_document_tokens(d, "gpt-4") for d in chunks[4:]),
+        )
+
+        doc = eunomia.LoadDoc(text_input="\n\n".join([abstract] * 4))
+        sliced_text = doc.process(chunk_size=len(abstract) + 1, dedup_threshold=0.9)
+        self.assertEqual(len(sliced_text), 1)
+        self.assertEqual(doc.dedup_report["removed_chunks"], 3)
+
+    def test_build_vectorstore(self):
+        chunks = [
+            eunomia.Document(page_content=f"MOF-{i} is stable in water.")
+            for i in range(20)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            embedding = CountingEmbeddings(size=16)
+            kwargs = dict(
+                embedding=embedding,
+                model_name="fake-embedding",
+                cache_dir=f"{tmp_dir}/embeddings",
+                index_path=f"{tmp_dir}/index",
+            )
+            first = eunomia.build_vectorstore(chunks, **kwargs)
+            self.assertEqual(len(embedding.embedded), len(chunks))
+
+            # re-indexing only embeds the changed chunk, with the same vectors as before
+            chunks[0].page_content += " changed"
+            second = eunomia.build_vectorstore(chunks, **kwargs)
+            self.assertEqual(len(embedding.embedded), len(chunks) + 1)
+            self.assertEqual(
+                first.index.reconstruct(1).tolist(), second.index.reconstruct(1).tolist()
+            )
+
+            loaded = eunomia.load_vectorstore(f"{tmp_dir}/index", embedding=embedding)
+            self.assertEqual(loaded.index.ntotal, len(chunks))
+
+            # embeddings of another model or class do not read the cached vectors
+            eunomia.build_vectorstore(chunks, **{**kwargs, "model_name": "other-embedding"})
+            self.assertEqual(len(embedding.embedded), 2 * len(chunks) + 1)
+            other = OtherEmbeddings(size=16)
+            eunomia.build_vectorstore(chunks, **{**kwargs, "embedding": other})
+            self.assertEqual(len(other.embedded), len(chunks))
+
+            # the cache cannot be namespaced without a model name
+            with self.assertRaises(ValueError):
+                eunomia.build_vectorstore(chunks, **{**kwargs, "model_name": None})
+
 
 if __name__ == "__main__":
     unittest.main()
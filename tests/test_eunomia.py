@@ -2,12 +2,197 @@
 
 """Tests for `eunomia` package."""
 
+import random
+import time
 import unittest
+from typing import Any, List
+
+import httpx
+import openai
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.llms import LLM
 
 import eunomia
 
 
+class FakeLLM(LLM):
+    """LLM that replays a list of responses and records the prompts it received.
+    Exceptions in `responses` are raised instead of returned."""
+
+    responses: List[Any] = ["fake answer"]
+    prompts: List[str] = []
+    model_name: str = "gpt-4"
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(prompt)
+        response = self.responses[min(len(self.prompts), len(self.responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """Fake embeddings that count how many queries were embedded."""
+
+    query_count: int = 0
+
+    def embed_query(self, text):
+        self.query_count += 1
+        return super().embed_query(text)
+
+
+class CountingFAISS(FAISS):
+    """FAISS vectorstore that counts its searches."""
+
+    searches = 0
+
+    def similarity_search(self, *args, **kwargs):
+        self.searches += 1
+        return super().similarity_search(*args, **kwargs)
+
+    def max_marginal_relevance_search(self, *args, **kwargs):
+        self.searches += 1
+        return super().max_marginal_relevance_search(*args, **kwargs)
+
+
+def make_vectorstore(n_docs=20, words_per_doc=300):
+    texts = [
+        " ".join(f"paper{i} word{j}" for j in range(words_per_doc // 2))
+        for i in range(n_docs)
+    ]
+    return CountingFAISS.from_texts(texts, CountingEmbeddings(size=32))
+
+
+def pairwise_match_MOF_names(prediction_dict, ground_truth_dict, threshold=80):
+    """Reference implementation of `match_MOF_names` comparing every pair of keys."""
+    from fuzzywuzzy import fuzz
+
+    combined_dict, matched_pairs, unmatched_pairs = {}, [], []
+    matched_ground_truth_keys = set()
+    for key_1, value_1 in prediction_dict.items():
+        matched_key, highest_similarity = None, 0
+        best_key, best_similarity = None, 0
+        for key_2 in ground_truth_dict.keys():
+            similarity = fuzz.token_sort_ratio(key_1, key_2)
+            if similarity > threshold and similarity > best_similarity:
+                best_key, best_similarity = key_2, similarity
+            if key_2 in matched_ground_truth_keys:
+                continue
+            if similarity > threshold and similarity > highest_similarity:
+                matched_key, highest_similarity = key_2, similarity
+        if matched_key is not None:
+            combined_dict[key_1] = {**value_1, **ground_truth_dict[matched_key]}
+            matched_pairs.append((key_1, matched_key))
+            matched_ground_truth_keys.add(matched_key)
+        else:
+            unmatched_pairs.append((key_1, best_key))
+    return combined_dict, matched_pairs, unmatched_pairs
+
+
+def random_MOF_names(rng, n):
+    prefixes = ["", "Zn-", "Cu-", "bio-", "Bio-", "Al-", "UiO-", "Ni₂-", "é-"]
+    stems = ["MOF", "MIL", "ZIF", "HKUST", "PCN", "NU", "IRMOF", "CAU"]
+    suffixes = ["", "(Cr)", "(Al)", "-NH2", "b", " (activated)", "'", "--"]
+    names = []
+    for _ in range(n):
+        name = (
+            rng.choice(prefixes)
+            + rng.choice(stems)
+            + "-"
+            + str(rng.randint(1, 120))
+            + rng.choice(suffixes)
+        )
+        names.append(rng.choice([name, name.upper(), " ".join(reversed(name.split("-")))]))
+    return names + ["", "-", "MOF"]
+
+
 class TestGeneral(unittest.TestCase):
+    def test_match_MOF_names_equivalence(self):
+        rng = random.Random(0)
+        for threshold in (0, 50, 70, 80, 90.5, 100):
+            prediction_dict = {
+                name: {"Predicted Stability": "Stable"} for name in random_MOF_names(rng, 150)
+            }
+            ground_truth_dict = {
+                name: {"Ground-truth Stability": "Stable"}
+                for name in random_MOF_names(rng, 150)
+            }
+            self.assertEqual(
+                eunomia.match_MOF_names(prediction_dict, ground_truth_dict, threshold),
+                pairwise_match_MOF_names(prediction_dict, ground_truth_dict, threshold),
+            )
+
+    def test_match_MOF_names_optimal(self):
+        prediction_dict = {
+            "MOF-5b": {"Predicted Stability": "Stable", "Paper id": "1"},
+            "MOF-74": {"Predicted Stability": "Unstable", "Paper id": "1"},
+            "ZIF-8": {"Predicted Stability": "Stable", "Paper id": "2"},
+            "UiO-66": {"Predicted Stability": "Stable", "Paper id": "3"},
+        }
+        ground_truth_dict = {
+            "MOF-5": {"Ground-truth Stability": "Stable", "Paper id": "1"},
+            "MOF-505": {"Ground-truth Stability": "Unstable", "Paper id": "1"},
+            "ZIF-8": {"Ground-truth Stability": "Stable", "Paper id": "1"},
+            "UiO-66": {"Ground-truth Stability": "Stable", "Paper id": "3"},
+        }
+        # greedy: "MOF-5b" takes "MOF-5", and "MOF-74" is not similar enough to "MOF-505"
+        _, matched_pairs, unmatched_pairs = eunomia.match_MOF_names(
+            prediction_dict, ground_truth_dict, threshold=70
+        )
+        self.assertEqual(
+            matched_pairs,
+            [("MOF-5b", "MOF-5"), ("ZIF-8", "ZIF-8"), ("UiO-66", "UiO-66")],
+        )
+        self.assertEqual(unmatched_pairs, [("MOF-74", "MOF-5")])
+
+        # optimal: the total similarity is maximal, and papers are matched separately
+        combined_dict, matched_pairs, unmatched_pairs = eunomia.match_MOF_names(
+            prediction_dict, ground_truth_dict, threshold=70, method="optimal"
+        )
+        self.assertEqual(
+            matched_pairs,
+            [("MOF-5b", "MOF-505"), ("MOF-74", "MOF-5"), ("UiO-66", "UiO-66")],
+        )
+        self.assertEqual(unmatched_pairs, [("ZIF-8", None)])
+        self.assertEqual(combined_dict["MOF-74"]["Ground-truth Stability"], "Stable")
+
+        # optimal matching never has a lower total similarity than greedy matching
+        rng = random.Random(1)
+        prediction_dict = {
+            name: {"Paper id": str(rng.randint(1, 5))} for name in random_MOF_names(rng, 100)
+        }
+        ground_truth_dict = {
+            name: {"Paper id": str(rng.randint(1, 5))} for name in random_MOF_names(rng, 100)
+        }
+
+        def total_similarity(matched_pairs):
+            return sum(eunomia.MOFNameIndex([b]).scores(a, -1)[1][0] for a, b in matched_pairs)
+
+        _, optimal_pairs, _ = eunomia.match_MOF_names(
+            prediction_dict, ground_truth_dict, threshold=60, method="optimal"
+        )
+        for key_1, key_2 in optimal_pairs:
+            self.assertEqual(
+                prediction_dict[key_1]["Paper id"], ground_truth_dict[key_2]["Paper id"]
+            )
+        same_paper = {
+            paper_id: eunomia.match_MOF_names(
+                {k: v for k, v in prediction_dict.items() if v["Paper id"] == paper_id},
+                {k: v for k, v in ground_truth_dict.items() if v["Paper id"] == paper_id},
+                threshold=60,
+            )[1]
+            for paper_id in "12345"
+        }
+        greedy_pairs = [pair for pairs in same_paper.values() for pair in pairs]
+        self.assertGreaterEqual(total_similarity(optimal_pairs), total_similarity(greedy_pairs))
+        with self.assertRaises(ValueError):
+            eunomia.match_MOF_names(prediction_dict, ground_truth_dict, method="hungarian")
+
     def test_match_MOF_names(self):
         # Sample test data
         ground_truth_dict = {
@@ -94,5 +279,176 @@ class TestGeneral(unittest.TestCase):
         self.assertNotIn(("MOF-74", "Bio-MOF-13"), matched_pairs)
 
 
+class TestRetrievalQA(unittest.TestCase):
+    def test_token_budget_calls_llm_once(self):
+        llm = FakeLLM()
+        result, info = eunomia.RetrievalQABypassTokenLimit(
+            "What is the water stability?",
+            make_vectorstore(),
+            k=20,
+            min_k=2,
+            llm=llm,
+            fetch_k=20,
+            token_budget=True,
+            max_context_tokens=4000,
+            completion_tokens=500,
+            return_info=True,
+        )
+        self.assertEqual(result, "fake answer")
+        self.assertEqual(len(llm.prompts), 1)
+        self.assertGreaterEqual(info["k"], 2)
+        self.assertLess(info["k"], 20)
+        self.assertEqual(len(info["chunk_tokens"]), info["k"])
+        self.assertLessEqual(info["total_tokens"], 4000 - 500)
+        self.assertLessEqual(eunomia.count_tokens(llm.prompts[0]), 4000 - 500)
+
+    def test_retry_searches_vectorstore_once(self):
+        vectorstore = make_vectorstore()
+        llm = FakeLLM(responses=[Exception("too long"), Exception("too long"), "ok"])
+        result, info = eunomia.RetrievalQABypassTokenLimit(
+            "What is the water stability?",
+            vectorstore,
+            k=6,
+            min_k=2,
+            llm=llm,
+            fetch_k=20,
+            return_info=True,
+        )
+        self.assertEqual(result, "ok")
+        self.assertEqual(info["k"], 4)
+        self.assertEqual(info["attempts"], 3)
+        self.assertEqual(info["vectorstore_queries"], 1)
+        self.assertEqual(vectorstore.embeddings.query_count, 1)
+        # every retry stuffs a prefix of the same MMR ranking
+        first = [p for p in llm.prompts[0].split("\n\n") if p.startswith("paper")]
+        last = [p for p in llm.prompts[-1].split("\n\n") if p.startswith("paper")]
+        self.assertEqual(len(first), 6)
+        self.assertEqual(last, first[:4])
+
+    def test_vectorstore_queries_are_counted(self):
+        for token_budget in (False, True):
+            for search_type in ("mmr", "similarity"):
+                vectorstore = make_vectorstore()
+                llm = FakeLLM(responses=[Exception("too long"), "ok"])
+                _, info = eunomia.RetrievalQABypassTokenLimit(
+                    "What is the water stability?",
+                    vectorstore,
+                    k=6,
+                    min_k=2,
+                    llm=llm,
+                    search_type=search_type,
+                    fetch_k=20,
+                    token_budget=token_budget,
+                    return_info=True,
+                )
+                self.assertEqual(vectorstore.searches, 1)
+                self.assertEqual(info["vectorstore_queries"], vectorstore.searches)
+
+    def test_token_budget_below_min_k(self):
+        llm = FakeLLM()
+        result, info = eunomia.RetrievalQABypassTokenLimit(
+            "What is the water stability?",
+            make_vectorstore(),
+            k=5,
+            min_k=2,
+            llm=llm,
+            fetch_k=20,
+            token_budget=True,
+            max_context_tokens=1000,
+            completion_tokens=500,
+            return_info=True,
+        )
+        self.assertIsNone(result)
+        self.assertEqual(llm.prompts, [])
+        self.assertLess(info["k"], 2)
+
+
+def openai_error(error_class, status_code, code=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return error_class(
+        f"Error code: {status_code}",
+        response=httpx.Response(status_code, request=request),
+        body={"code": code} if code else None,
+    )
+
+
+class TestRetry(unittest.TestCase):
+    def test_classify_error(self):
+        cases = {
+            eunomia.CONTEXT_LENGTH: openai_error(
+                openai.BadRequestError, 400, "context_length_exceeded"
+            ),
+            eunomia.RATE_LIMIT: openai_error(openai.RateLimitError, 429),
+            eunomia.TRANSIENT: openai_error(openai.InternalServerError, 503),
+            eunomia.FATAL: openai_error(openai.AuthenticationError, 401),
+        }
+        for error_class, error in cases.items():
+            self.assertEqual(eunomia.classify_error(error), error_class)
+        self.assertEqual(
+            eunomia.classify_error(TimeoutError("read timed out")), eunomia.TRANSIENT
+        )
+        self.assertEqual(
+            eunomia.classify_error(ValueError("maximum context length is 8192 tokens")),
+            eunomia.CONTEXT_LENGTH,
+        )
+        self.assertEqual(
+            eunomia.classify_error(Exception("Error code: 429 - slow down")),
+            eunomia.RATE_LIMIT,
+        )
+        self.assertEqual(
+            eunomia.classify_error(Exception("502 Bad Gateway")), eunomia.TRANSIENT
+        )
+        # numbers that merely contain a status code are not HTTP errors
+        for message in ("Invalid value in document 15030", "parse failed at offset 14291"):
+            self.assertEqual(
+                eunomia.classify_error(ValueError(message)), eunomia.UNKNOWN
+            )
+
+    def _run(self, responses, k=6):
+        llm = FakeLLM(responses=responses)
+        result, info = eunomia.RetrievalQABypassTokenLimit(
+            "What is the water stability?",
+            make_vectorstore(),
+            k=k,
+            min_k=2,
+            llm=llm,
+            fetch_k=20,
+            return_info=True,
+            rate_limiter=eunomia.TokenBucket(rate=100, capacity=100),
+            retry_policy=eunomia.RetryPolicy(base_delay=0.0),
+        )
+        return result, info, llm
+
+    def test_rate_limit_and_timeout_keep_k(self):
+        result, info, llm = self._run(
+            [
+                openai_error(openai.RateLimitError, 429),
+                openai.APITimeoutError(request=httpx.Request("POST", "https://x")),
+                "ok",
+            ]
+        )
+        self.assertEqual(result, "ok")
+        self.assertEqual(info["k"], 6)
+        self.assertEqual(info["attempts"], 1)
+        self.assertEqual(len(llm.prompts), 3)
+
+    def test_context_length_reduces_k(self):
+        error = openai_error(openai.BadRequestError, 400, "context_length_exceeded")
+        result, info, llm = self._run([error, error, "ok"])
+        self.assertEqual(result, "ok")
+        self.assertEqual(info["k"], 4)
+
+    def test_fatal_error_is_raised(self):
+        with self.assertRaises(openai.AuthenticationError):
+            self._run([openai_error(openai.AuthenticationError, 401)])
+
+    def test_token_bucket(self):
+        bucket = eunomia.TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""Tests for `eunomia` package."""
+
+import unittest
+
+from langchain_community.llms.fake import FakeListLLM
+
+import eunomia
+
+
+def turn(i):
+    return (
+        {"input": f"Question {i}: is MOF-{i} stable in water? " * 5},
+        {"output": f"Answer {i}: MOF-{i} is stable in water for 7 days. " * 5},
+    )
+
+
+class TestMemory(unittest.TestCase):
+    def _token_growth(self, memory, n_turns=40):
+        counts = []
+        for i in range(n_turns):
+            memory.save_context(*turn(i))
+            history = memory.load_memory_variables({})["chat_history"]
+            counts.append(eunomia.count_tokens(history))
+        return counts
+
+    def test_window_memory(self):
+        memory = eunomia.build_memory("window", max_tokens=500)
+        counts = self._token_growth(memory)
+        self.assertLessEqual(max(counts), 500)
+        # flat once the window is full
+        self.assertLess(max(counts[10:]) - min(counts[10:]), 100)
+        self.assertIn("Question 39", memory.buffer_as_str)
+        self.assertNotIn("Question 0:", memory.buffer_as_str)
+
+        # a single message longer than the cap is truncated
+        memory = eunomia.build_memory("window", max_tokens=50)
+        memory.save_context(*turn(0))
+        self.assertLessEqual(memory.get_num_tokens(), 50)
+        self.assertTrue(memory.buffer_as_str.endswith("7 days. "))
+
+    def test_summary_memory(self):
+        summarizer = FakeListLLM(responses=["The MOFs discussed are stable. " * 200])
+        memory = eunomia.build_memory("summary", max_tokens=500, llm=summarizer)
+        counts = self._token_growth(memory)
+        self.assertLessEqual(max(counts), 500)
+        self.assertLess(max(counts[10:]) - min(counts[10:]), 100)
+        self.assertTrue(memory.moving_summary_buffer)
+
+        with self.assertRaises(ValueError):
+            eunomia.build_memory("summary")
+
+    def test_agent_memory(self):
+        llm = FakeListLLM(responses=["Final Answer: MOF-5 is stable."] * 30)
+        tools = eunomia.EunomiaTools(tool_names=["eval_justification"]).get_tools()
+        agent = eunomia.Eunomia(tools=tools, model=llm, memory_max_tokens=300)
+        counts = []
+        for i in range(30):
+            agent.run(turn(i)[0]["input"])
+            counts.append(agent.memory.get_num_tokens())
+        self.assertLessEqual(max(counts), 300)
+        self.assertLess(max(counts[10:]) - min(counts[10:]), 100)
+
+        self.assertIsNone(eunomia.Eunomia(tools=tools, model=llm, memory="none").memory)
+
+
+if __name__ == "__main__":
+    unittest.main()
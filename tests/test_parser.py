@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+"""Tests for `eunomia` package."""
+
+import gc
+import json
+import unittest
+import weakref
+from typing import List
+
+from langchain_core.language_models.llms import LLM
+
+import eunomia
+
+
+class FixingLLM(LLM):
+    """Fake output fixing LLM that replays a list of responses and counts its calls."""
+
+    responses: List[str]
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fixing"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+class RateLimitedLLM(FixingLLM):
+    """Fake output fixing LLM whose first call hits the rate limit."""
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        if self.calls == 0:
+            self.calls += 1
+            raise Exception("Rate limit reached for gpt-4")
+        return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+
+class CountingTokenBucket(eunomia.TokenBucket):
+    acquired = 0
+
+    def acquire(self):
+        self.acquired += 1
+        super().acquire()
+
+
+class FakeClientPool:
+    def __init__(self, llm):
+        self.llm = llm
+        self.gets = 0
+
+    def get(self, *args, **kwargs):
+        self.gets += 1
+        return self.llm
+
+
+def mofs_json(mofs):
+    return json.dumps(
+        {
+            "MOFs": [
+                {
+                    "name": name,
+                    "stability": stability,
+                    "score": 0.5,
+                    "justification": "Not provided",
+                    "DOI": "Not provided",
+                }
+                for name, stability in mofs.items()
+            ]
+        }
+    )
+
+
+class TestParser(unittest.TestCase):
+    def test_recorded_answers(self):
+        with open("test_files/recorded_answers.json") as f:
+            recorded = json.load(f)
+        llm = FixingLLM(
+            responses=[mofs_json(r["mofs"]) for r in recorded if r["tier"] == "llm"]
+        )
+        tiers = {tier: 0 for tier in eunomia.PARSE_TIERS}
+        for r in recorded:
+            parsed, tier = eunomia.parse_answer(
+                r["answer"], "1", client_pool=FakeClientPool(llm), mof_name=r["mof_name"]
+            )
+            tiers[tier] += 1
+            self.assertEqual(tier, r["tier"], r["answer"])
+            self.assertEqual(
+                {name: mof["Predicted Stability"] for name, mof in parsed.items()},
+                r["mofs"],
+            )
+            for mof in parsed.values():
+                self.assertIsInstance(mof["Score"], float)
+                self.assertLessEqual(mof["Score"], 1)
+                self.assertEqual(mof["Paper id"], "1")
+
+        # the output fixing LLM is only called for the answers that cannot be repaired
+        self.assertEqual(llm.calls, tiers["llm"])
+        self.assertLessEqual(tiers["llm"] / len(recorded), 0.15)
+
+    def test_parse_many(self):
+        with open("test_files/recorded_answers.json") as f:
+            recorded = json.load(f)
+        fixes = [mofs_json(r["mofs"]) for r in recorded if r["tier"] == "llm"]
+        pool = FakeClientPool(FixingLLM(responses=list(fixes)))
+        parser = eunomia.MOFParser(client_pool=pool)
+        self.assertEqual(pool.gets, 0)
+        parsed = parser.parse_many(
+            [r["answer"] for r in recorded], "1", [r["mof_name"] for r in recorded]
+        )
+        # the fixer client is created once and reused for every answer
+        self.assertEqual(pool.gets, 1)
+        self.assertEqual(pool.llm.calls, len(fixes))
+        self.assertEqual([tier for _, tier in parsed], [r["tier"] for r in recorded])
+
+        single_pool = FakeClientPool(FixingLLM(responses=list(fixes)))
+        self.assertEqual(
+            parsed,
+            [
+                eunomia.parse_answer(
+                    r["answer"], "1", client_pool=single_pool, mof_name=r["mof_name"]
+                )
+                for r in recorded
+            ],
+        )
+        self.assertIs(
+            eunomia.get_mof_parser(client_pool=single_pool),
+            eunomia.get_mof_parser(client_pool=single_pool),
+        )
+        # the registry does not keep the pool alive once its parser is released
+        tools = eunomia.EunomiaTools(client_pool=single_pool)
+        self.assertIs(
+            tools.get_parser(),
+            eunomia.get_mof_parser(client_pool=single_pool, rate_limiter=tools.rate_limiter),
+        )
+        pool_ref = weakref.ref(single_pool)
+        del single_pool, tools
+        gc.collect()
+        self.assertIsNone(pool_ref())
+
+        # an invalid JSON answer does not prevent the validation of the others
+        answers = [r["answer"] for r in recorded if r["tier"] == "strict"]
+        answers.insert(1, json.dumps({"MOFs": [{"name": "MOF-5"}]}))
+        failing_parser = eunomia.MOFParser(
+            client_pool=FakeClientPool(FixingLLM(responses=["{}"]))
+        )
+        with self.assertRaises(ValueError):
+            failing_parser.parse_many(answers, ["1", "2", "3", "4"])
+        strict = eunomia.MOFParser._validate_strict(answers)
+        self.assertIsNone(strict[1])
+        self.assertEqual(sum(mof_list is not None for mof_list in strict), 3)
+
+    def test_fixer_is_retried(self):
+        with open("test_files/recorded_answers.json") as f:
+            recorded = json.load(f)
+        record = next(r for r in recorded if r["tier"] == "llm")
+        llm = RateLimitedLLM(responses=[mofs_json(record["mofs"])])
+        rate_limiter = CountingTokenBucket()
+        parser = eunomia.MOFParser(
+            client_pool=FakeClientPool(llm), rate_limiter=rate_limiter
+        )
+        parsed, tier = parser.parse(record["answer"], "1", mof_name=record["mof_name"])
+        self.assertEqual(tier, "llm")
+        self.assertEqual(set(parsed), set(record["mofs"]))
+        # the rate-limited call is retried behind the rate limiter
+        self.assertEqual(llm.calls, 2)
+        self.assertEqual(rate_limiter.acquired, 2)
+
+    def test_incremental_parser(self):
+        with open("test_files/recorded_answers.json") as f:
+            recorded = json.load(f)
+        answer = recorded[0]["answer"]
+        parser = eunomia.IncrementalMOFParser("1")
+        emitted = []
+        # replay the answer as a stream of small tokens
+        for i in range(0, len(answer), 3):
+            for name, record in parser.feed(answer[i : i + 3]):
+                emitted.append((name, i + 3))
+        self.assertEqual([name for name, _ in emitted], ["MOF-5", "ZIF-8"])
+        # each record is emitted as soon as its object is closed
+        for name, position in emitted:
+            end = answer.index("}", answer.index(f'"{name}"')) + 1
+            self.assertLess(position - 3, end)
+            self.assertGreaterEqual(position, end)
+        self.assertEqual(parser.close(), [])
+        self.assertEqual(parser.tier, "strict")
+        self.assertEqual(parser.records, eunomia.parse_to_dict(answer, "1"))
+
+        # braces and quotes in strings and in the text around the JSON are ignored
+        parser = eunomia.IncrementalMOFParser("1")
+        text = 'Here\'s the list {of} MOFs: ```json\n{"MOFs": [{"name": "MOF-{5}\\"", '
+        self.assertEqual(parser.feed(text), [])
+        (name, record), = parser.feed(
+            '"stability": "Stable", "score": "0.8", "justification": "}]", "DOI": "x"}, {"na'
+        )
+        self.assertEqual(name, 'MOF-{5}"')
+        self.assertEqual(record["Score"], 0.8)
+        self.assertEqual(record["Justification"], "}]")
+        self.assertEqual(parser.feed('me": "ZIF-8"'), [])
+        self.assertEqual(len(parser.records), 1)
+
+        # answers in the numbered layout are only parsed when complete
+        parser = eunomia.IncrementalMOFParser("1")
+        answer = next(r["answer"] for r in recorded if r["answer"].startswith("MOF-5:"))
+        self.assertEqual(parser.feed(answer), [])
+        self.assertEqual([name for name, _ in parser.close()], ["MOF-5", "IRMOF-3"])
+        self.assertEqual(parser.tier, "repair")
+
+    def test_repair_answer(self):
+        answer = """Here is the answer:
+        ```json
+        {"MOFs": [{"name": "MOF-5", "water stability": "Unstable", "probability score": "90%",
+                   "sentences": ["MOF-5 decomposes.", "It loses crystallinity."],},]}
+        ```
+        DOI: 10.1021/ja0570428."""
+        self.assertEqual(
+            eunomia.repair_answer(answer),
+            [
+                {
+                    "name": "MOF-5",
+                    "stability": "Unstable",
+                    "score": 0.9,
+                    "justification": "MOF-5 decomposes. It loses crystallinity.",
+                    "DOI": "10.1021/ja0570428",
+                }
+            ],
+        )
+
+        answer = "1. Water stability: Stable\n2. Probability score: 0.8\n3. Sentences: Not provided"
+        self.assertIsNone(eunomia.repair_answer(answer))
+        self.assertEqual(eunomia.repair_answer(answer, mof_name="ZIF-8")[0]["name"], "ZIF-8")
+        self.assertIsNone(eunomia.repair_answer("1. Water stability: Stable", mof_name="ZIF-8"))
+
+        # numeric scores are normalized like strings, and booleans are not scores
+        def scored(score):
+            return json.dumps({"name": "MOF-5", "stability": "Stable", "Probability score": score})
+
+        for score, expected in (("85", 0.85), (85, 0.85), (0.7, 0.7), ("90%", 0.9), (1, 1.0)):
+            self.assertEqual(eunomia.repair_answer(scored(score))[0]["score"], expected)
+        for score in (True, 150, -0.5):
+            self.assertIsNone(eunomia.repair_answer(scored(score)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,105 @@
 
 """Tests for `eunomia` package."""
 
+import json
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_community.embeddings import DeterministicFakeEmbedding, FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
 
 import eunomia
 import os
+from eunomia.eunomia import _retrieve_documents, _retrieve_many
+
+
+class EchoLLM(LLM):
+    """Fake LLM that answers with the prompt it received."""
+
+    model_name: str = "gpt-4"
+
+    @property
+    def _llm_type(self):
+        return "echo"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return prompt
+
+
+def mofs_json(*mofs):
+    return json.dumps(
+        {
+            "MOFs": [
+                {
+                    "name": name,
+                    "stability": stability,
+                    "score": score,
+                    "justification": justification,
+                    "DOI": "10.1000/test",
+                }
+                for name, stability, score, justification in mofs
+            ]
+        }
+    )
+
+
+class RoutingLLM(LLM):
+    """Fake LLM that answers with the response of the first route found in the prompt."""
+
+    routes: Dict[str, str]
+    model_name: str = "gpt-4"
+
+    @property
+    def _llm_type(self):
+        return "routing"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        responses = [response for route, response in self.routes.items() if route in prompt]
+        if not responses:
+            raise ValueError("Unexpected prompt")
+        if len(responses) == 1:
+            return responses[0]
+        # batched prompts are answered with the MOFs of all their routes
+        return json.dumps(
+            {"MOFs": [mof for response in responses for mof in json.loads(response)["MOFs"]]}
+        )
+
+
+class StreamingRoutingLLM(RoutingLLM):
+    """Routing LLM that streams its responses in small tokens and logs its calls and tokens."""
+
+    events: List[str] = []
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        response = super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        self.events.append(f"call {response[:40]}")
+        return response
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        response = super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        for i in range(0, len(response), 4):
+            self.events.append("token")
+            yield GenerationChunk(text=response[i : i + 4])
+
+
+READ_DOC_ANSWER = mofs_json(
+    ("MOF-5", "Unstable", 0.9, "MOF-5 decomposes in water."),
+    ("ZIF-8", "Not provided", 0.2, "Not provided"),
+)
+PIPELINE_ROUTES = {
+    "Report Paper's DOI": READ_DOC_ANSWER,
+    '"name": "MOF-5"': mofs_json(
+        ("MOF-5", "Unstable", 0.8, "MOF-5 decomposes in water.")
+    ),
+    '"name": "ZIF-8"': mofs_json(("ZIF-8", "Not provided", 0.1, "Not provided")),
+    "water stability properties of ZIF-8": mofs_json(
+        ("ZIF-8", "Stable", 0.7, "ZIF-8 retains its crystallinity in boiling water.")
+    ),
+}
 
 
 class TestTools(unittest.TestCase):
@@ -27,6 +122,194 @@ class TestTools(unittest.TestCase):
         ).get_tools()
         return eunomia.Eunomia(tools=tools, model="gpt-4", get_cost=True)
 
+    def test_tools_bound_to_own_vectorstore(self):
+        n_papers = 8
+        tools = [
+            eunomia.EunomiaTools(
+                tool_names=["read_doc", "recheck_justification"],
+                vectorstore=FAISS.from_texts(
+                    [f"paper-{i} chunk-{j}" for j in range(10)],
+                    FakeEmbeddings(size=16),
+                ),
+                llm=EchoLLM(),
+            ).get_tools()
+            for i in range(n_papers)
+        ]
+
+        def run(i):
+            read_doc, recheck_justification = tools[i]
+            return read_doc.func("prompt") + recheck_justification.func("MOF-5")
+
+        with ThreadPoolExecutor(n_papers) as pool:
+            answers = list(pool.map(run, list(range(n_papers)) * 4))
+        for i, answer in enumerate(answers):
+            paper = i % n_papers
+            self.assertIn(f"paper-{paper} ", answer)
+            for other in range(n_papers):
+                if other != paper:
+                    self.assertNotIn(f"paper-{other} ", answer)
+
+    def test_pipeline(self):
+        tools = eunomia.EunomiaTools(
+            vectorstore=FAISS.from_texts(
+                [f"chunk-{j}" for j in range(10)], FakeEmbeddings(size=16)
+            ),
+            llm=RoutingLLM(routes=PIPELINE_ROUTES),
+            paper_id="1",
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pipeline = eunomia.EunomiaPipeline(
+                tools, dataset_path=f"{tmp_dir}/dataset.csv"
+            )
+            answer = pipeline.run("Find the water stability of the MOFs")
+            with open(f"{tmp_dir}/dataset.csv") as f:
+                self.assertEqual(len(f.readlines()), 3)
+
+        self.assertEqual(
+            pipeline.call_counts,
+            {
+                "read_doc": 1,
+                "parse": 0,
+                "eval_justification": 1,
+                "recheck_justification": 1,
+                "create_dataset": 0,
+            },
+        )
+        self.assertEqual(pipeline.records["MOF-5"]["Score"], 0.8)
+        self.assertEqual(pipeline.records["ZIF-8"]["Predicted Stability"], "Stable")
+        self.assertEqual(pipeline.records["ZIF-8"]["Paper id"], "1")
+        self.assertEqual(eunomia.parse_to_dict(answer, "1"), pipeline.records)
+
+    def test_pipeline_stream(self):
+        llm = StreamingRoutingLLM(routes=PIPELINE_ROUTES, events=[])
+        tools = eunomia.EunomiaTools(
+            vectorstore=FAISS.from_texts(
+                [f"chunk-{j}" for j in range(10)], FakeEmbeddings(size=16)
+            ),
+            llm=llm,
+            paper_id="1",
+        )
+        pipeline = eunomia.EunomiaPipeline(tools, dataset_path=None)
+        answer = pipeline.run("Find the water stability of the MOFs", stream=True)
+
+        # the justification of MOF-5 is checked before the end of the read_doc answer
+        first_check = llm.events.index(next(e for e in llm.events if e.startswith("call")))
+        self.assertIn('"name": "MOF-5"', llm.events[first_check])
+        self.assertIn("token", llm.events[first_check + 1 :])
+        self.assertEqual(
+            pipeline.call_counts,
+            {
+                "read_doc": 1,
+                "parse": 0,
+                "eval_justification": 2,
+                "recheck_justification": 1,
+                "create_dataset": 0,
+            },
+        )
+        self.assertEqual(pipeline.parse_tiers["strict"], 4)
+        self.assertEqual(pipeline.records["MOF-5"]["Score"], 0.8)
+        self.assertEqual(pipeline.records["ZIF-8"]["Predicted Stability"], "Stable")
+
+        batch_pipeline = eunomia.EunomiaPipeline(tools, dataset_path=None)
+        self.assertEqual(batch_pipeline.run("Find the water stability of the MOFs"), answer)
+        self.assertEqual(batch_pipeline.records, pipeline.records)
+
+    def test_eval_justifications(self):
+        names = [f"MOF-{i}" for i in range(6)]
+        routes = {
+            f'"name": "{name}"': mofs_json((name, "Stable", 0.4, f"{name} is stable in water."))
+            for name in names
+        }
+        tools = eunomia.EunomiaTools(llm=RoutingLLM(routes=routes), paper_id="1")
+        records = [
+            {"name": name, "stability": "Stable", "score": 0.9, "justification": "Not provided"}
+            for name in names
+        ]
+
+        with eunomia.count_llm_calls() as counter:
+            verdicts = tools.eval_justifications(records)
+        self.assertEqual(counter.calls, 1)
+
+        # the single-item path gives the same verdicts
+        single = {}
+        for record in records:
+            parsed = eunomia.parse_to_dict(
+                tools.eval_justification(json.dumps(record)), "1", mof_name=record["name"]
+            )
+            single.update(eunomia.EunomiaTools.match_verdicts([record], parsed))
+        self.assertEqual(verdicts, single)
+        self.assertEqual(verdicts["MOF-3"]["Score"], 0.4)
+
+        # records are split by token budget, and a single record uses the single-item prompt
+        batches = tools.batch_justifications(records, token_budget=70)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2])
+        self.assertEqual(tools.batch_justifications(records, token_budget=1), [[r] for r in records])
+        with eunomia.count_llm_calls() as counter:
+            self.assertEqual(tools.eval_justifications(records, token_budget=70), single)
+            self.assertEqual(tools.eval_justifications(records, token_budget=1), single)
+        self.assertEqual(counter.calls, 3 + 6)
+
+    def test_recheck_justifications(self):
+        names = [f"MOF-{i}" for i in range(4)]
+        vectorstore = FAISS.from_texts(
+            [
+                f"chunk {j} about the water stability of MOF-{j % 4} in boiling water"
+                for j in range(12)
+            ],
+            DeterministicFakeEmbedding(size=32),
+        )
+        routes = {"following MOFs": mofs_json(*[(name, "Stable", 0.6, "x") for name in names])}
+        for name in names:
+            routes[f"water stability properties of {name}."] = mofs_json(
+                (name, "Unstable", 0.7, "y")
+            )
+        tools = eunomia.EunomiaTools(
+            vectorstore=vectorstore, llm=RoutingLLM(routes=routes), paper_id="1"
+        )
+
+        rechecks, info = tools.recheck_justifications(names, return_info=True)
+        self.assertEqual([batch_names for batch_names, _ in rechecks], [names])
+        # the queries of the 4 names are embedded in one request, checked with one more
+        self.assertEqual(info["vectorstore_queries"], 2)
+        self.assertEqual(info["llm_calls"], 1)
+        self.assertEqual(info["retrieved_documents"], 4 * tools.recheck_k)
+        self.assertEqual(info["batches"][0]["k"] + info["duplicate_documents"], 24)
+        self.assertEqual(set(eunomia.parse_to_dict(rechecks[0][1], "1")), set(names))
+
+        # a smaller context window splits the names, and a single name is asked as before
+        rechecks, info = tools.recheck_justifications(
+            names, max_context_tokens=1560, return_info=True
+        )
+        self.assertEqual(
+            [batch_names for batch_names, _ in rechecks], [names[:2], names[2:]]
+        )
+        self.assertEqual(info["llm_calls"], 2)
+        self.assertEqual([batch["llm_calls"] for batch in info["batches"]], [1, 1])
+        (_, answer), = tools.recheck_justifications(["MOF-3"])
+        self.assertEqual(answer, tools.recheck_justification("MOF-3"))
+
+        # the shared retrieval gives the rankings of the retriever
+        queries = [tools._recheck_prompt(name) for name in names]
+        for search_type in ("mmr", "similarity"):
+            for embedding in (DeterministicFakeEmbedding(size=32), FakeEmbeddings(size=32)):
+                vectorstore.embedding_function = embedding
+                info = {"vectorstore_queries": 0}
+                rankings = _retrieve_many(
+                    queries, vectorstore, 6, search_type, 50, info
+                )
+                if isinstance(embedding, FakeEmbeddings):
+                    # random vectors differ for the same query, so every query is searched
+                    self.assertEqual(info["vectorstore_queries"], 2 + 3)
+                    continue
+                self.assertEqual(info["vectorstore_queries"], 2)
+                self.assertEqual(
+                    rankings,
+                    [
+                        _retrieve_documents(query, vectorstore, 6, search_type, 50)
+                        for query in queries
+                    ],
+                )
+
 
 if __name__ == "__main__":
     unittest.main()